@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк агрегации MainPurch при заказе: полная переагрегация и инкрементальное вливание по ключу.
+
+Запуск:
+    python backend/benchmarks/bench_aggregation.py --rows 200000 --items 10
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from modules.aggregation import MAIN_PURCH_SPEC, OTHER_PURCH_SPEC
+from modules.purch_index import OwnerIndex
+
+
+def make_purchases(rows, users, products, seed=42):
+    """Синтетические покупки: семьи по 4 пользователя, даты за последний год"""
+    rng = np.random.default_rng(seed)
+    user = rng.integers(0, users, rows)
+    return pd.DataFrame({
+        'ProdID': rng.integers(1, products, rows),
+        'Name': 'Товар',
+        'Volume': 1.0,
+        'Unit': 'шт',
+        'VolumeGr': 500.0,
+        'Tag': 'Тег',
+        'Cat': 'Категория',
+        'Store': 'Лавка',
+        'StoreID': rng.integers(1, 4, rows),
+        'Date': (1.7e9 + rng.integers(0, 365, rows) * 86400).astype(np.int64),
+        'FamilyID': user // 4,
+        'TotalCost': 99.9,
+        'UserID': user.astype(str),
+        'Count': rng.integers(1, 4, rows),
+        'TotalVolume': rng.uniform(0, 3, rows),
+        'TotalVolumeGr': rng.uniform(0, 1500, rows),
+        'TotalCostPerCount': rng.uniform(0, 300, rows)
+    })
+
+
+def legacy_merge(existing, new_df, key):
+    """Прежний путь заказа: concat всей таблицы с новыми строками и полный groupby"""
+    combined = pd.concat([existing, new_df], ignore_index=True)
+    for column in ('Count', 'TotalVolume', 'TotalVolumeGr', 'TotalCostPerCount'):
+        combined[column] = combined[column].fillna(0)
+    combined['UserID'] = combined['UserID'].fillna('')
+    agg = {column: 'sum' if column in ('Count', 'TotalVolume', 'TotalVolumeGr', 'TotalCostPerCount')
+           else 'min' if column == 'Date' else 'first'
+           for column in combined.columns if column not in key}
+    return combined.groupby(list(key)).agg(agg).reset_index()
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--products', type=int, default=2_000)
+    parser.add_argument('--items', type=int, default=10, help='товаров в заказе')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for spec in (MAIN_PURCH_SPEC, OTHER_PURCH_SPEC):
+        table = spec.rebuild(make_purchases(args.rows, args.users, args.products))
+        index = OwnerIndex.build(table)
+        # Заказ одного пользователя: половина товаров уже есть в его холодильнике
+        owner = table.iloc[index.user_rows(table['UserID'].iloc[0], int(table['FamilyID'].iloc[0]))]
+        order = make_purchases(args.items, 1, args.products, seed=7)
+        order['UserID'], order['FamilyID'] = owner['UserID'].iloc[0], owner['FamilyID'].iloc[0]
+        known = owner.head(args.items // 2)
+        order.loc[:len(known) - 1, spec.key] = known[list(spec.key)].to_numpy()
+        print(f"📊 {spec.table}: {len(table)} строк, заказ из {args.items} товаров")
+
+        cases = [
+            ("concat + groupby (было)", lambda: legacy_merge(table, order, spec.key)),
+            ("TableSpec.rebuild", lambda: spec.rebuild(pd.concat([table, order], ignore_index=True))),
+            ("TableSpec.merge (upsert)", lambda: spec.merge(table, index, order)[0]),
+        ]
+        baseline = None
+        for title, func in cases:
+            elapsed, result = measure(func, args.repeat)
+            baseline = baseline or elapsed
+            print(f"   {title:<28} {elapsed * 1000:10.2f} мс  x{baseline / elapsed:8.1f}  ({len(result)} строк)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк смешанной нагрузки: WSGI (общий пул потоков) против ASGI (отдельный пул для легких запросов).
+
+Одновременно приходят тяжелые запросы статистики (/get_allpurch_by_daterange по большой AllPurch)
+и легкие (/product_link, /image). Число потоков в обоих вариантах одинаковое.
+
+Запуск:
+    python backend/benchmarks/bench_asgi.py --rows 200000 --threads 4 --heavy 24 --light 48
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import numpy as np
+import pandas as pd
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from modules import api_routes, images_handler
+from modules.database_handler import DatabaseHandler
+from modules.server_order_creator import ServerOrderCreator
+from modules.server_ration_handler import ServerRationHandler
+from modules.asgi_bridge import AsgiBridge, build_environ, call_wsgi
+
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database')
+USER_ID = 'bench-user'
+
+
+def make_app(root, rows, days):
+    """Копия базы во временной папке (sqlite) с синтетической AllPurch пользователя за days дней"""
+    shutil.copytree(DATABASE_DIR, os.path.join(root, 'database'))
+    orders_dir = os.path.join(root, 'database', 'orders')
+    products_dir = os.path.join(root, 'database', 'products')
+    db = DatabaseHandler(orders_dir, os.path.join(root, 'database', 'users'), products_dir,
+                         storage_engine='sqlite', sqlite_path=os.path.join(root, 'portion.sqlite3'))
+
+    template = db.read_table('allpurch')
+    rng = np.random.default_rng(42)
+    df = template.iloc[rng.integers(0, len(template), rows)].reset_index(drop=True)
+    end = datetime.now().timestamp()
+    df['Date'] = rng.uniform(end - days * 86400, end, rows).round().astype('int64')
+    df['UserID'] = USER_ID
+    df['FamilyID'] = 0
+    db.storage.write('allpurch', df)
+
+    app = Flask(__name__)
+    images_dir = os.path.join(products_dir, 'images')
+    images_handler.init_images(images_dir)
+    api_routes.register_routes(app, db, images_dir, None, None, ServerOrderCreator(db), ServerRationHandler(db))
+    return app
+
+
+def make_requests(heavy, light, days, seed=7):
+    start = (datetime.now() - timedelta(days=days)).strftime("%d.%m.%Y")
+    end = datetime.now().strftime("%d.%m.%Y")
+    statistics = json.dumps({'start_date': start, 'end_date': end, 'user_id': USER_ID,
+                             'family_id': '0', 'user_acc_type': 0}).encode('utf-8')
+    requests = [('heavy', 'POST', '/get_allpurch_by_daterange', statistics)] * heavy
+    requests += [('light', 'GET', path, b'') for path in ('/product_link/101', '/image/101') * (light // 2)]
+    random.Random(seed).shuffle(requests)
+    return requests
+
+
+def scope_for(method, path):
+    return {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+            'headers': [(b'content-type', b'application/json')], 'server': ('bench', 80)}
+
+
+def run_wsgi(app, requests, threads):
+    """Потоковый WSGI сервер: все запросы в одной очереди пула"""
+    started = time.perf_counter()
+
+    def handle(method, path, body):
+        status = call_wsgi(app, build_environ(scope_for(method, path), body))[0]
+        return status, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [(kind, pool.submit(handle, method, path, body)) for kind, method, path, body in requests]
+        results = [(kind,) + future.result() for kind, future in futures]
+    return results, time.perf_counter() - started
+
+
+def run_asgi(app, requests, threads, light_threads):
+    """ASGI мост: тот же общий бюджет потоков, легкие запросы в своем пуле"""
+    bridge = AsgiBridge(app, workers=threads - light_threads, light_workers=light_threads)
+
+    async def handle(method, path, body, started):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await bridge(scope_for(method, path), receive, send)
+        return sent[0]['status'], time.perf_counter() - started
+
+    async def burst():
+        started = time.perf_counter()
+        results = await asyncio.gather(*[handle(method, path, body, started) for _, method, path, body in requests])
+        return [(kind,) + result for (kind, _, _, _), result in zip(requests, results)], time.perf_counter() - started
+
+    results, elapsed = asyncio.run(burst())
+    for lane in bridge.lanes.values():
+        lane.executor.shutdown()
+    return results, elapsed
+
+
+def report(title, results, elapsed):
+    print(f"   {title} (всего {elapsed * 1000:.0f} мс, {len(results) / elapsed:.1f} запр/с)")
+    for kind in ('heavy', 'light'):
+        latencies = np.array([latency for k, status, latency in results if k == kind]) * 1000
+        errors = sum(1 for k, status, _ in results if k == kind and status != 200)
+        print(f"      {kind:<6} p50 {np.percentile(latencies, 50):8.1f} мс   p95 {np.percentile(latencies, 95):8.1f} мс"
+              f"   max {latencies.max():8.1f} мс   ошибок {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--threads', type=int, default=4, help="Потоков на процесс в обоих вариантах")
+    parser.add_argument('--light-threads', type=int, default=1, help="Из них - для легких запросов (ASGI)")
+    parser.add_argument('--heavy', type=int, default=24)
+    parser.add_argument('--light', type=int, default=48)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='portion-bench-')
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            app = make_app(root, args.rows, args.days)
+        requests = make_requests(args.heavy, args.light, args.days)
+        print(f"📊 AllPurch {args.rows} строк; {args.heavy} тяжелых + {args.light} легких запросов одновременно, "
+              f"{args.threads} потоков")
+
+        # Обработчики печатают отладку - на время замеров вывод отключен
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_wsgi(app, requests[:args.threads], args.threads)
+            wsgi = run_wsgi(app, requests, args.threads)
+            asgi = run_asgi(app, requests, args.threads, args.light_threads)
+        report(f"WSGI, общий пул {args.threads}", *wsgi)
+        report(f"ASGI, пулы {args.threads - args.light_threads} + {args.light_threads}", *asgi)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
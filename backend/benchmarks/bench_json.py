@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк JSON ответа AllPurch: стандартный json / orjson, список кортежей / ответ по колонкам.
+
+Запуск:
+    python backend/benchmarks/bench_json.py --rows 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from modules import serializers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def make_allpurch(rows, days=365, seed=42):
+    """Синтетическая AllPurch одного пользователя за days дней"""
+    rng = np.random.default_rng(seed)
+    end = datetime.now().timestamp()
+    names = np.array([f"Продукция {i}" for i in range(500)], dtype=object)
+    prod_ids = rng.integers(0, 500, rows)
+    return pd.DataFrame({
+        'ProdID': prod_ids + 100,
+        'Name': names[prod_ids],
+        'Volume': rng.integers(1, 5, rows),
+        'Unit': 'шт',
+        'VolumeGr': rng.integers(100, 2000, rows),
+        'Kcal100g': rng.uniform(10, 600, rows).round(1),
+        'Prot100g': rng.uniform(0, 30, rows).round(1),
+        'Fat100g': rng.uniform(0, 30, rows).round(1),
+        'Carb100g': rng.uniform(0, 60, rows).round(1),
+        'ExpireDate': np.where(rng.random(rows) < 0.5, np.nan, end + rng.uniform(0, 30 * 86400, rows).round()),
+        'Tag': 'Легко',
+        'Cat': 'Продукты',
+        'Store': 'Основной',
+        'StoreID': rng.integers(1, 4, rows),
+        'Date': rng.uniform(end - days * 86400, end, rows).round(),
+        'TotalCostPerCount': rng.uniform(50, 1500, rows).round(2),
+        'TotalCost': rng.uniform(50, 1500, rows).round(2),
+        'Address': 'Адрес 1',
+        'AddressID': 1
+    })
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_allpurch(args.rows)
+    print(f"📊 AllPurch {args.rows} строк")
+
+    # Как DefaultJSONProvider Flask: ensure_ascii, sort_keys, компактные разделители
+    def stdlib(obj):
+        return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    encoders = [("json", stdlib, json.loads)]
+    if orjson is not None:
+        encoders.append(("orjson", lambda obj: orjson.dumps(obj, option=orjson.OPT_SORT_KEYS), orjson.loads))
+    else:
+        print("   orjson не установлен - только стандартный json")
+
+    shapes = [
+        ("кортежи", lambda: {"purchases": serializers.allpurch_tuples(df), "count": len(df)}),
+        ("колонки", lambda: {"purchases": serializers.columnar(serializers.allpurch_columns(df)), "count": len(df),
+                             "format": "columnar"}),
+    ]
+    baseline = None
+    for shape_title, build in shapes:
+        build_time, payload = measure(build, args.repeat)
+        print(f"   {shape_title}: сборка {build_time * 1000:.1f} мс")
+        for title, dumps, loads in encoders:
+            encode_time, body = measure(lambda: dumps(payload), args.repeat)
+            decode_time, _ = measure(lambda: loads(body), args.repeat)
+            total = build_time + encode_time
+            baseline = baseline or total
+            print(f"      {title:<7} кодирование {encode_time * 1000:8.1f} мс   разбор {decode_time * 1000:8.1f} мс"
+                  f"   {len(body) / 1024 / 1024:6.2f} МБ   сборка+кодирование x{baseline / total:5.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк выборки рациона за день / период: построчный apply, векторный фильтр, индекс timestamp.
+
+Запуск:
+    python backend/benchmarks/bench_timestamp_index.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from modules.storage_engines import filter_range
+from modules.timestamp_index import TimestampIndex
+
+
+def make_rations(rows, users, days, seed=42):
+    """Синтетический RationInfo: записи равномерно за days дней до сегодняшнего"""
+    rng = np.random.default_rng(seed)
+    end = datetime.now().timestamp()
+    return pd.DataFrame({
+        'RationDate': rng.uniform(end - days * 86400, end, rows).round(),
+        'UserID': rng.integers(0, users, rows).astype(str),
+        'ProdID': rng.integers(1, 500, rows),
+        'KcalServ': rng.uniform(0, 800, rows).round(1)
+    })
+
+
+def apply_same_day(df, day_timestamp):
+    """Исходная реализация get_ration_by_date: два datetime.fromtimestamp на строку"""
+    def is_same_date(timestamp1, timestamp2):
+        if pd.isna(timestamp1) or timestamp1 == '':
+            return False
+        return datetime.fromtimestamp(float(timestamp1)).date() == datetime.fromtimestamp(float(timestamp2)).date()
+    return df[df['RationDate'].apply(lambda x: is_same_date(x, day_timestamp))]
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_rations(args.rows, args.users, args.days)
+    day = (datetime.now() - timedelta(days=args.days // 2)).date()
+    day_start = datetime.combine(day, datetime.min.time()).timestamp()
+    day_end = (datetime.combine(day, datetime.min.time()) + timedelta(days=1)).timestamp()
+    range_start = day_start - 30 * 86400
+    user_id = '7'
+    print(f"📊 {args.rows} строк, {args.users} пользователей, {args.days} дней; день {day:%d.%m.%Y}")
+
+    build_time, index = measure(lambda: TimestampIndex.build(df, 'RationDate'), 1)
+    print(f"   Построение индекса: {build_time * 1000:.1f} мс (один раз на версию таблицы)")
+
+    cases = [
+        ("День, apply (было)", lambda: apply_same_day(df, day_start), 1),
+        ("День, векторный фильтр", lambda: filter_range(df, 'RationDate', day_start, day_end, 'left'), args.repeat),
+        ("День, индекс (ключ дня)", lambda: df.iloc[index.day_rows(day)], args.repeat),
+        ("День + UserID, фильтр", lambda: (lambda r: r[r['UserID'] == user_id])(
+            filter_range(df, 'RationDate', day_start, day_end, 'left')), args.repeat),
+        ("День + UserID, индекс", lambda: df.iloc[index.day_rows(day, user_id)], args.repeat),
+        ("30 дней, векторный фильтр", lambda: filter_range(df, 'RationDate', range_start, day_end, 'left'), args.repeat),
+        ("30 дней, индекс", lambda: df.iloc[index.range_rows(range_start, day_end, 'left')], args.repeat),
+        ("30 дней + UserID, индекс", lambda: df.iloc[index.range_rows(range_start, day_end, 'left', user_id)], args.repeat),
+    ]
+    baseline = None
+    for title, func, repeat in cases:
+        elapsed, result = measure(func, repeat)
+        baseline = baseline or elapsed
+        print(f"   {title:<28} {elapsed * 1000:10.2f} мс  x{baseline / elapsed:8.1f}  ({len(result)} строк)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+ASGI вариант сервера: те же маршруты (register_routes), обработчики выполняются в пулах потоков.
+
+Запуск:
+    uvicorn asgi:application --host 0.0.0.0 --port 8000 --workers 2
+    python serve.py --server uvicorn
+
+PORTION_ASGI_THREADS - потоков для тяжелых запросов, PORTION_ASGI_LIGHT_THREADS - для легких
+(картинки, ссылки на товары, служебные), на процесс.
+"""
+
+import os
+
+from main_server import app, db_handler
+from modules.asgi_bridge import AsgiBridge
+
+ASGI_THREADS = int(os.environ.get('PORTION_ASGI_THREADS', 8))
+ASGI_LIGHT_THREADS = int(os.environ.get('PORTION_ASGI_LIGHT_THREADS', 2))
+
+db_handler.warm_up()
+
+# Остановка воркера (в том числе перезапуск по --max-requests) не переписывает таблицы:
+# журналы на диске вливают компактор и flusher остальных воркеров или следующего запуска
+application = AsgiBridge(app, workers=ASGI_THREADS, light_workers=ASGI_LIGHT_THREADS,
+                         on_shutdown=db_handler.stop)
@@ -0,0 +1,120 @@
+"""
+Конфигурация сервера и служебных утилит из переменных окружения PORTION_*.
+
+main_server и db_tools создают обработчик базы данных и ленту изменений отсюда - с одними
+и теми же настройками хранилища, журналов, полос блокировок и ленты.
+"""
+
+import os
+
+from modules.database_handler import DatabaseHandler
+from modules.change_feed import ChangeFeed
+
+# ==================== КОНФИГУРАЦИЯ ПУТЕЙ ====================
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_ROOT = PROJECT_ROOT
+
+# Основные директории
+ORDERS_DIR = os.path.join(APP_ROOT, 'database/orders')
+USERS_DIR = os.path.join(APP_ROOT, 'database/users')
+PRODUCTS_DIR = os.path.join(APP_ROOT, 'database/products')
+
+# Файлы
+MAIN_PURCH_PATH = os.path.join(ORDERS_DIR, 'mainpurch.xlsx')
+OTHER_PURCH_PATH = os.path.join(ORDERS_DIR, 'otherpurch.xlsx')
+ALL_PURCH_PATH = os.path.join(ORDERS_DIR, 'allpurch.xlsx')
+RATION_INFO_PATH = os.path.join(USERS_DIR, 'rationinfo.xlsx')
+PRODUCTS_DB_PATH = os.path.join(PRODUCTS_DIR, 'appdb2.xlsx')
+IMAGES_DIR = os.path.join(PRODUCTS_DIR, 'images')
+PRODLINKS_PATH = os.path.join(PRODUCTS_DIR, 'prodlinks.xlsx')
+
+# ==================== КОНФИГУРАЦИЯ ХРАНИЛИЩА ====================
+
+# Движок хранения: 'excel' (legacy, по умолчанию), 'sqlite', 'parquet' или 'arrow'
+# (parquet/arrow при первом запуске конвертируют существующие .xlsx, выгрузка обратно - db_tools.py export;
+#  arrow читает диапазоны дат через memory map без загрузки таблицы целиком)
+STORAGE_ENGINE = os.environ.get('PORTION_STORAGE_ENGINE', 'excel')
+SQLITE_DB_PATH = os.environ.get('PORTION_SQLITE_PATH', os.path.join(APP_ROOT, 'database/portion.sqlite3'))
+
+# Журнал вставок для AllPurch/RationInfo (вставка O(1), фоновое уплотнение)
+JOURNAL_ENABLED = os.environ.get('PORTION_JOURNAL', '0') == '1'
+JOURNAL_OPTIONS = {
+    'max_bytes': int(os.environ.get('PORTION_JOURNAL_MAX_BYTES', 256 * 1024)),
+    'max_age_seconds': float(os.environ.get('PORTION_JOURNAL_MAX_AGE', 60)),
+    'fsync': os.environ.get('PORTION_JOURNAL_FSYNC', '1') == '1'
+}
+
+# Помесячные партиции AllPurch/RationInfo (orders/allpurch/2026-10.*): вставка трогает только
+# текущий месяц, выборка по датам - только нужные месяцы. Исходный файл остается архивом.
+PARTITIONS_ENABLED = os.environ.get('PORTION_PARTITIONS', '0') == '1'
+
+# Group commit: вставки в AllPurch/RationInfo, пришедшие в течение окна (мс), пишутся одной
+# физической записью (например, PORTION_GROUP_COMMIT_MS=20). 0 - каждая вставка пишется сразу.
+GROUP_COMMIT_MS = float(os.environ.get('PORTION_GROUP_COMMIT_MS', 0))
+
+# Отложенная запись обновлений объема MainPurch/OtherPurch (/update_main_purch, /update_other_purch):
+# обновление сразу видно при чтении и сохраняется в журнал повтора, таблица перезаписывается
+# пачкой - при накоплении обновлений или по времени
+WRITE_BEHIND_ENABLED = os.environ.get('PORTION_WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_OPTIONS = {
+    'max_dirty': int(os.environ.get('PORTION_WRITE_BEHIND_MAX_DIRTY', 50)),
+    'max_age_seconds': float(os.environ.get('PORTION_WRITE_BEHIND_INTERVAL', 5)),
+    'fsync': os.environ.get('PORTION_WRITE_BEHIND_FSYNC', '1') == '1'
+}
+
+# Обслуживание MainPurch/OtherPurch: раз в интервал (секунды) измененные таблицы переписываются
+# в канонической форме (дубли агрегированы, нулевые строки удалены). 0 - выключено.
+VACUUM_INTERVAL = float(os.environ.get('PORTION_VACUUM_INTERVAL', 0))
+
+# Полосы блокировок по владельцу (семья или личный аккаунт): заказы и обновления объема
+# разных семей пишутся параллельно. Число полос на таблицу, 0 - выключено. Только для sqlite.
+LOCK_STRIPES = int(os.environ.get('PORTION_LOCK_STRIPES', 0))
+
+# Кодирование JSON ответов: 'orjson' (быстрее, numpy без преобразования), 'stdlib' или
+# 'auto' - orjson, если он установлен
+JSON_ENCODER = os.environ.get('PORTION_JSON', 'auto')
+
+# ETag для чтения MainPurch/OtherPurch/RationInfo/AllPurch: запрос с If-None-Match и тегом,
+# совпадающим с версией таблицы, получает 304 без чтения и сериализации. 0 - выключено.
+ETAGS_ENABLED = os.environ.get('PORTION_ETAGS', '1') == '1'
+
+# Ключи идемпотентности для /create_order и /add_to_ration (заголовок Idempotency-Key):
+# повтор запроса возвращает сохраненный ответ. TTL в секундах, 0 - выключено.
+IDEMPOTENCY_TTL = float(os.environ.get('PORTION_IDEMPOTENCY_TTL', 24 * 3600))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('PORTION_IDEMPOTENCY_MAX_KEYS', 10000))
+IDEMPOTENCY_DB_PATH = os.environ.get('PORTION_IDEMPOTENCY_PATH', os.path.join(APP_ROOT, 'database/idempotency.sqlite3'))
+
+# Лента изменений MainPurch/OtherPurch/AllPurch/RationInfo для /sync/<table>?since=<seq>:
+# клиент получает только изменения после своей версии. Хранится RETENTION секунд (например,
+# 2592000 - 30 дней); по умолчанию 0 - выключено (запись ленты добавляет работу каждой записи таблиц).
+CHANGE_FEED_RETENTION = float(os.environ.get('PORTION_CHANGE_FEED_RETENTION', 0))
+CHANGE_FEED_DB_PATH = os.environ.get('PORTION_CHANGE_FEED_PATH', os.path.join(APP_ROOT, 'database/changes.sqlite3'))
+
+
+def create_change_feed():
+    """Лента изменений (общая для процессов, переживает перезапуск) или None, если выключена"""
+    if CHANGE_FEED_RETENTION > 0:
+        return ChangeFeed(CHANGE_FEED_DB_PATH, retention_seconds=CHANGE_FEED_RETENTION)
+    return None
+
+
+def create_db_handler(storage_engine=None, change_feed=None):
+    """Обработчик базы данных с настройками из окружения (storage_engine - вместо PORTION_STORAGE_ENGINE)"""
+    return DatabaseHandler(
+        orders_dir=ORDERS_DIR,
+        users_dir=USERS_DIR,
+        products_dir=PRODUCTS_DIR,
+        storage_engine=storage_engine or STORAGE_ENGINE,
+        sqlite_path=SQLITE_DB_PATH,
+        journal=JOURNAL_ENABLED,
+        journal_options=JOURNAL_OPTIONS,
+        partitioned=PARTITIONS_ENABLED,
+        prodlinks_path=PRODLINKS_PATH,
+        group_commit_ms=GROUP_COMMIT_MS,
+        write_behind=WRITE_BEHIND_ENABLED,
+        write_behind_options=WRITE_BEHIND_OPTIONS,
+        vacuum_interval=VACUUM_INTERVAL,
+        lock_stripes=LOCK_STRIPES,
+        change_feed=change_feed
+    )
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Служебные операции с базой: миграция между движками хранения и выгрузка в Excel.
+
+Примеры:
+    python db_tools.py migrate --engine parquet
+    python db_tools.py export --engine parquet --out-dir /tmp/export
+    python db_tools.py import-orders history.json --chunk 5000
+    python db_tools.py vacuum --engine excel
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'modules'))
+from modules.server_order_creator import ServerOrderCreator
+from config import create_change_feed, create_db_handler
+
+
+def make_db_handler(engine):
+    """Обработчик с настройками сервера (журналы, партиции, полосы, лента изменений):
+    загруженные заказы и чистка попадают в ленту /sync так же, как записи сервера"""
+    return create_db_handler(engine, change_feed=create_change_feed())
+
+
+def cmd_migrate(args, db_handler):
+    """Миграция legacy .xlsx выполняется при создании движка"""
+    for table in db_handler.table_paths:
+        status = "✓" if db_handler.storage.exists(table) else "⚠  нет данных"
+        print(f"   {status} {table}: {db_handler.storage.location(table)}")
+
+
+def cmd_export(args, db_handler):
+    tables = args.tables or list(db_handler.table_paths)
+    for table in tables:
+        filepath = None
+        if args.out_dir:
+            os.makedirs(args.out_dir, exist_ok=True)
+            filepath = os.path.join(args.out_dir, os.path.basename(db_handler.table_paths[table]))
+        db_handler.export_excel(table, filepath)
+
+
+def load_orders(path):
+    """Заказы из файла: JSON-список, {"orders": [...]} или JSON Lines (заказ на строку)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        return data.get('orders', [data])
+    return data
+
+
+def cmd_import_orders(args, db_handler):
+    """Перенос истории заказов: заказы пишутся пакетами, одна запись на таблицу в пакете"""
+    order_creator = ServerOrderCreator(db_handler)
+    orders = load_orders(args.file)
+    print(f"📥 {args.file}: {len(orders)} заказов, пакеты по {args.chunk}")
+
+    started = time.perf_counter()
+    accepted = 0
+    rejected = 0
+    for offset in range(0, len(orders), args.chunk):
+        result = order_creator.create_orders_batch(orders[offset:offset + args.chunk])
+        data = result.get('data', {})
+        for item in data.get('rejected', []):
+            print(f"   ⚠️ Заказ #{offset + item['index']}: {item['message']}")
+        rejected += len(data.get('rejected', []))
+        if result['status'] == 'error' and 'accepted' not in data:
+            print(f"❌ Пакет {offset}-{offset + args.chunk - 1}: {result['message']}")
+            continue
+        accepted += data.get('accepted', 0)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Загружено {accepted} заказов, отклонено {rejected} за {elapsed:.2f} с "
+          f"({accepted / elapsed if elapsed > 0 else 0:.1f} заказов/с)")
+
+
+def cmd_vacuum(args, db_handler):
+    """Перезапись MainPurch/OtherPurch в канонической форме (без ожидания фонового обслуживания)"""
+    for table in args.tables or db_handler.vacuum_tables():
+        if db_handler.is_clean(table) and not args.force:
+            print(f"   ✓ {table}: уже в канонической форме")
+            continue
+        if db_handler.vacuum_purchases(table) is None:
+            print(f"   ⚠  {table}: нет данных")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Служебные операции с базой Portion")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help="Перенести .xlsx в выбранный движок")
+    migrate_parser.add_argument('--engine', default=os.environ.get('PORTION_STORAGE_ENGINE', 'parquet'))
+    migrate_parser.set_defaults(func=cmd_migrate)
+
+    export_parser = subparsers.add_parser('export', help="Выгрузить таблицы в .xlsx")
+    export_parser.add_argument('--engine', default=os.environ.get('PORTION_STORAGE_ENGINE', 'excel'))
+    export_parser.add_argument('--tables', nargs='*', help="Таблицы (по умолчанию все)")
+    export_parser.add_argument('--out-dir', help="Папка для выгрузки (по умолчанию - рядом с таблицами)")
+    export_parser.set_defaults(func=cmd_export)
+
+    import_parser = subparsers.add_parser('import-orders', help="Загрузить историю заказов из JSON")
+    import_parser.add_argument('file', help="JSON-список заказов или JSON Lines")
+    import_parser.add_argument('--engine', default=os.environ.get('PORTION_STORAGE_ENGINE', 'excel'))
+    import_parser.add_argument('--chunk', type=int, default=1000, help="Заказов в одном пакете")
+    import_parser.set_defaults(func=cmd_import_orders)
+
+    vacuum_parser = subparsers.add_parser('vacuum', help="Переписать MainPurch/OtherPurch в канонической форме")
+    vacuum_parser.add_argument('--engine', default=os.environ.get('PORTION_STORAGE_ENGINE', 'excel'))
+    vacuum_parser.add_argument('--tables', nargs='*', choices=['mainpurch', 'otherpurch'])
+    vacuum_parser.add_argument('--force', action='store_true', help="Переписать даже чистые таблицы")
+    vacuum_parser.set_defaults(func=cmd_vacuum)
+
+    args = parser.parse_args(argv)
+    db_handler = make_db_handler(args.engine)
+    try:
+        args.func(args, db_handler)
+    finally:
+        # Фоновые потоки останавливаются, журналы и отложенные обновления вливаются в таблицы
+        db_handler.close()
+
+
+if __name__ == '__main__':
+    main()
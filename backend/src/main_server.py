@@ -9,41 +9,31 @@ import os
 import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'modules'))
-from modules import api_routes, images_handler, database_handler
+from modules import api_routes, images_handler
 from modules.server_order_creator import ServerOrderCreator
 from modules.server_ration_handler import ServerRationHandler
+from modules.idempotency import IdempotencyStore
+from modules.json_provider import create_json_provider
+from modules.etags import ETagTracker
+# Пути и настройки из окружения (общие с db_tools.py)
+from config import (APP_ROOT, ORDERS_DIR, USERS_DIR, PRODUCTS_DIR, MAIN_PURCH_PATH, OTHER_PURCH_PATH,
+                    ALL_PURCH_PATH, RATION_INFO_PATH, PRODUCTS_DB_PATH, IMAGES_DIR, PRODLINKS_PATH,
+                    JSON_ENCODER, ETAGS_ENABLED, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_DB_PATH,
+                    create_change_feed, create_db_handler)
 
 app = Flask(__name__)
 
-# ==================== КОНФИГУРАЦИЯ ПУТЕЙ ====================
-
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-APP_ROOT = PROJECT_ROOT
-
-# Основные директории
-ORDERS_DIR = os.path.join(APP_ROOT, 'database/orders')
-USERS_DIR = os.path.join(APP_ROOT, 'database/users')
-PRODUCTS_DIR = os.path.join(APP_ROOT, 'database/products')
-
-# Файлы
-MAIN_PURCH_PATH = os.path.join(ORDERS_DIR, 'mainpurch.xlsx')
-OTHER_PURCH_PATH = os.path.join(ORDERS_DIR, 'otherpurch.xlsx')
-ALL_PURCH_PATH = os.path.join(ORDERS_DIR, 'allpurch.xlsx')
-RATION_INFO_PATH = os.path.join(USERS_DIR, 'rationinfo.xlsx')
-PRODUCTS_DB_PATH = os.path.join(PRODUCTS_DIR, 'appdb2.xlsx')
-IMAGES_DIR = os.path.join(PRODUCTS_DIR, 'images')
-PRODLINKS_PATH = os.path.join(PRODUCTS_DIR, 'prodlinks.xlsx')
-
-
 # Инициализация модулей
 print("🔄 Инициализация модулей...")
 
+app.json = create_json_provider(app, JSON_ENCODER)
+print(f"   JSON: {app.json.name}")
+
+# Лента изменений (общая для процессов сервера, переживает перезапуск)
+change_feed = create_change_feed()
+
 # Инициализируем обработчик базы данных
-db_handler = database_handler.DatabaseHandler(
-    orders_dir=ORDERS_DIR,
-    users_dir=USERS_DIR,
-    products_dir=PRODUCTS_DIR
-)
+db_handler = create_db_handler(change_feed=change_feed)
 
 # Инициализируем обработчик изображений
 images_handler.init_images(IMAGES_DIR)
@@ -54,6 +44,15 @@ server_order_creator = ServerOrderCreator(db_handler)
 # Инициализируем серверный обработчик рациона
 server_ration_handler = ServerRationHandler(db_handler)
 
+# Хранилище ключей идемпотентности (общее для процессов сервера, переживает перезапуск)
+idempotency_store = None
+if IDEMPOTENCY_TTL > 0:
+    idempotency_store = IdempotencyStore(IDEMPOTENCY_DB_PATH, ttl_seconds=IDEMPOTENCY_TTL,
+                                         max_entries=IDEMPOTENCY_MAX_KEYS)
+
+# ETag ответов чтения (тег зависит и от кодировщика JSON - тела ответов у них различаются)
+etag_tracker = ETagTracker(db_handler, salt=app.json.name) if ETAGS_ENABLED else None
+
 # Регистрируем API routes
 api_routes.register_routes(
     app,
@@ -63,7 +62,9 @@ api_routes.register_routes(
     None,
     server_order_creator,
     server_ration_handler,
-    prodlinks_path=PRODLINKS_PATH
+    prodlinks_path=PRODLINKS_PATH,
+    idempotency_store=idempotency_store,
+    etag_tracker=etag_tracker
 )
 
 # Основные маршруты сервера
@@ -81,6 +82,7 @@ def index():
             "products_dir": PRODUCTS_DIR,
             "images_dir": IMAGES_DIR
         },
+        "storage_engine": db_handler.storage.name,
         "modules": {
             "order_creator": "active",
             "server_order_creator": "active",
@@ -113,6 +115,7 @@ def get_config():
     
     return jsonify({
         "app_root": APP_ROOT,
+        "storage_engine": db_handler.storage.name,
         "directories": {
             "orders": ORDERS_DIR,
             "users": USERS_DIR,
@@ -132,6 +135,7 @@ if __name__ == '__main__':
     print(f"   • Users: {USERS_DIR}")
     print(f"   • Products: {PRODUCTS_DIR}")
     print(f"   • Images: {IMAGES_DIR}")
+    print(f"🗄️  Движок хранения: {db_handler.storage.name}")
     
     print(f"\n📄 Файлы:")
     files_to_check = [
@@ -149,8 +153,13 @@ if __name__ == '__main__':
         else:
             print(f"   ⚠  {os.path.basename(path)} ({description}) - не найден")
     
+    # Встроенный сервер Flask - для разработки (PORTION_DEBUG=1 - отладчик и перезагрузка
+    # при изменении кода); для эксплуатации - python serve.py (gunicorn/waitress)
+    debug = os.environ.get('PORTION_DEBUG', '0') == '1'
+    
     print(f"\n🌐 Локальный доступ: http://localhost:8000")
     print(f"📱 Доступ с телефона: http://your_ip:8000")
+    print(f"🛠️  Сервер разработки{' (debug)' if debug else ''}; для эксплуатации: python serve.py")
     print("=" * 50)
     
-    app.run(host='0.0.0.0', port=8000, debug=True)
+    app.run(host='0.0.0.0', port=8000, debug=debug, use_reloader=debug, threaded=True)
@@ -3,6 +3,24 @@
 """
 
 from .database_handler import DatabaseHandler, get_current_timestamp, parse_date, generate_expire_dates
+from .dataframe_cache import DataFrameCache, get_dataframe_cache
+from .append_journal import AppendJournal, JournalCompactor
+from .storage_engines import (StorageEngine, ExcelStorageEngine, SQLiteStorageEngine, ParquetStorageEngine,
+                              ArrowStorageEngine,
+                              create_storage_engine)
+from .partitioned_storage import MonthPartitionedEngine
+from .purch_index import OwnerIndex
+from .aggregation import TableSpec, MAIN_PURCH_SPEC, OTHER_PURCH_SPEC
+from .timestamp_index import TimestampIndex
+from .product_catalog import Product, ProductCatalog
+from .table_writer import TableWriter, TableFileLock
+from .multi_commit import CommitLog
+from .idempotency import IdempotencyStore, idempotent
+from .etags import ETagTracker, conditional
+from .change_feed import ChangeFeed
+from .write_behind import WriteBehindFlusher
+from .maintenance import PurchaseVacuum
+from .lock_striping import StripedLocks
 from .images_handler import ImagesHandler, init_images, get_image_handler
 from .api_routes import register_routes
 from .server_order_creator import ServerOrderCreator
@@ -13,6 +31,35 @@ __all__ = [
     'get_current_timestamp',
     'parse_date',
     'generate_expire_dates',
+    'DataFrameCache',
+    'get_dataframe_cache',
+    'AppendJournal',
+    'JournalCompactor',
+    'StorageEngine',
+    'ExcelStorageEngine',
+    'SQLiteStorageEngine',
+    'ParquetStorageEngine',
+    'ArrowStorageEngine',
+    'create_storage_engine',
+    'MonthPartitionedEngine',
+    'OwnerIndex',
+    'TableSpec',
+    'MAIN_PURCH_SPEC',
+    'OTHER_PURCH_SPEC',
+    'TimestampIndex',
+    'Product',
+    'ProductCatalog',
+    'TableWriter',
+    'CommitLog',
+    'IdempotencyStore',
+    'idempotent',
+    'ETagTracker',
+    'conditional',
+    'ChangeFeed',
+    'WriteBehindFlusher',
+    'PurchaseVacuum',
+    'StripedLocks',
+    'TableFileLock',
     'ImagesHandler',
     'init_images',
     'get_image_handler',
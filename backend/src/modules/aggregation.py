@@ -0,0 +1,152 @@
+"""
+Агрегация MainPurch/OtherPurch: ключ и правила колонок объявлены один раз на таблицу
+
+Одни и те же правила используются при записи (заказы, обновление файлов покупок) и при чтении
+(финальная агрегация холодильника семьи): полная пересборка - один groupby, инкрементальное
+вливание - upsert по ключу без переагрегации остальных строк.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+# Владелец строки - по нему строки ищутся через OwnerIndex
+OWNER_COLUMNS = ('UserID', 'FamilyID')
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    """Правила агрегации таблицы: ключ, суммируемые колонки и колонки с минимумом.
+
+    Остальные колонки берут первое непустое значение (как 'first' в groupby).
+    """
+    table: str
+    key: tuple
+    sums: tuple = ()
+    mins: tuple = ()
+
+    def reducer(self, column):
+        if column in self.sums:
+            return 'sum'
+        if column in self.mins:
+            return 'min'
+        return 'first'
+
+    def agg_map(self, columns):
+        """Словарь для groupby().agg() по колонкам DataFrame (кроме ключа)"""
+        return {column: self.reducer(column) for column in columns if column not in self.key}
+
+    def prepare(self, df):
+        """Пустые суммы - 0, пустой UserID - '' (иначе строки выпадут из группировки)"""
+        df = df.copy()
+        for column in self.sums:
+            if column in df.columns:
+                df[column] = df[column].fillna(0)
+        df['UserID'] = df['UserID'].fillna('') if 'UserID' in df.columns else ''
+        return df
+
+    def _group(self, df, sort):
+        df = self.prepare(df)
+        key = [column for column in self.key if column in df.columns]
+        return df.groupby(key, sort=sort).agg(self.agg_map(df.columns)).reset_index()
+
+    def rebuild(self, df):
+        """Полная агрегация таблицы (строки упорядочены по ключу)"""
+        return self._group(df, sort=True)
+
+    def collapse(self, df):
+        """Схлопывание строк с одинаковым ключом с сохранением порядка строк и колонок"""
+        grouped = self._group(df, sort=False)
+        return grouped[[column for column in df.columns if column in grouped.columns]
+                       + [column for column in grouped.columns if column not in df.columns]]
+
+    def merge(self, df, index, new_df):
+        """Инкрементальное вливание новых строк в уже агрегированную таблицу.
+
+        Строка с тем же ключом ищется через OwnerIndex среди строк владельца: у нее обновляются
+        суммы и минимумы, остальные строки таблицы не трогаются. Строки с новым ключом
+        добавляются в конец. Возвращает (DataFrame, обновлено, добавлено).
+        """
+        new_rows = self.collapse(new_df)
+        table_labels, new_labels = self._match_rows(df, index, new_rows)
+
+        if table_labels:
+            # Колонки заменяются целиком (_set_rows), поэтому исходный DataFrame не меняется
+            df = df.copy(deep=False)
+            positions = df.index.get_indexer(table_labels)
+            incoming_rows = new_rows.loc[new_labels]
+            for column in new_rows.columns:
+                if column in self.key or column not in df.columns:
+                    continue
+                current = df[column].iloc[positions].to_numpy()
+                incoming = incoming_rows[column].to_numpy()
+                reducer = self.reducer(column)
+                if reducer == 'first':
+                    # Обычно у существующих строк значения заполнены - колонку не переписываем
+                    missing = pd.isna(current) & pd.notna(incoming)
+                    if missing.any():
+                        _set_rows(df, column, positions[missing], incoming[missing])
+                else:
+                    _set_rows(df, column, positions, _reduce_pair(reducer, current, incoming))
+
+        inserted = new_rows.drop(index=new_labels)
+        if len(inserted):
+            df = pd.concat([df, inserted], ignore_index=True)
+        return df, len(table_labels), len(inserted)
+
+    def _match_rows(self, df, index, new_rows):
+        """Пары (метка строки таблицы, метка новой строки) с совпавшим ключом"""
+        rest = [column for column in self.key if column not in OWNER_COLUMNS]
+        table_labels, new_labels = [], []
+        for (user_id, family_id), group in new_rows.groupby(list(OWNER_COLUMNS), sort=False):
+            owner_rows = index.select(df, index.user_rows(user_id, family_id))
+            if owner_rows.empty:
+                continue
+            # Ключ -> первая строка владельца с этим ключом (дубли в таблице не переагрегируются)
+            lookup = {}
+            for values, label in zip(owner_rows[rest].itertuples(index=False, name=None), owner_rows.index):
+                lookup.setdefault(values, label)
+            for values, label in zip(group[rest].itertuples(index=False, name=None), group.index):
+                table_label = lookup.get(values)
+                if table_label is not None:
+                    table_labels.append(table_label)
+                    new_labels.append(label)
+        return table_labels, new_labels
+
+
+def _numeric(values):
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+
+
+def _reduce_pair(reducer, current, incoming):
+    """Значение колонки после вливания: сумма или минимум существующего и нового"""
+    if reducer == 'sum':
+        if current.dtype.kind in 'iu' and incoming.dtype.kind in 'iu':
+            return current + incoming
+        return np.nan_to_num(_numeric(current)) + np.nan_to_num(_numeric(incoming))
+    if current.dtype.kind in 'iuf' and incoming.dtype.kind in 'iuf':
+        return np.fmin(current, incoming)
+    return np.fmin(_numeric(current), _numeric(incoming))
+
+
+def _set_rows(df, column, positions, values):
+    """Запись значений в строки positions колонки (тип колонки расширяется при необходимости)"""
+    series = df[column]
+    values = np.asarray(values)
+    if series.dtype.kind in 'iuf' and values.dtype.kind in 'iuf':
+        data = series.to_numpy(dtype=np.result_type(series.dtype, values.dtype), copy=True)
+    else:
+        data = series.to_numpy(dtype=object, copy=True)
+    data[positions] = values
+    df[column] = data
+
+
+# Расчетные поля покупки (количество, объем и стоимость с учетом количества)
+PURCHASE_SUMS = ('Count', 'TotalVolume', 'TotalVolumeGr', 'TotalCostPerCount')
+
+MAIN_PURCH_SPEC = TableSpec('mainpurch', key=('ProdID', 'FamilyID', 'UserID'),
+                            sums=PURCHASE_SUMS, mins=('Date',))
+OTHER_PURCH_SPEC = TableSpec('otherpurch', key=('ProdID', 'FamilyID', 'StoreID', 'Date', 'UserID'),
+                             sums=PURCHASE_SUMS)
+
+AGGREGATION_SPECS = {spec.table: spec for spec in (MAIN_PURCH_SPEC, OTHER_PURCH_SPEC)}
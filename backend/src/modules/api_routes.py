@@ -2,33 +2,71 @@
 Модуль для регистрации API маршрутов
 """
 
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 from datetime import datetime
 import os
 import pandas as pd
 
 # Импортируем новый обработчик рациона (ОСТАВЛЯЕМ!)
 from modules.server_ration_handler import ServerRationHandler
+from modules import serializers
+from modules.product_catalog import ProductCatalog, ProdLinksFormatError
+from modules.idempotency import idempotent
+from modules.etags import conditional
+from modules.change_feed import SYNC_TABLES
+
+# Колонки, которые реально сериализуются в ответах (проекция при чтении)
+RATION_COLUMNS = [
+    'ProdID', 'Name', 'Volume', 'Unit', 'VolumeGr', 'Kcal100g', 'Prot100g', 'Fat100g', 'Carb100g',
+    'ExpireDate', 'Tag', 'Cat', 'MealID', 'MealName', 'RationDate', 'VolumeServ', 'VolumeServGr',
+    'KcalServ', 'ProtServ', 'FatServ', 'CarbServ', 'UserID'
+]
+ALLPURCH_COLUMNS = [
+    'ProdID', 'Name', 'Volume', 'Unit', 'VolumeGr', 'Kcal100g', 'Prot100g', 'Fat100g', 'Carb100g',
+    'ExpireDate', 'Tag', 'Cat', 'Store', 'StoreID', 'Date', 'TotalCostPerCount', 'TotalCost',
+    'Address', 'AddressID'
+]
+
+
+# Строки ленты изменений - в тех же позиционных кортежах, что и полные ответы таблиц
+SYNC_COLUMNS = {
+    'mainpurch': serializers.main_purch_columns,
+    'otherpurch': serializers.other_purch_columns,
+    'allpurch': serializers.allpurch_columns,
+    'rationinfo': serializers.ration_columns
+}
+
+
+def wants_columnar(data):
+    """Ответ по колонкам ({колонка: значения} вместо списка кортежей): format=columnar
+    в теле запроса или в query string. Пустой результат отдается как раньше."""
+    value = data.get('format') if isinstance(data, dict) else None
+    return (value or request.args.get('format')) == 'columnar'
+
 
 # Новый код:
 def register_routes(app, db_handler, images_dir, lavka_processor,
                    lavka_updater, server_order_creator, server_ration_handler,
-                   prodlinks_path=None):
+                   prodlinks_path=None, idempotency_store=None, etag_tracker=None):
     
     # Если модули Яндекс Лавки не переданы, пропускаем эндпоинты
     has_lavka_modules = lavka_processor is not None and lavka_updater is not None
     """Регистрация всех API маршрутов"""
     
-    # Если prodlinks_path не передан, используем стандартный
+    # Если prodlinks_path не передан, используем стандартный (из папки товаров)
     if prodlinks_path is None:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        modules_dir = os.path.dirname(current_dir)
-        backend_dir = os.path.dirname(modules_dir)
-        prodlinks_path = os.path.join(backend_dir, 'database', 'products', 'prodlinks.xlsx')
+        prodlinks_path = db_handler.prodlinks_path
+    
+    # Каталог товаров со ссылками (общий каталог обработчика, если prodlinks тот же)
+    if os.path.abspath(prodlinks_path) == os.path.abspath(db_handler.prodlinks_path):
+        catalog = db_handler.catalog
+    else:
+        catalog = ProductCatalog(db_handler, prodlinks_path)
     
     # ==================== СОЗДАНИЕ ЗАКАЗА (iOS OrderCreator) ====================
     
     @app.route('/create_order', methods=['POST'])
+    @idempotent(idempotency_store, 'create_order')
     def create_order():
         """Создание заказа из iOS приложения (заменяет SwiftData логику)"""
         try:
@@ -67,7 +105,8 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             
             if result["status"] == "error":
                 print(f"❌ Ошибка при создании заказа: {result['message']}")
-                return jsonify(result), 400
+                # Ошибка записи - 500: ключ идемпотентности освобождается, повтор выполнится заново
+                return jsonify(result), 500 if result.get("retryable") else 400
             
             print(f"✅ Заказ успешно создан!")
             print(f"   Сохранено в AllPurch: {result['data']['all_saved']}")
@@ -89,9 +128,41 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 "message": f"Server error: {str(e)[:200]}"
             }), 500
     
+    @app.route('/create_orders_batch', methods=['POST'])
+    def create_orders_batch():
+        """Пакетная загрузка заказов (перенос истории): {"orders": [заказ как в /create_order, ...]}"""
+        try:
+            data = request.get_json()
+            
+            if not data:
+                return jsonify({"status": "error", "message": "No JSON data provided"}), 400
+            
+            orders = data.get('orders')
+            if not isinstance(orders, list) or not orders:
+                return jsonify({"status": "error", "message": "Field 'orders' must be a non-empty list"}), 400
+            
+            print(f"🛒 Пакетная загрузка: {len(orders)} заказов")
+            result = server_order_creator.create_orders_batch(orders)
+            
+            if result["status"] == "error":
+                print(f"❌ Ошибка пакетной загрузки: {result['message']}")
+                return jsonify(result), 500 if result.get("retryable") else 400
+            
+            return jsonify(result)
+            
+        except Exception as e:
+            print(f"❌ Ошибка в /create_orders_batch: {e}")
+            import traceback
+            traceback.print_exc()
+            return jsonify({
+                "status": "error",
+                "message": f"Server error: {str(e)[:200]}"
+            }), 500
+    
     # ==================== ПОЛУЧЕНИЕ ДАННЫХ ПО FAMILYID ИЛИ USERID (НОВЫЕ) ====================
     
     @app.route('/get_main_purch', methods=['POST'])
+    @conditional(etag_tracker, 'get_main_purch', ('mainpurch',))
     def get_main_purch():
         """Получение данных MainPurch по FamilyID или UserID"""
         try:
@@ -121,55 +192,15 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                     "message": "No products found"
                 })
             
-            products_data = []
-            for _, row in family_data.iterrows():
-                order_date_str = ""
-                expire_date_str = ""
-                
-                if pd.notna(row['Date']):
-                    if isinstance(row['Date'], (int, float)):
-                        order_date_str = datetime.fromtimestamp(row['Date']).strftime("%d.%m.%Y")
-                    else:
-                        order_date_str = str(row['Date'])
-                
-                if pd.notna(row['ExpireDate']):
-                    if isinstance(row['ExpireDate'], (int, float)):
-                        expire_date_str = datetime.fromtimestamp(row['ExpireDate']).strftime("%d.%m.%Y")
-                    else:
-                        expire_date_str = str(row['ExpireDate'])
-                
-                # ОТПРАВЛЯЕМ 20 ЭЛЕМЕНТОВ (с UserID и FamilyID)
-                product_tuple = (
-                    int(row['ProdID']),
-                    str(row['Name']),
-                    float(row['TotalVolume']),
-                    str(row['Unit']),
-                    float(row['TotalVolumeGr']),
-                    float(row['Kcal100g']),
-                    float(row['Prot100g']),
-                    float(row['Fat100g']),
-                    float(row['Carb100g']),
-                    expire_date_str,
-                    str(row['Tag']),
-                    str(row['Cat']),
-                    str(row['Store']),
-                    int(row['StoreID']),
-                    order_date_str,
-                    float(row['TotalCostPerCount']),
-                    str(row['Address']),
-                    int(row['AddressID']),
-                    str(row['UserID']) if 'UserID' in row and pd.notna(row['UserID']) else "",  # ← UserID
-                    int(row['FamilyID']) if 'FamilyID' in row and pd.notna(row['FamilyID']) else 0  # ← FamilyID
-                )
-                products_data.append(product_tuple)
-            
-            result = {
-                "status": "success",
-                "products": products_data,
-                "count": len(products_data)
-            }
+            # ОТПРАВЛЯЕМ 20 ЭЛЕМЕНТОВ (с UserID и FamilyID)
+            result = {"status": "success", "count": len(family_data)}
+            if wants_columnar(data):
+                result["format"] = "columnar"
+                result["products"] = serializers.columnar(serializers.main_purch_columns(family_data))
+            else:
+                result["products"] = serializers.main_purch_tuples(family_data)
             
-            print(f"✅ Отправлено {len(products_data)} продуктов (20 элементов каждый)")
+            print(f"✅ Отправлено {len(family_data)} продуктов (20 элементов каждый)")
             return jsonify(result)
             
         except Exception as e:
@@ -177,6 +208,7 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
     
     @app.route('/get_other_purch', methods=['POST'])
+    @conditional(etag_tracker, 'get_other_purch', ('otherpurch',))
     def get_other_purch():
         """Получение данных OtherPurch по FamilyID или UserID"""
         try:
@@ -206,54 +238,15 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                     "message": "No products found"
                 })
             
-            products_data = []
-            for _, row in family_data.iterrows():
-                order_date_str = ""
-                expire_date_str = ""
-                
-                if pd.notna(row['Date']) and row['Date'] != '':
-                    if isinstance(row['Date'], (int, float)):
-                        order_date_str = datetime.fromtimestamp(row['Date']).strftime("%d.%m.%Y")
-                    else:
-                        order_date_str = str(row['Date'])
-                
-                if pd.notna(row['ExpireDate']) and row['ExpireDate'] != '':
-                    if isinstance(row['ExpireDate'], (int, float)):
-                        expire_date_str = datetime.fromtimestamp(row['ExpireDate']).strftime("%d.%m.%Y")
-                    else:
-                        expire_date_str = str(row['ExpireDate'])
-                
-                # ОТПРАВЛЯЕМ 19 ЭЛЕМЕНТОВ (с UserID и FamilyID)
-                product_tuple = (
-                    int(row['ProdID']),
-                    str(row['Name']),
-                    float(row['TotalVolume']),
-                    str(row['Unit']),
-                    float(row['TotalVolumeGr']),
-                    float(row['Kcal100g']),
-                    float(row['Prot100g']),
-                    float(row['Fat100g']),
-                    float(row['Carb100g']),
-                    str(row['Tag']),
-                    str(row['Cat']),
-                    str(row['Store']),
-                    int(row['StoreID']),
-                    order_date_str,
-                    float(row['TotalCostPerCount']),
-                    str(row['Address']),
-                    int(row['AddressID']),
-                    str(row['UserID']) if 'UserID' in row and pd.notna(row['UserID']) else "",  # ← UserID
-                    int(row['FamilyID']) if 'FamilyID' in row and pd.notna(row['FamilyID']) else 0  # ← FamilyID
-                )
-                products_data.append(product_tuple)
-            
-            result = {
-                "status": "success",
-                "products": products_data,
-                "count": len(products_data)
-            }
+            # ОТПРАВЛЯЕМ 19 ЭЛЕМЕНТОВ (с UserID и FamilyID)
+            result = {"status": "success", "count": len(family_data)}
+            if wants_columnar(data):
+                result["format"] = "columnar"
+                result["products"] = serializers.columnar(serializers.other_purch_columns(family_data))
+            else:
+                result["products"] = serializers.other_purch_tuples(family_data)
             
-            print(f"✅ Отправлено {len(products_data)} продуктов из OtherPurch (19 элементов каждый)")
+            print(f"✅ Отправлено {len(family_data)} продуктов из OtherPurch (19 элементов каждый)")
             return jsonify(result)
             
         except Exception as e:
@@ -263,6 +256,7 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
     # ==================== УПРАВЛЕНИЕ РАЦИОНОМ (СЕРВЕРНЫЙ) ====================
     
     @app.route('/add_to_ration', methods=['POST'])
+    @idempotent(idempotency_store, 'add_to_ration')
     def add_to_ration():
         """Добавление продукта в серверный рацион"""
         try:
@@ -275,7 +269,7 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             result = server_ration_handler.add_to_ration(data)
             
             if result["status"] == "error":
-                return jsonify(result), 400
+                return jsonify(result), 500 if result.get("retryable") else 400
             
             return jsonify(result)
                 
@@ -289,6 +283,7 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             }), 500
     
     @app.route('/get_ration_by_date', methods=['POST'])
+    @conditional(etag_tracker, 'get_ration_by_date', ('rationinfo',))
     def get_ration_by_date():
         """Получение рациона по дате"""
         try:
@@ -309,7 +304,7 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             print(f"🔍 Получен запрос рациона на дату: {ration_date}, UserID: {user_id}")  # ← ИЗМЕНИТЬ ЛОГ
             
             # Получаем данные через обработчик
-            df = server_ration_handler.get_ration_by_date(ration_date)
+            df = server_ration_handler.get_ration_by_date(ration_date, columns=RATION_COLUMNS, user_id=user_id)
             
             if df.empty:
                 return jsonify({
@@ -338,57 +333,14 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             # КОНЕЦ БЛОКА ФИЛЬТРАЦИИ
             
             # Преобразуем данные для отправки
-            rations_data = []
-            for _, row in df.iterrows():
-                # Форматируем даты
-                ration_date_str = ""
-                expire_date_str = ""
-                
-                if pd.notna(row.get('RationDate')):
-                    if isinstance(row['RationDate'], (int, float)):
-                        ration_date_str = datetime.fromtimestamp(row['RationDate']).strftime("%d.%m.%Y")
-                    else:
-                        ration_date_str = str(row['RationDate'])
-                
-                if pd.notna(row.get('ExpireDate')) and row['ExpireDate'] != '':
-                    if isinstance(row['ExpireDate'], (int, float)):
-                        expire_date_str = datetime.fromtimestamp(row['ExpireDate']).strftime("%d.%m.%Y")
-                    else:
-                        expire_date_str = str(row['ExpireDate'])
-                
-                ration_tuple = (
-                    int(row['ProdID']) if pd.notna(row.get('ProdID')) else 0,
-                    str(row.get('Name', '')),
-                    float(row.get('Volume', 0)),
-                    str(row.get('Unit', '')),
-                    float(row.get('VolumeGr', 0)),
-                    float(row.get('Kcal100g', 0)),
-                    float(row.get('Prot100g', 0)),
-                    float(row.get('Fat100g', 0)),
-                    float(row.get('Carb100g', 0)),
-                    expire_date_str,
-                    str(row.get('Tag', '')),
-                    str(row.get('Cat', '')),
-                    int(row.get('MealID', 0)),
-                    str(row.get('MealName', '')),
-                    ration_date_str,
-                    float(row.get('VolumeServ', 0)),
-                    float(row.get('VolumeServGr', 0)),
-                    float(row.get('KcalServ', 0)),
-                    float(row.get('ProtServ', 0)),
-                    float(row.get('FatServ', 0)),
-                    float(row.get('CarbServ', 0)),
-                    str(row.get('UserID', ''))
-                )
-                rations_data.append(ration_tuple)
-            
-            result = {
-                "status": "success",
-                "rations": rations_data,
-                "count": len(rations_data)
-            }
+            result = {"status": "success", "count": len(df)}
+            if wants_columnar(data):
+                result["format"] = "columnar"
+                result["rations"] = serializers.columnar(serializers.ration_columns(df))
+            else:
+                result["rations"] = serializers.ration_tuples(df)
             
-            print(f"✅ Отправлено {len(rations_data)} записей рациона на {ration_date} для UserID: {user_id}")  # ← ИЗМЕНИТЬ ЛОГ
+            print(f"✅ Отправлено {len(df)} записей рациона на {ration_date} для UserID: {user_id}")  # ← ИЗМЕНИТЬ ЛОГ
             return jsonify(result)
             
         except Exception as e:
@@ -396,6 +348,7 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
             
     @app.route('/get_ration_by_daterange', methods=['POST'])
+    @conditional(etag_tracker, 'get_ration_by_daterange', ('rationinfo',))
     def get_ration_by_daterange():
         """Получение рациона за период дат"""
         try:
@@ -435,7 +388,8 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 }), 400
         
             # Получаем данные через обработчик
-            df = server_ration_handler.get_ration_by_daterange(start_date, end_date)
+            df = server_ration_handler.get_ration_by_daterange(start_date, end_date, columns=RATION_COLUMNS,
+                                                                 user_id=user_id)
         
             if df.empty:
                 return jsonify({
@@ -467,69 +421,30 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 }), 500
         
             # Преобразуем данные для отправки
-            rations_data = []
-            for _, row in df.iterrows():
-                # Форматируем даты
-                ration_date_str = ""
-                expire_date_str = ""
-            
-                # RationDate
-                if pd.notna(row.get('RationDate')):
-                    if isinstance(row['RationDate'], (int, float)):
-                        ration_date_str = datetime.fromtimestamp(row['RationDate']).strftime("%d.%m.%Y")
-                    else:
-                        ration_date_str = str(row['RationDate'])
-            
-                # ExpireDate
-                if pd.notna(row.get('ExpireDate')) and row['ExpireDate'] != '':
-                    if isinstance(row['ExpireDate'], (int, float)):
-                        expire_date_str = datetime.fromtimestamp(row['ExpireDate']).strftime("%d.%m.%Y")
-                    else:
-                        expire_date_str = str(row['ExpireDate'])
-            
-                ration_tuple = (
-                    int(row['ProdID']) if pd.notna(row.get('ProdID')) else 0,
-                    str(row.get('Name', '')),
-                    float(row.get('Volume', 0)),
-                    str(row.get('Unit', '')),
-                    float(row.get('VolumeGr', 0)),
-                    float(row.get('Kcal100g', 0)),
-                    float(row.get('Prot100g', 0)),
-                    float(row.get('Fat100g', 0)),
-                    float(row.get('Carb100g', 0)),
-                    expire_date_str,
-                    str(row.get('Tag', '')),
-                    str(row.get('Cat', '')),
-                    int(row.get('MealID', 0)),
-                    str(row.get('MealName', '')),
-                    ration_date_str,
-                    float(row.get('VolumeServ', 0)),
-                    float(row.get('VolumeServGr', 0)),
-                    float(row.get('KcalServ', 0)),
-                    float(row.get('ProtServ', 0)),
-                    float(row.get('FatServ', 0)),
-                    float(row.get('CarbServ', 0)),
-                    str(row.get('UserID', ''))
-                )
-                rations_data.append(ration_tuple)
+            columns = serializers.ration_columns(df)
+            ration_dates = columns[14][1]  # ration_date_str находится на 14 позиции
+        
+            print("🔍 ПРОВЕРКА ДАТ ПЕРЕД ОТПРАВКОЙ:")
+            for i, (name, ration_date) in enumerate(zip(columns[1][1][:3], ration_dates)):  # первые 3
+                print(f"   [{i}] Name: {name}")
+                print(f"       RationDate (позиция 14): '{ration_date}'")
+        
+            columnar = wants_columnar(data)
+            if columnar:
+                # По колонкам группировка хранит номера строк, а не копии записей
+                rations_data = serializers.columnar(columns)
+            else:
+                rations_data = serializers.tuples(columns)
         
-                # ДОПОЛНИТЕЛЬНАЯ ПРОВЕРКА - ВСТАВЬТЕ ЗДЕСЬ
-                print("🔍 ПРОВЕРКА ДАТ ПЕРЕД ОТПРАВКОЙ:")
-                for i, ration in enumerate(rations_data[:3]):  # первые 3
-                    print(f"   [{i}] Name: {ration[1]}")
-                    print(f"       RationDate (позиция 14): '{ration[14]}'")
             # Дополнительная группировка по датам (опционально)
             grouped_by_date = {}
-            for ration in rations_data:
-                date = ration[14]  # ration_date_str находится на 14 позиции
-                if date not in grouped_by_date:
-                    grouped_by_date[date] = []
-                grouped_by_date[date].append(ration)
+            for position, date in enumerate(ration_dates):
+                grouped_by_date.setdefault(date, []).append(position if columnar else rations_data[position])
         
             result = {
                 "status": "success",
                 "rations": rations_data,
-                "count": len(rations_data),
+                "count": len(df),
                 "date_range": {
                     "start_date": start_date,
                     "end_date": end_date
@@ -538,7 +453,10 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 "date_count": len(grouped_by_date)  # Количество дней с данными
             }
         
-            print(f"✅ Отправлено {len(rations_data)} записей рациона за период {start_date} - {end_date} для UserID: {user_id}")
+            if columnar:
+                result["format"] = "columnar"
+        
+            print(f"✅ Отправлено {len(df)} записей рациона за период {start_date} - {end_date} для UserID: {user_id}")
             print(f"   Дней с данными: {len(grouped_by_date)}")
         
             return jsonify(result)
@@ -550,6 +468,7 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
             
     @app.route('/get_allpurch_by_daterange', methods=['POST'])
+    @conditional(etag_tracker, 'get_allpurch_by_daterange', ('allpurch',))
     def get_allpurch_by_daterange():
         """Получение AllPurch за период дат для StatisticView"""
         try:
@@ -594,7 +513,8 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 }), 400
         
             # Получаем данные через DatabaseHandler
-            df, error = db_handler.get_allpurch_by_daterange(start_date, end_date, user_id, family_id, user_acc_type)
+            df, error = db_handler.get_allpurch_by_daterange(start_date, end_date, user_id, family_id, user_acc_type,
+                                                             columns=ALLPURCH_COLUMNS)
         
             if error:
                 return jsonify({"status": "error", "message": error}), 500
@@ -607,86 +527,21 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 })
         
             # Преобразуем данные для отправки - 15 элементов для существующей модели AllPurch
-            purchases_data = []
-            for _, row in df.iterrows():
-                # Форматируем даты
-                order_date_str = ""
-                expire_date_str = ""
-            
-                # OrderDate (Date в Excel)
-                if pd.notna(row.get('Date')):
-                    if isinstance(row['Date'], (int, float)):
-                        order_date_str = datetime.fromtimestamp(row['Date']).strftime("%d.%m.%Y")
-                    else:
-                        order_date_str = str(row['Date'])
-            
-                # ExpireDate
-                if pd.notna(row.get('ExpireDate')) and row['ExpireDate'] != '':
-                    if isinstance(row['ExpireDate'], (int, float)):
-                        expire_date_str = datetime.fromtimestamp(row['ExpireDate']).strftime("%d.%m.%Y")
-                    else:
-                        expire_date_str = str(row['ExpireDate'])
-            
-                # PrefMeal и PrefMealID - устанавливаем по умолчанию, так как нет в Excel
-                pref_meal_id = 0
-                pref_meal = ""
-            
-                # Address и AddressID - берем из Excel
-                address = str(row.get('Address', '')) if pd.notna(row.get('Address')) else ""
-                address_id = int(row.get('AddressID', 0)) if pd.notna(row.get('AddressID')) else 0
-            
-                # Store и StoreID
-                store = str(row.get('Store', '')) if pd.notna(row.get('Store')) else ""
-                store_id = int(row.get('StoreID', 0)) if pd.notna(row.get('StoreID')) else 0
-            
-                # TotalCost - используем TotalCostPerCount вместо TotalCost
-                # Проверяем наличие TotalCostPerCount, если нет - используем TotalCost как запасной вариант
-                total_cost = 0.0
-                if 'TotalCostPerCount' in df.columns and pd.notna(row.get('TotalCostPerCount')):
-                    total_cost = float(row.get('TotalCostPerCount', 0))
-                    print(f"   Используем TotalCostPerCount: {total_cost}")
-                elif 'TotalCost' in df.columns and pd.notna(row.get('TotalCost')):
-                    total_cost = float(row.get('TotalCost', 0))
-                    print(f"   Используем TotalCost (запасной): {total_cost}")
-                else:
-                    print(f"   ⚠️ Нет TotalCostPerCount и TotalCost для строки {index}")
-            
-                # Формируем кортеж из 15 элементов для существующей модели AllPurch
-                purchase_tuple = (
-                    int(row.get('ProdID', 0)) if pd.notna(row.get('ProdID')) else 0,
-                    str(row.get('Name', '')),
-                    float(row.get('Volume', 0)) if pd.notna(row.get('Volume')) else 0,
-                    str(row.get('Unit', '')),
-                    float(row.get('VolumeGr', 0)) if pd.notna(row.get('VolumeGr')) else 0,
-                    float(row.get('Kcal100g', 0)) if pd.notna(row.get('Kcal100g')) else 0,
-                    float(row.get('Prot100g', 0)) if pd.notna(row.get('Prot100g')) else 0,
-                    float(row.get('Fat100g', 0)) if pd.notna(row.get('Fat100g')) else 0,
-                    float(row.get('Carb100g', 0)) if pd.notna(row.get('Carb100g')) else 0,
-                    expire_date_str,
-                    str(row.get('Tag', '')),
-                    str(row.get('Cat', '')),
-                    store,                     # Store
-                    store_id,                  # StoreID
-                    order_date_str,            # OrderDate
-                    pref_meal_id,              # PrefMealID (по умолчанию)
-                    pref_meal,                 # PrefMeal (по умолчанию)
-                    total_cost,                # TotalCost
-                    address,                   # Address
-                    address_id                 # AddressID
-                )
-                purchases_data.append(purchase_tuple)
-        
             result = {
                 "status": "success",
-                "purchases": purchases_data,
-                "count": len(purchases_data),
+                "count": len(df),
                 "date_range": {
                     "start_date": start_date,
                     "end_date": end_date
                 }
             }
+            if wants_columnar(data):
+                result["format"] = "columnar"
+                result["purchases"] = serializers.columnar(serializers.allpurch_columns(df))
+            else:
+                result["purchases"] = serializers.allpurch_tuples(df)
         
-            print(f"✅ Отправлено {len(purchases_data)} записей AllPurch за период {start_date} - {end_date}")
+            print(f"✅ Отправлено {len(df)} записей AllPurch за период {start_date} - {end_date}")
         
             return jsonify(result)
         
@@ -719,33 +574,27 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 return jsonify({"status": "error", "message": "Missing required fields"}), 400
             
             try:
-                df = db_handler.read_excel(db_handler.main_purch_path)
-                
                 family_id_int = int(family_id)
                 prod_id_int = int(prod_id)
                 
-                # Создаем маску для поиска по полному ключу
-                mask = (df['ProdID'] == prod_id_int) & (df['FamilyID'] == family_id_int)
+                # Чтение и запись - одной операцией в очереди записи mainpurch
+                # (с отложенной записью - в памяти и в журнале повтора)
+                action = db_handler.update_purchase(
+                    'mainpurch',
+                    {'UserID': user_id, 'FamilyID': family_id_int, 'ProdID': prod_id_int},
+                    new_volume_gr, new_volume
+                )
                 
-                if user_id:
-                    # Если есть UserID, добавляем его в фильтр
-                    mask = mask & (df['UserID'] == user_id)
+                if action == 'deleted':
+                    print(f"🗑️ MainPurch УДАЛЕН: ProdID {prod_id}, FamilyID {family_id_int}, UserID {user_id}")
+                    message = "MainPurch deleted successfully (volume reached 0)"
+                elif action == 'updated':
+                    print(f"✅ MainPurch обновлен: ProdID {prod_id}, VolumeGr: {new_volume_gr}, Volume: {new_volume}")
+                    message = "MainPurch updated successfully"
+                else:
+                    message = None
                 
-                if mask.any():
-                    # ЕСЛИ ОБЪЕМ СТАЛ 0 - УДАЛЯЕМ ЗАПИСЬ
-                    if new_volume_gr == 0:
-                        df = df[~mask]  # Удаляем строку
-                        print(f"🗑️ MainPurch УДАЛЕН: ProdID {prod_id}, FamilyID {family_id_int}, UserID {user_id}")
-                        message = "MainPurch deleted successfully (volume reached 0)"
-                    else:
-                        # ИНАЧЕ ОБНОВЛЯЕМ
-                        df.loc[mask, 'TotalVolumeGr'] = new_volume_gr
-                        df.loc[mask, 'TotalVolume'] = new_volume
-                        print(f"✅ MainPurch обновлен: ProdID {prod_id}, VolumeGr: {new_volume_gr}, Volume: {new_volume}")
-                        message = "MainPurch updated successfully"
-                    
-                    db_handler.save_excel(df, db_handler.main_purch_path)
-                    
+                if message is not None:
                     return jsonify({
                         "status": "success",
                         "message": message,
@@ -792,8 +641,6 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 return jsonify({"status": "error", "message": error_msg}), 400
             
             try:
-                df = db_handler.read_excel(db_handler.other_purch_path)
-                
                 # Преобразуем типы
                 family_id_int = int(family_id)
                 store_id_int = int(store_id)
@@ -807,50 +654,22 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                 except ValueError:
                     order_date_formatted = order_date_str
                 
-                # Создаем маску для поиска записи по полному ключу
-                mask = (
-                    (df['ProdID'] == prod_id_int) &
-                    (df['FamilyID'] == family_id_int) &
-                    (df['StoreID'] == store_id_int) &
-                    (df['UserID'] == user_id)
+                # Чтение и запись - одной операцией в очереди записи otherpurch
+                # (с отложенной записью - в памяти и в журнале повтора)
+                action = db_handler.update_purchase(
+                    'otherpurch',
+                    {'UserID': user_id, 'FamilyID': family_id_int, 'ProdID': prod_id_int,
+                     'StoreID': store_id_int, 'Date': order_date_formatted},
+                    new_volume_gr, new_volume
                 )
                 
-                # Фильтруем по дате
-                date_matches = []
-                for idx in df[mask].index:
-                    date_val = df.loc[idx, 'Date']
-                    if pd.isna(date_val):
-                        continue
-                        
-                    if isinstance(date_val, (int, float)):
-                        try:
-                            date_dt = datetime.fromtimestamp(date_val)
-                            date_str = date_dt.strftime("%d.%m.%Y")
-                        except:
-                            date_str = str(date_val)
-                    else:
-                        date_str = str(date_val)
-                    
-                    if date_str == order_date_formatted:
-                        date_matches.append(idx)
-                
-                if date_matches:
-                    idx = date_matches[0]
-                    
-                    if new_volume_gr == 0:
-                        df = df.drop(idx)
+                if action is not None:
+                    if action == 'deleted':
                         print(f"🗑️ OtherPurch УДАЛЕН: ProdID {prod_id}, FamilyID {family_id_int}, StoreID {store_id_int}, UserID {user_id}, Date {order_date_formatted}")
                         message = "OtherPurch deleted successfully (volume reached 0)"
-                        action = "deleted"
                     else:
-                        df.loc[idx, 'TotalVolumeGr'] = new_volume_gr
-                        df.loc[idx, 'TotalVolume'] = new_volume
                         print(f"✅ OtherPurch обновлен: ProdID {prod_id}, VolumeGr: {new_volume_gr}, Volume: {new_volume}, UserID {user_id}")
                         message = "OtherPurch updated successfully"
-                        action = "updated"
-                    
-                    db_handler.save_excel(df, db_handler.other_purch_path)
-                    
                     return jsonify({
                         "status": "success",
                         "message": message,
@@ -902,6 +721,95 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
             print(f"❌ Ошибка при поиске: {str(e)}")
             return jsonify({"status": "error", "message": f"Ошибка сервера: {str(e)}"}), 500
     
+    # ==================== СИНХРОНИЗАЦИЯ (ЛЕНТА ИЗМЕНЕНИЙ) ====================
+    
+    @app.route('/sync/<table>', methods=['GET', 'POST'])
+    def sync_table(table):
+        """Изменения таблицы после версии клиента: вставленные, измененные и удаленные строки.
+        
+        Параметры (query string или JSON): since - seq из предыдущего ответа, user_id, family_id
+        (0 - личный аккаунт), limit. reset=true - версия клиента устарела или не указана:
+        загрузить таблицу целиком (get_main_purch и т.п.) и продолжить с seq ответа.
+        """
+        try:
+            if db_handler.change_feed is None:
+                return jsonify({"status": "error", "message": "Change feed is disabled"}), 404
+            if table not in SYNC_TABLES:
+                return jsonify({"status": "error", "message": f"Unknown table: {table}"}), 404
+            
+            data = request.get_json(silent=True)
+            data = data if isinstance(data, dict) else {}
+            
+            def param(name, default=None):
+                value = data.get(name)
+                return request.args.get(name, default) if value is None else value
+            
+            try:
+                since = param('since')
+                since = int(since) if since not in (None, '') else None
+                family_id = int(param('family_id', 0) or 0)
+                limit = max(1, min(int(param('limit', 1000)), 10000))
+            except (TypeError, ValueError) as e:
+                return jsonify({"status": "error", "message": f"Invalid parameter: {e}"}), 400
+            user_id = param('user_id')
+            if not user_id and (family_id == 0 or table == 'rationinfo'):
+                return jsonify({"status": "error", "message": "user_id is required"}), 400
+            
+            feed = db_handler.change_feed.changes(table, since, user_id, family_id, limit)
+            columnar = wants_columnar(data)
+            
+            def rows(records):
+                if not records:
+                    return []
+                df = pd.DataFrame(records)
+                # Пустые ячейки - NaN, как при чтении таблицы (сериализаторы различают их так же)
+                columns = SYNC_COLUMNS[table](df.where(df.notna(), float('nan')))
+                return serializers.columnar(columns) if columnar else serializers.tuples(columns)
+            
+            result = {
+                "status": "success",
+                "table": table,
+                "since": since,
+                "seq": feed["seq"],
+                "reset": feed["reset"],
+                "has_more": feed["has_more"],
+                "inserted": rows(feed["inserted"]),
+                "updated": rows(feed["updated"]),
+                "deleted": rows(feed["deleted"]),
+                "count": len(feed["inserted"]) + len(feed["updated"]) + len(feed["deleted"])
+            }
+            if columnar:
+                result["format"] = "columnar"
+            print(f"🔄 Синхронизация {table} с {since}: {result['count']} изменений, seq {feed['seq']}"
+                  f"{' (reset)' if feed['reset'] else ''}")
+            return jsonify(result)
+            
+        except Exception as e:
+            print(f"❌ Ошибка синхронизации {table}: {str(e)}")
+            return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+    
+    # ==================== МЕТРИКИ ====================
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Счетчики производительности хранилища"""
+        return jsonify({
+            "status": "success",
+            "storage_engine": db_handler.storage.name,
+            "dataframe_cache": db_handler.cache_stats(),
+            "journal": db_handler.journal_stats(),
+            "writer": db_handler.writer_stats(),
+            "commits": db_handler.commit_stats(),
+            "write_behind": db_handler.write_behind_stats(),
+            "maintenance": db_handler.maintenance_stats(),
+            "lock_stripes": db_handler.stripe_stats(),
+            "idempotency": idempotency_store.stats() if idempotency_store else {"enabled": False},
+            "etag": etag_tracker.stats() if etag_tracker else {"enabled": False},
+            "change_feed": db_handler.change_feed_stats(),
+            # Пулы потоков ASGI варианта сервера (asgi.py)
+            "asgi": current_app.extensions['portion_asgi'].stats() if 'portion_asgi' in current_app.extensions else {"enabled": False}
+        })
+
     # ==================== ИЗОБРАЖЕНИЯ ====================
     
     @app.route('/image/<int:prod_id>')
@@ -932,36 +840,23 @@ def register_routes(app, db_handler, images_dir, lavka_processor,
                     "error": "Excel file not found"
                 }), 404
         
-            # Читаем Excel файл
-            df = pd.read_excel(excel_path)
-        
-            # Проверяем наличие необходимых колонок
-            required_columns = ['ProdID', 'ProductURL']
-            for col in required_columns:
-                if col not in df.columns:
-                    return jsonify({
-                        "success": False,
-                        "error": f"Excel file must contain '{col}' column"
-                    }), 400
-        
-            # Ищем продукт по ProdID
-            product_row = df[df['ProdID'] == prod_id]
-        
-            if not product_row.empty:
-                # Получаем URL из первого найденного ряда
-                url_value = product_row.iloc[0]['ProductURL']
-            
-                # Проверяем, что значение не NaN/None и не пустая строка
-                if pd.notna(url_value):
-                    url = str(url_value).strip()
-                    if url and url.lower() != 'nan':
-                        return jsonify({
-                            "success": True,
-                            "data": {
-                                "prodID": prod_id,
-                                "url": url
-                            }
-                        })
+            # Ссылки из каталога (prodlinks разбирается один раз на версию файла)
+            try:
+                url = catalog.product_url(prod_id)
+            except ProdLinksFormatError as e:
+                return jsonify({
+                    "success": False,
+                    "error": str(e)
+                }), 400
+            
+            if url:
+                return jsonify({
+                    "success": True,
+                    "data": {
+                        "prodID": prod_id,
+                        "url": url
+                    }
+                })
         
             # Если продукт не найден или URL пустой
             return jsonify({
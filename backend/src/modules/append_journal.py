@@ -0,0 +1,335 @@
+"""
+Журнал вставок (append-only, JSON lines) для AllPurch и RationInfo с фоновым уплотнением
+"""
+
+import os
+import json
+import glob
+import time
+import threading
+import numpy as np
+import pandas as pd
+
+from modules.storage_engines import staging_path
+
+
+def _json_default(value):
+    """Приведение numpy-значений к JSON"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if value is pd.NaT or value is pd.NA:
+        return None
+    raise TypeError(f"Значение {value!r} не сериализуется в JSON")
+
+
+class AppendJournal:
+    """Журнал вставок одной таблицы.
+
+    Активный файл `<name>.journal.jsonl` принимает новые строки. При уплотнении он
+    переименовывается в сегмент `<name>.journal.<generation>.jsonl`, сегмент вливается
+    в основную таблицу, номер последнего влитого поколения фиксируется тем же коммитом,
+    что и таблица: в `<name>.journal.state` (публикуется через CommitLog) или отметкой
+    движка хранения (folded_source). Влитые сегменты удаляются после коммита и при
+    старте; до удаления они уже не читаются - строки не попадают в таблицу дважды.
+    Вставки общего коммита нескольких таблиц публикуются тем же коммитом отдельным файлом
+    `<name>.journal.commit-<token>.jsonl` (stage_records) и при запечатывании становятся сегментами.
+    kind - суффикс файлов (например, 'redo' для журнала отложенных обновлений).
+    """
+
+    def __init__(self, base_path, fsync=True, kind='journal', folded_source=None):
+        root, _ = os.path.splitext(base_path)
+        self.name = f"{os.path.basename(root)}.{kind}"
+        self.active_path = f"{root}.{kind}.jsonl"
+        self.state_path = f"{root}.{kind}.state"
+        self._segment_prefix = f"{root}.{kind}."
+        self.fsync = fsync
+        # folded_source(name) - влитое поколение, сохраненное движком хранения (или None)
+        self.folded_source = folded_source
+        self.lock = threading.RLock()
+
+        # Прочитанные записи: путь -> (inode, прочитано байт, список записей)
+        self._loaded = {}
+        self._recover()
+
+        # Время первой записи в активный файл (для порога уплотнения по времени)
+        self._active_since = os.path.getmtime(self.active_path) if os.path.exists(self.active_path) else None
+
+    # ---------- состояние и сегменты ----------
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"folded_generation": 0}
+
+    def _write_state_file(self, path, generation):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"folded_generation": generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _folded(self):
+        """Последнее влитое поколение (из файла состояния или отметки движка хранения)"""
+        folded = self._read_state().get("folded_generation", 0)
+        if self.folded_source is not None:
+            folded = max(folded, self.folded_source(self.name) or 0)
+        return folded
+
+    def _segments(self):
+        """Запечатанные сегменты в порядке поколений: [(generation, path)]"""
+        segments = []
+        for path in glob.glob(glob.escape(self._segment_prefix) + '*.jsonl'):
+            middle = path[len(self._segment_prefix):-len('.jsonl')]
+            if middle.isdigit():
+                segments.append((int(middle), path))
+        return sorted(segments)
+
+    def _committed(self):
+        """Файлы вставок, опубликованные общими коммитами, в порядке публикации"""
+        paths = glob.glob(glob.escape(self._segment_prefix) + 'commit-*.jsonl')
+        return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+    def _pending_segments(self):
+        """Сегменты, еще не влитые в таблицу"""
+        folded = self._folded()
+        return [(generation, path) for generation, path in self._segments() if generation > folded]
+
+    def _recover(self):
+        """Удаляет сегменты, которые уже влиты в таблицу (сбой между вливанием и удалением)"""
+        folded = self._folded()
+        for generation, path in self._segments():
+            if generation <= folded:
+                os.remove(path)
+                print(f"🧹 Журнал: удален уже влитый сегмент {os.path.basename(path)}")
+
+    # ---------- запись ----------
+
+    def _payload(self, records):
+        return ''.join(
+            json.dumps(record, ensure_ascii=False, default=_json_default) + '\n'
+            for record in records
+        )
+
+    def append(self, records):
+        """Добавление записей в журнал (O(1) относительно размера таблицы)"""
+        if not records:
+            return 0
+        payload = self._payload(records)
+        with self.lock:
+            if self._active_since is None:
+                self._active_since = time.time()
+            with open(self.active_path, 'a', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+        return len(records)
+
+    def stage_records(self, records, token):
+        """Записи во временном файле для публикации общим коммитом: (временный файл, файл вставок).
+
+        После публикации файл читается вместе с журналом; без маркера коммита временный файл
+        удаляется восстановлением CommitLog - записи не попадают в журнал без остальных таблиц.
+        """
+        committed_path = f"{self._segment_prefix}commit-{token}.jsonl"
+        tmp_path = staging_path(committed_path, token)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self._payload(records))
+        return (tmp_path, committed_path)
+
+    # ---------- чтение ----------
+
+    def _read_file(self, path):
+        """Инкрементальное чтение файла журнала: дочитываются только новые строки"""
+        inode, offset, records = self._loaded.get(path, (None, 0, []))
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._loaded.pop(path, None)
+            return []
+        size = stat.st_size
+        if stat.st_ino != inode or size < offset:
+            # Файл подменен (например, запечатан и создан заново другим процессом) - читаем с начала
+            inode, offset, records = stat.st_ino, 0, []
+            self._loaded[path] = (inode, offset, records)
+        if size > offset:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read(size - offset)
+            # Недописанную последнюю строку оставляем до следующего чтения
+            complete = chunk[:chunk.rfind(b'\n') + 1]
+            records = records + [json.loads(line) for line in complete.decode('utf-8').splitlines() if line]
+            offset += len(complete)
+            self._loaded[path] = (inode, offset, records)
+        return records
+
+    def records(self):
+        """Все еще не влитые в таблицу записи (сегменты + активный файл)"""
+        with self.lock:
+            result = []
+            for _, path in self._pending_segments():
+                result.extend(self._read_file(path))
+            for path in self._committed():
+                result.extend(self._read_file(path))
+            result.extend(self._read_file(self.active_path))
+            return result
+
+    def signature(self):
+        """Версия журнала для ключа кэша"""
+        with self.lock:
+            parts = [(path, os.path.getsize(path)) for _, path in self._pending_segments()]
+            parts.extend((path, os.path.getsize(path)) for path in self._committed())
+            if os.path.exists(self.active_path):
+                parts.append((self.active_path, os.path.getsize(self.active_path)))
+            return tuple(parts)
+
+    def size_bytes(self):
+        return sum(size for _, size in self.signature())
+
+    def age_seconds(self):
+        """Возраст самой старой не влитой записи"""
+        with self.lock:
+            if self._pending_segments():
+                # Запечатанные сегменты ждут вливания после сбоя - уплотняем сразу
+                return float('inf')
+            since = [os.path.getmtime(path) for path in self._committed()]
+            if self._active_since is not None:
+                since.append(self._active_since)
+            return time.time() - min(since) if since else 0
+
+    # ---------- уплотнение ----------
+
+    def seal(self):
+        """Запечатывает файлы вставок общих коммитов и активный файл в новые сегменты
+        (дальнейшие вставки идут в новый файл). Вызывать под исключительной блокировкой таблицы."""
+        with self.lock:
+            sources = self._committed()
+            if os.path.exists(self.active_path) and os.path.getsize(self.active_path) > 0:
+                sources.append(self.active_path)
+            if not sources:
+                return None
+            segments = self._segments()
+            generation = max([g for g, _ in segments] + [self._folded()])
+            for path in sources:
+                generation += 1
+                segment_path = f"{self._segment_prefix}{generation}.jsonl"
+                os.replace(path, segment_path)
+                # Уже прочитанные записи переходят к сегменту без повторного разбора
+                if path in self._loaded:
+                    self._loaded[segment_path] = self._loaded.pop(path)
+            self._active_since = None
+            return segment_path
+
+    def pending_generation(self):
+        """Запечатывает активный файл и возвращает последнее не влитое поколение
+        (None - журнал пуст). Записи до него включительно вливаются одним коммитом."""
+        with self.lock:
+            self.seal()
+            segments = self._pending_segments()
+            return segments[-1][0] if segments else None
+
+    def stage_state(self, generation, token):
+        """Файл состояния с влитым поколением во временном файле: (временный файл, файл состояния)
+        для публикации вместе с таблицей через CommitLog"""
+        tmp_path = staging_path(self.state_path, token)
+        self._write_state_file(tmp_path, generation)
+        return (tmp_path, self.state_path)
+
+    def mark_folded(self, generation):
+        """Фиксация влитого поколения отдельной записью (движок не публикует его вместе с таблицей)"""
+        tmp_path = self.state_path + '.tmp'
+        self._write_state_file(tmp_path, generation)
+        os.replace(tmp_path, self.state_path)
+
+    def forget(self, generation):
+        """Удаление сегментов, влитых в таблицу (поколения до generation включительно)"""
+        with self.lock:
+            for segment_generation, path in self._segments():
+                if segment_generation <= generation:
+                    os.remove(path)
+                    self._loaded.pop(path, None)
+
+    def fold(self, write):
+        """Вливает все сегменты в таблицу.
+
+        write(DataFrame, generation) должна записать строки в таблицу вместе с отметкой
+        о влитом поколении (одним коммитом); сегменты удаляются после нее.
+        """
+        with self.lock:
+            generation = self.pending_generation()
+            if generation is None:
+                return 0
+            records = []
+            for _, path in self._pending_segments():
+                records.extend(self._read_file(path))
+            write(pd.DataFrame(records), generation)
+            self.forget(generation)
+            return len(records)
+
+
+class JournalCompactor:
+    """Фоновое уплотнение журналов по размеру или по времени"""
+
+    def __init__(self, db_handler, max_bytes=256 * 1024, max_age_seconds=60, check_interval=5):
+        self.db_handler = db_handler
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.check_interval = check_interval
+        self.compactions = 0
+        self.folded_rows = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            # Повторный запуск - после stop() или в процессе-воркере после fork
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='journal-compactor', daemon=True)
+            self._thread.start()
+            print(f"🗜️  Компактор журналов запущен (порог {self.max_bytes} байт / {self.max_age_seconds} с)")
+
+    def stop(self, wait=False):
+        self._stopped.set()
+        self._wakeup.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def notify(self, journal):
+        """Вызывается после вставки: будит компактор при превышении порога размера"""
+        if journal.size_bytes() >= self.max_bytes:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            for table, journal in self.db_handler.journals.items():
+                try:
+                    if journal.size_bytes() == 0:
+                        continue
+                    if journal.size_bytes() >= self.max_bytes or journal.age_seconds() >= self.max_age_seconds:
+                        self.compact(table)
+                except Exception as e:
+                    print(f"❌ Ошибка уплотнения журнала {table}: {e}")
+
+    def compact(self, table):
+        """Вливает журнал таблицы в основное хранилище"""
+        rows = self.db_handler.compact_journal(table)
+        self.compactions += 1
+        self.folded_rows += rows
+        return rows
+
+    def stats(self):
+        return {
+            "compactions": self.compactions,
+            "folded_rows": self.folded_rows,
+            "pending_bytes": {table: journal.size_bytes() for table, journal in self.db_handler.journals.items()}
+        }
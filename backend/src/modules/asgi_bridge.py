@@ -0,0 +1,192 @@
+"""
+ASGI вариант сервера: маршруты Flask (register_routes) выполняются в ограниченных пулах потоков
+"""
+
+import io
+import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Легкие запросы (файл или словарь в памяти) - в своем пуле, не ждут тяжелых выборок
+LIGHT_PREFIXES = ('/image/', '/product_link/')
+LIGHT_PATHS = ('/', '/config', '/metrics')
+
+
+def build_environ(scope, body):
+    """WSGI environ (PEP 3333) для HTTP запроса ASGI"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': str(client[0]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Выполнение WSGI приложения целиком: (статус, заголовки ASGI, тело)"""
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                chunks.append(chunk)
+    finally:
+        close = getattr(result, 'close', None)
+        if close is not None:
+            close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+class _Lane:
+    """Пул потоков для одного вида запросов и его счетчики"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'asgi-{name}')
+        self._guard = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    async def run(self, func, *args):
+        with self._guard:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._timed, time.perf_counter(), func, args)
+        finally:
+            with self._guard:
+                self.in_flight -= 1
+
+    def _timed(self, submitted, func, args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            finished = time.perf_counter()
+            with self._guard:
+                self.requests += 1
+                self.wait_seconds += started - submitted
+                self.max_wait_seconds = max(self.max_wait_seconds, started - submitted)
+                self.busy_seconds += finished - started
+
+    def stats(self):
+        with self._guard:
+            return {
+                "workers": self.workers,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "avg_queue_wait_ms": round(self.wait_seconds / self.requests * 1000, 2) if self.requests else 0.0,
+                "max_queue_wait_ms": round(self.max_wait_seconds * 1000, 2),
+                "avg_handler_ms": round(self.busy_seconds / self.requests * 1000, 2) if self.requests else 0.0
+            }
+
+
+class AsgiBridge:
+    """ASGI приложение поверх Flask: цикл событий принимает запросы, обработчики (pandas,
+    чтение таблиц) выполняются в пулах потоков.
+
+    Тяжелые запросы (выборки, заказы, статистика) - в пуле из workers потоков, легкие
+    (LIGHT_PREFIXES/LIGHT_PATHS: картинки, ссылки, служебные) - в отдельном пуле из
+    light_workers потоков, поэтому они не стоят в очереди за тяжелыми. Пока все потоки
+    пула заняты, новые запросы ждут в очереди пула, не занимая цикл событий.
+    on_shutdown вызывается при остановке сервера (lifespan).
+    """
+
+    def __init__(self, wsgi_app, workers=8, light_workers=2, on_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.on_shutdown = on_shutdown
+        self.lanes = {'heavy': _Lane('heavy', workers), 'light': _Lane('light', light_workers)}
+        extensions = getattr(wsgi_app, 'extensions', None)
+        if extensions is not None:
+            # Счетчики пулов в /metrics
+            extensions['portion_asgi'] = self
+
+    def lane_for(self, path):
+        if path in LIGHT_PATHS or path.startswith(LIGHT_PREFIXES):
+            return self.lanes['light']
+        return self.lanes['heavy']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Неподдерживаемый тип соединения ASGI: {scope['type']}")
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.extend(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        try:
+            status, headers, content = await self.lane_for(scope['path']).run(
+                lambda: call_wsgi(self.wsgi_app, build_environ(scope, bytes(body)))
+            )
+        except Exception as e:
+            print(f"❌ Ошибка обработки {scope['path']}: {e}")
+            status, headers, content = 500, [(b'content-type', b'text/plain; charset=utf-8')], b'Internal Server Error'
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for lane in self.lanes.values():
+                    await asyncio.to_thread(lane.executor.shutdown, True)
+                if self.on_shutdown is not None:
+                    await asyncio.to_thread(self.on_shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
@@ -0,0 +1,432 @@
+"""
+Лента изменений таблиц (CDC): номер на каждое изменение строки, удаления - как надгробия
+
+Клиент, у которого уже есть данные на номер since, получает только строки, вставленные,
+измененные и удаленные после него (/sync/<table>?since=...), а не всю таблицу заново.
+"""
+
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from contextlib import closing
+import numpy as np
+import pandas as pd
+
+from modules.aggregation import OWNER_COLUMNS
+from modules.storage_engines import ROWID_COLUMN
+
+# Таблицы с ключом (MainPurch/OtherPurch): изменения - разница строк владельца по ключу
+KEYED_TABLES = ('mainpurch', 'otherpurch')
+# Таблицы, которые только растут: каждое изменение - вставка
+APPEND_TABLES = ('allpurch', 'rationinfo')
+SYNC_TABLES = KEYED_TABLES + APPEND_TABLES
+# Таблицы без FamilyID - изменения выбираются только по пользователю
+USER_TABLES = ('rationinfo',)
+
+
+def _plain(value):
+    """Значение ячейки для JSON: numpy - в Python, NaN и пустые значения - None"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if value is pd.NaT:
+        return None
+    return value
+
+
+def _records(df):
+    return [{column: _plain(value) for column, value in record.items()} for record in df.to_dict('records')]
+
+
+def _key_value(value):
+    # 101 и 101.0 (колонка с пропусками) - один ключ
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _family_id(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _owners(df):
+    """Пары (UserID, FamilyID) строк; FamilyID - число, пустой UserID - ''"""
+    user = df['UserID'].fillna('').astype(str) if 'UserID' in df.columns else pd.Series('', index=df.index)
+    if 'FamilyID' in df.columns:
+        family = pd.to_numeric(df['FamilyID'], errors='coerce').fillna(0).astype(np.int64)
+    else:
+        family = pd.Series(0, index=df.index, dtype=np.int64)
+    return pd.MultiIndex.from_arrays([user.to_numpy(), family.to_numpy()], names=OWNER_COLUMNS)
+
+
+def _row_digests(df, columns):
+    df = df.reindex(columns=columns)
+    for column in columns:
+        # Целые и вещественные с тем же значением должны совпасть (колонка могла стать float)
+        if df[column].dtype.kind in 'iub':
+            df[column] = df[column].astype(float)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def changed_owners(before, after):
+    """Владельцы, у которых строки таблицы различаются (хеши строк и их число) - O(строк)"""
+    columns = sorted(set(before.columns) | set(after.columns), key=str)
+    before_digests, after_digests = _row_digests(before, columns), _row_digests(after, columns)
+    before_owners, after_owners = _owners(before), _owners(after)
+    owners = set(before_owners[~np.isin(before_digests, after_digests)])
+    owners.update(after_owners[~np.isin(after_digests, before_digests)])
+    # Удаленный или добавленный дубль строки хеши не меняет - сравниваем число строк
+    before_counts = pd.Series(1, index=before_owners).groupby(level=[0, 1]).size()
+    after_counts = pd.Series(1, index=after_owners).groupby(level=[0, 1]).size()
+    difference = before_counts.sub(after_counts, fill_value=0)
+    owners.update(difference.index[difference != 0])
+    return owners
+
+
+def _canonical(spec, df, owners):
+    """Строки владельцев в канонической форме (дубли ключа агрегированы): {ключ: строка}"""
+    if df.empty or not owners:
+        return {}
+    rows = df[_owners(df).isin(list(owners))]
+    if rows.empty:
+        return {}
+    result = {}
+    for record in _records(spec.rebuild(rows)):
+        result[tuple(_key_value(record.get(column)) for column in spec.key)] = record
+    return result
+
+
+def keyed_changes(spec, before, after, owners=None):
+    """Изменения таблицы с ключом: [(таблица, операция, ключ, строка)].
+
+    Сравниваются агрегированные по ключу строки владельцев, у которых что-то изменилось
+    (owners - если известны заранее), поэтому перезапись в канонической форме (чистка)
+    изменений не дает. Для удаления строка - последняя версия удаленной строки.
+    """
+    before = before.drop(columns=[ROWID_COLUMN], errors='ignore')
+    after = after.drop(columns=[ROWID_COLUMN], errors='ignore')
+    if owners is None:
+        owners = changed_owners(before, after)
+    old, new = _canonical(spec, before, owners), _canonical(spec, after, owners)
+    changes = []
+    for key, row in new.items():
+        previous = old.get(key)
+        if previous is None:
+            changes.append((spec.table, 'insert', key, row))
+        elif previous != row:
+            changes.append((spec.table, 'update', key, row))
+    for key, row in old.items():
+        if key not in new:
+            changes.append((spec.table, 'delete', key, row))
+    return changes
+
+
+def inserted_changes(table, df):
+    """Вставка строк в таблицу, которая только растет: [(таблица, 'insert', None, строка)]"""
+    return [(table, 'insert', None, row) for row in _records(df)]
+
+
+def coalesce(entries):
+    """Свертка изменений окна по строке: (вставлены, изменены, удалены) - последние версии строк.
+
+    entries - (seq, операция, ключ, строка) по возрастанию seq. Строка, которая появилась
+    и исчезла внутри окна, не возвращается вовсе.
+    """
+    state = {}
+    for seq, op, row_key, row in entries:
+        identity = row_key if row_key is not None else seq
+        current = state.get(identity)
+        if current is None:
+            state[identity] = [op, op, row]
+        else:
+            current[1], current[2] = op, row
+    inserted, updated, deleted = [], [], []
+    for first_op, last_op, row in state.values():
+        existed, exists = first_op != 'insert', last_op != 'delete'
+        if existed and exists:
+            updated.append(row)
+        elif exists:
+            inserted.append(row)
+        elif existed:
+            deleted.append(row)
+    return inserted, updated, deleted
+
+
+class UnrecordedMarker:
+    """Отметка `changes.unrecorded` рядом с таблицами: таблицы менялись процессом без ленты.
+
+    Процесс без ленты создает ее после каждой записи таблиц ленты, процесс с лентой забирает
+    (удаляет) и поднимает границу ленты - клиенты получают reset вместо ленты без этих записей.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def touch(self):
+        if not os.path.exists(self.path):
+            with open(self.path, 'a', encoding='utf-8'):
+                pass
+
+    def take(self):
+        """Удаление отметки; True - она была (записи без ленты были до этого момента)"""
+        try:
+            os.remove(self.path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class ChangeFeed:
+    """Лента изменений (SQLite, общая для процессов сервера): seq - сквозной номер изменения.
+
+    Изменения записываются после записи таблицы под ее блокировкой, поэтому порядок seq
+    совпадает с порядком записей. Записи старше retention_seconds удаляются; клиент, чья
+    версия старше удаленной части ленты (или не указана, или 0), получает reset - загрузить
+    данные целиком и продолжить с возвращенного seq. Если лента не может подтвердить, что
+    видела все записи таблиц (запуск процесса - до него лента могла быть выключена или
+    процесс упал между записью таблицы и ленты; запись процессом без ленты; ошибка записи
+    ленты), граница поднимается выше всех выданных версий (пропуск) - клиенты тоже получают
+    reset, а не ленту без потерянных изменений.
+    """
+
+    def __init__(self, db_path, retention_seconds=30 * 24 * 3600):
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self._guard = threading.Lock()
+        self._since_purge = 0
+        # Потерянные изменения, о которых клиентам еще не сообщено (граница не поднята)
+        self._gap_pending = False
+        self._unrecorded = None
+        self.recorded = 0
+        self.failed = 0
+        self.gaps = 0
+        self.syncs = 0
+        self.resets = 0
+        self.rows_sent = 0
+
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tbl TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    family_id INTEGER NOT NULL,
+                    op TEXT NOT NULL,
+                    row_key TEXT,
+                    row TEXT NOT NULL,
+                    created REAL NOT NULL
+                )''')
+                conn.execute('CREATE INDEX IF NOT EXISTS changes_family ON changes (tbl, family_id, seq)')
+                conn.execute('CREATE INDEX IF NOT EXISTS changes_user ON changes (tbl, user_id, family_id, seq)')
+                conn.execute('CREATE INDEX IF NOT EXISTS changes_created ON changes (created)')
+                conn.execute('CREATE TABLE IF NOT EXISTS feed_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.purge()
+        # Что происходило с таблицами до запуска, лента не видела - выданные версии устаревают
+        with self._guard:
+            self._gap_pending = True
+        self._close_gap()
+
+    def watch(self, marker):
+        """Отметка записей без ленты (UnrecordedMarker), которая проверяется перед каждой выдачей"""
+        self._unrecorded = marker
+        self._take_unrecorded()
+
+    def _take_unrecorded(self):
+        if self._unrecorded is not None and self._unrecorded.take():
+            print("⚠️ Лента изменений: таблицы менялись процессом без ленты - клиентам будет reset")
+            with self._guard:
+                self._gap_pending = True
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def record(self, changes):
+        """Запись изменений одной транзакцией (вызывать под блокировкой измененных таблиц).
+
+        Ошибка записи ленты не отменяет уже записанное изменение таблицы: она печатается,
+        считается в stats()["failed"], а граница ленты поднимается (_mark_gap) - клиенты
+        получают reset.
+        """
+        if not changes:
+            return
+        self._close_gap()
+        now = time.time()
+        rows = []
+        for table, op, key, row in changes:
+            rows.append((
+                table,
+                str(row.get('UserID') or ''),
+                _family_id(row.get('FamilyID')),
+                op,
+                json.dumps(key, ensure_ascii=False, default=str) if key is not None else None,
+                json.dumps(row, ensure_ascii=False, default=str),
+                now
+            ))
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.executemany(
+                        'INSERT INTO changes (tbl, user_id, family_id, op, row_key, row, created) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        rows
+                    )
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as e:
+            with self._guard:
+                self.failed += len(rows)
+                self._gap_pending = True
+            print(f"❌ Лента изменений: не записано {len(rows)} изменений ({e}) - клиентам будет reset")
+            self._close_gap()
+            return
+
+        with self._guard:
+            self.recorded += len(rows)
+            self._since_purge += 1
+            purge = self._since_purge >= 100
+        if purge:
+            self.purge()
+
+    def changes(self, table, since, user_id, family_id=0, limit=1000):
+        """Изменения таблицы после since у пользователя (family_id=0) или семьи.
+
+        Возвращает {"reset", "seq", "has_more", "inserted", "updated", "deleted"}: seq - версия
+        для следующего запроса; has_more - в ленте есть еще изменения (запросить с seq).
+        """
+        self._take_unrecorded()
+        # Пропуск, который не удалось отметить в базе, - в этом процессе ленте не верим
+        gap = not self._close_gap()
+        if table in USER_TABLES:
+            scope, params = 'user_id = ?', (str(user_id or ''),)
+        elif int(family_id):
+            scope, params = 'family_id = ?', (int(family_id),)
+        else:
+            scope, params = 'user_id = ? AND family_id = 0', (str(user_id or ''),)
+
+        with closing(self._connect()) as conn:
+            # Одна транзакция чтения - строки и последний номер одной версии ленты
+            conn.execute('BEGIN')
+            try:
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+                last_seq = row[0] if row else 0
+                row = conn.execute("SELECT value FROM feed_meta WHERE name = 'horizon'").fetchone()
+                horizon = row[0] if row else 0
+                reset = gap or since is None or since <= 0 or since < horizon or since > last_seq
+                entries = []
+                if not reset:
+                    entries = conn.execute(
+                        f'SELECT seq, op, row_key, row FROM changes WHERE tbl = ? AND {scope} AND seq > ? '
+                        'ORDER BY seq LIMIT ?',
+                        (table,) + params + (since, limit + 1)
+                    ).fetchall()
+            finally:
+                conn.execute('COMMIT')
+
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        seq = entries[-1][0] if has_more else last_seq
+        inserted, updated, deleted = coalesce(
+            (entry_seq, op, row_key, json.loads(row)) for entry_seq, op, row_key, row in entries
+        )
+        with self._guard:
+            self.syncs += 1
+            self.resets += int(reset)
+            self.rows_sent += len(inserted) + len(updated) + len(deleted)
+        return {
+            "reset": reset,
+            "seq": seq,
+            "has_more": has_more,
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted
+        }
+
+    def _mark_gap(self):
+        """Пропуск в ленте: граница поднимается до нового номера, все выданные версии ниже нее"""
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Номер пропуска берется из той же последовательности, что и номера изменений
+                seq = conn.execute(
+                    "INSERT INTO changes (tbl, user_id, family_id, op, row_key, row, created) "
+                    "VALUES ('', '', 0, 'gap', NULL, '{}', ?)", (time.time(),)
+                ).lastrowid
+                conn.execute('DELETE FROM changes WHERE seq = ?', (seq,))
+                conn.execute("INSERT OR REPLACE INTO feed_meta (name, value) VALUES ('horizon', ?)", (seq,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return seq
+
+    def _close_gap(self):
+        """Отметка ожидающего пропуска; False - отметить пока не удалось"""
+        with self._guard:
+            if not self._gap_pending:
+                return True
+        try:
+            seq = self._mark_gap()
+        except sqlite3.Error as e:
+            print(f"❌ Лента изменений: не удалось отметить пропуск ({e})")
+            return False
+        with self._guard:
+            self._gap_pending = False
+            self.gaps += 1
+        print(f"⚠️ Лента изменений: пропуск отмечен, граница поднята до {seq}")
+        return True
+
+    def purge(self):
+        """Удаление изменений старше retention_seconds (граница удаленной части - horizon)"""
+        with self._guard:
+            self._since_purge = 0
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cutoff = conn.execute('SELECT MAX(seq) FROM changes WHERE created < ?',
+                                      (time.time() - self.retention_seconds,)).fetchone()[0]
+                removed = 0
+                if cutoff is not None:
+                    removed = conn.execute('DELETE FROM changes WHERE seq <= ?', (cutoff,)).rowcount
+                    # Граница не опускается ниже отмеченного пропуска
+                    conn.execute("INSERT INTO feed_meta (name, value) VALUES ('horizon', ?) "
+                                 "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)", (cutoff,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return removed
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM changes').fetchone()[0]
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+            horizon = conn.execute("SELECT value FROM feed_meta WHERE name = 'horizon'").fetchone()
+        with self._guard:
+            return {
+                "enabled": True,
+                "seq": row[0] if row else 0,
+                "horizon": horizon[0] if horizon else 0,
+                "entries": entries,
+                "recorded": self.recorded,
+                "failed": self.failed,
+                "gaps": self.gaps,
+                "syncs": self.syncs,
+                "resets": self.resets,
+                "rows_sent": self.rows_sent,
+                "retention_seconds": self.retention_seconds
+            }
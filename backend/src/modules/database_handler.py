@@ -4,13 +4,34 @@
 
 import pandas as pd
 import os
-from datetime import datetime, timedelta
+import math
+from datetime import datetime, timedelta, time as dt_time
 import random
+import threading
+from contextlib import nullcontext, contextmanager, ExitStack
+
+from modules.storage_engines import create_storage_engine, file_signature, filter_range, ExcelStorageEngine
+from modules.dataframe_cache import get_dataframe_cache
+from modules.append_journal import AppendJournal, JournalCompactor
+from modules.partitioned_storage import MonthPartitionedEngine
+from modules.purch_index import OwnerIndex, INDEXED_TABLES
+from modules.aggregation import AGGREGATION_SPECS
+from modules.timestamp_index import TimestampIndex
+from modules.product_catalog import ProductCatalog
+from modules.table_writer import TableWriter
+from modules.multi_commit import CommitLog, new_commit_token
+from modules.write_behind import WriteBehindFlusher, apply_updates, volume_update
+from modules.maintenance import PurchaseVacuum, CleanMarker, canonical_form
+from modules.lock_striping import StripedLocks, owner_key
+from modules.change_feed import keyed_changes, inserted_changes, UnrecordedMarker, APPEND_TABLES, SYNC_TABLES
 
 class DatabaseHandler:
     """Обработчик базы данных с новой структурой"""
     
-    def __init__(self, orders_dir, users_dir, products_dir):
+    def __init__(self, orders_dir, users_dir, products_dir, storage_engine='excel', sqlite_path=None,
+                 journal=False, journal_options=None, partitioned=False, prodlinks_path=None,
+                 group_commit_ms=None, write_behind=False, write_behind_options=None,
+                 vacuum_interval=None, lock_stripes=None, change_feed=None):
         self.orders_dir = orders_dir
         self.users_dir = users_dir
         self.products_dir = products_dir
@@ -22,24 +43,882 @@ class DatabaseHandler:
         self.ration_info_path = os.path.join(users_dir, 'rationinfo.xlsx')
         self.products_db_path = os.path.join(products_dir, 'appdb2.xlsx')
         self.images_dir = os.path.join(products_dir, 'images')
+        self.prodlinks_path = prodlinks_path or os.path.join(products_dir, 'prodlinks.xlsx')
+        
+        # Логические таблицы -> пути legacy файлов
+        self.table_paths = {
+            'mainpurch': self.main_purch_path,
+            'otherpurch': self.other_purch_path,
+            'allpurch': self.all_purch_path,
+            'rationinfo': self.ration_info_path,
+            'appdb2': self.products_db_path
+        }
+        self._path_tables = {os.path.abspath(path): table for table, path in self.table_paths.items()}
+        
+        # Общий кэш прочитанных таблиц
+        self.cache = get_dataframe_cache()
+        
+        # Изменения таблиц - по одному на таблицу, под блокировкой `<table>.lock` (между процессами);
+        # group_commit_ms - окно, в течение которого вставки собираются в одну запись
+        lock_paths = {table: os.path.splitext(path)[0] + '.lock' for table, path in self.table_paths.items()}
+        self.writer = TableWriter(lock_paths, group_window=group_commit_ms / 1000 if group_commit_ms else None)
+        
+        # Общие коммиты нескольких таблиц (заказ публикует AllPurch, MainPurch и OtherPurch вместе)
+        self.commit_log = CommitLog(os.path.join(os.path.dirname(orders_dir), 'commits'))
+        self._transactions = threading.local()
+        self._recover_commits()
+        
+        # Движок хранения (excel - legacy по умолчанию, sqlite - встроенная база)
+        if sqlite_path is None:
+            sqlite_path = os.path.join(os.path.dirname(orders_dir), 'portion.sqlite3')
+        self.storage = create_storage_engine(storage_engine, self.table_paths, sqlite_path=sqlite_path)
+        if partitioned:
+            # AllPurch и RationInfo хранятся помесячными партициями (orders/allpurch/2026-10.*);
+            # раскладка существующей таблицы публикуется одним коммитом (после восстановления выше)
+            self.storage = MonthPartitionedEngine(self.storage, commit_log=self.commit_log)
+        
+        # Каталог товаров (appdb2 + prodlinks), общий для заказов, поиска и ссылок
+        self.catalog = ProductCatalog(self, self.prodlinks_path)
+        
+        # Журнал вставок для таблиц, которые только растут (AllPurch, RationInfo)
+        self.journals = {}
+        self.compactor = None
+        if journal:
+            journal_options = dict(journal_options or {})
+            fsync = journal_options.pop('fsync', True)
+            for table in ('allpurch', 'rationinfo'):
+                self.journals[table] = AppendJournal(self.table_paths[table], fsync=fsync,
+                                                     folded_source=self.storage.read_mark)
+            self.compactor = JournalCompactor(self, **journal_options)
+            self.compactor.start()
+        
+        # Отложенная запись обновлений объема MainPurch/OtherPurch: обновление сразу видно
+        # при чтении и сохраняется в журнал повтора, таблица перезаписывается пачкой
+        self.redo_logs = {}
+        self.flusher = None
+        write_behind_options = dict(write_behind_options or {})
+        fsync = write_behind_options.pop('fsync', True)
+        for table in INDEXED_TABLES:
+            redo = AppendJournal(self.table_paths[table], fsync=fsync, kind='redo',
+                                 folded_source=self.storage.read_mark)
+            if write_behind or redo.size_bytes():
+                self.redo_logs[table] = redo
+        if write_behind:
+            self.flusher = WriteBehindFlusher(self, **write_behind_options)
+            self.flusher.start()
+        else:
+            # Обновления, оставшиеся от запуска с отложенной записью, сразу вливаем в таблицы
+            for table in list(self.redo_logs):
+                self.flush_write_behind(table)
+                del self.redo_logs[table]
+        
+        # Периодическая перезапись MainPurch/OtherPurch в канонической форме; пока таблица
+        # не менялась после чистки, чтение не агрегирует строки повторно
+        self.clean_markers = {table: CleanMarker(self.table_paths[table]) for table in AGGREGATION_SPECS}
+        self.vacuum = None
+        if vacuum_interval:
+            self.vacuum = PurchaseVacuum(self, interval_seconds=vacuum_interval)
+            self.vacuum.start()
+        
+        # Полосы блокировок по владельцу: заказы и обновления объема разных семей меняют
+        # свои строки параллельно (нужен движок, который меняет отдельные строки - sqlite)
+        self.stripes = None
+        if lock_stripes:
+            if self.storage.supports_row_updates:
+                self.stripes = StripedLocks(lock_paths, INDEXED_TABLES, stripes=lock_stripes)
+            else:
+                print(f"⚠️ Полосы блокировок не поддерживаются движком {self.storage.name} - блокировка таблиц целиком")
+        
+        # Лента изменений MainPurch/OtherPurch/AllPurch/RationInfo для /sync/<table>; без ленты
+        # записи этих таблиц отмечаются в changes.unrecorded - процесс с лентой поднимет ее границу
+        self.change_feed = change_feed
+        self.unrecorded = UnrecordedMarker(os.path.join(os.path.dirname(orders_dir), 'changes.unrecorded'))
+        if change_feed is not None:
+            change_feed.watch(self.unrecorded)
         
         print(f"📁 DatabaseHandler инициализирован с новой структурой")
         print(f"   Orders Dir: {orders_dir}")
         print(f"   Users Dir: {users_dir}")
         print(f"   Products Dir: {products_dir}")
+        print(f"   Storage Engine: {self.storage.name}")
+        print(f"   Journal: {', '.join(self.journals) if self.journals else 'выключен'}")
+        print(f"   Group commit: {f'{group_commit_ms} мс' if group_commit_ms else 'выключен'}")
+        print(f"   Write-behind: {', '.join(self.redo_logs) if self.flusher else 'выключен'}")
+        print(f"   Lock striping: {f'{self.stripes.stripes} полос' if self.stripes else 'выключен'}")
+        print(f"   Change feed: {'включена' if change_feed is not None else 'выключена'}")
+    
+    def table_for_path(self, filepath):
+        """Имя логической таблицы по пути файла (None для посторонних файлов)"""
+        return self._path_tables.get(os.path.abspath(filepath))
+    
+    def table_exists(self, filepath):
+        """Проверка существования таблицы (или обычного файла) по пути"""
+        table = self.table_for_path(filepath)
+        if table is None:
+            return os.path.exists(filepath)
+        journal = self.journals.get(table)
+        if journal is not None and journal.signature():
+            return True
+        return self.storage.exists(table)
     
     def read_excel(self, filepath):
-        """Чтение Excel файла"""
-        if os.path.exists(filepath):
-            return pd.read_excel(filepath)
+        """Чтение таблицы через движок хранения (или обычного Excel файла) с кэшированием.
+        
+        Возвращает копию (Copy-on-Write), изменения которой не затрагивают кэш.
+        """
+        table = self.table_for_path(filepath)
+        if table is not None:
+            return self.read_table(table)
+        signature = file_signature(filepath)
+        if signature is not None:
+            return self.cache.get(self._cache_key(filepath), signature, lambda: pd.read_excel(filepath))
         else:
             raise FileNotFoundError(f"Файл не найден: {filepath}")
     
     def save_excel(self, df, filepath):
-        """Сохранение DataFrame в Excel"""
-        df.to_excel(filepath, index=False)
+        """Сохранение DataFrame через движок хранения (или в обычный Excel файл)"""
+        table = self.table_for_path(filepath)
+        if table is not None:
+            return self.write_table(table, df)
+        try:
+            df.to_excel(filepath, index=False)
+            return True
+        finally:
+            self.cache.invalidate(self._cache_key(filepath))
+    
+    def append_rows(self, df, filepath):
+        """Добавление строк в конец таблицы"""
+        table = self.table_for_path(filepath)
+        if table is not None:
+            return self.append_table(table, df)
+        try:
+            combined_df = df
+            if os.path.exists(filepath):
+                combined_df = pd.concat([pd.read_excel(filepath), df], ignore_index=True)
+            combined_df.to_excel(filepath, index=False)
+            return len(df)
+        finally:
+            self.cache.invalidate(self._cache_key(filepath))
+    
+    # ==================== ТАБЛИЦЫ ====================
+    
+    def read_table(self, table, columns=None):
+        """Чтение логической таблицы (основное хранилище + не влитый журнал вставок).
+        
+        columns - проекция: читаются только указанные колонки (отсутствующие пропускаются).
+        """
+        projection = tuple(columns) if columns is not None else None
+        if table in self.redo_logs:
+            # Таблица с отложенными обновлениями - та же версия, что видят обновления
+            df, _ = self.read_indexed(table)
+            return df if projection is None else df[[col for col in df.columns if col in projection]]
+        journal = self.journals.get(table)
+        if journal is None:
+            return self._read_base(table, projection)
+        
+        with journal.lock:
+            base_signature = self.storage.signature(table)
+            journal_signature = journal.signature()
+            if base_signature is None and not journal_signature:
+                raise FileNotFoundError(f"Файл не найден: {self.storage.location(table)}")
+            
+            def merge():
+                frames = []
+                if base_signature is not None:
+                    frames.append(self._read_base(table, projection))
+                records = journal.records()
+                if records:
+                    journal_df = pd.DataFrame(records)
+                    if projection is not None:
+                        journal_df = journal_df[[col for col in journal_df.columns if col in projection]]
+                    frames.append(journal_df)
+                return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            
+            key = self._cache_key(table, 'journal', projection)
+            return self.cache.get(key, (base_signature, journal_signature), merge)
+    
+    def scan_table_range(self, table, column, start, end, columns=None, inclusive='both', user_id=None):
+        """Строки таблицы, у которых числовое значение column попадает в диапазон.
+        
+        Открываются только партиции, пересекающиеся с диапазоном (при помесячном хранении).
+        Движки с собственным сканированием (arrow - memory map, sqlite - WHERE) не загружают
+        партицию целиком; для остальных диапазон ищется бинарным поиском по индексу timestamp.
+        user_id - только строки этого пользователя (колонка UserID).
+        """
+        return self._scan(table, column, start, end, columns, inclusive, user_id,
+                          lambda index: index.range_rows(start, end, inclusive, user_id))
+    
+    def scan_table_day(self, table, column, day, columns=None, user_id=None):
+        """Строки таблицы за календарный день day (date) по местному времени"""
+        start = datetime.combine(day, dt_time.min).timestamp()
+        end = datetime.combine(day + timedelta(days=1), dt_time.min).timestamp()
+        return self._scan(table, column, start, end, columns, 'left', user_id,
+                          lambda index: index.day_rows(day, user_id))
+    
+    def _scan(self, table, column, start, end, columns, inclusive, user_id, index_rows):
+        projection = None if columns is None else list(columns) + [column]
+        
+        def select_user(df):
+            if user_id is None or df.empty or 'UserID' not in df.columns:
+                return df
+            return df[df['UserID'] == user_id]
+        
+        journal = self.journals.get(table)
+        frames = []
+        with journal.lock if journal is not None else nullcontext():
+            for part in self.storage.partitions_for_range(table, column, start, end):
+                if self.storage.signature(part) is None:
+                    continue
+                if self.storage.native_range_scan:
+                    frames.append(select_user(self.storage.scan_range(part, column, start, end, projection, inclusive)))
+                    continue
+                df, index = self.read_timestamp_indexed(part, column)
+                frame = df.iloc[index_rows(index)]
+                if projection is not None:
+                    frame = frame[[col for col in frame.columns if col in projection]]
+                frames.append(frame.reset_index(drop=True))
+            if journal is not None:
+                records = journal.records()
+                if records:
+                    journal_df = pd.DataFrame(records)
+                    if projection is not None:
+                        journal_df = journal_df[[col for col in journal_df.columns if col in projection]]
+                    frames.append(select_user(filter_range(journal_df, column, start, end, inclusive)))
+        frames = [frame for frame in frames if not frame.empty] or frames[:1]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    
+    def read_timestamp_indexed(self, table, column):
+        """Таблица (или партиция) вместе с индексом timestamp по column той же версии: (df, TimestampIndex)"""
+        signature = self.storage.signature(table)
+        if signature is None:
+            raise FileNotFoundError(f"Файл не найден: {self.storage.location(table)}")
+        df = self.cache.get(self._cache_key(table), signature, lambda: self.storage.read(table))
+        if column not in df.columns:
+            # Без колонки timestamp в диапазон не попадает ни одна строка
+            return df, TimestampIndex.build(pd.DataFrame({column: []}), column)
+        index = self.cache.get(self._cache_key(table, 'timestamp_index', column), signature,
+                               lambda: TimestampIndex.build(df, column))
+        return df, index
+    
+    def _read_base(self, table, projection=None):
+        signature = self.storage.signature(table)
+        if signature is None:
+            raise FileNotFoundError(f"Файл не найден: {self.storage.location(table)}")
+        key = self._cache_key(table) if projection is None else self._cache_key(table, projection)
+        return self.cache.get(key, signature, lambda: self.storage.read(table, projection))
+    
+    def table_version(self, table):
+        """Версия таблицы для ETag: меняется при каждой записи, в том числе из другого процесса
+        (версия хранилища, журнала вставок и журнала отложенных обновлений). Таблица не читается."""
+        journal = self.journals.get(table)
+        redo = self.redo_logs.get(table)
+        return (self.storage.signature(table),
+                journal.signature() if journal is not None else None,
+                redo.signature() if redo is not None else None)
+    
+    def read_indexed(self, table):
+        """Таблица MainPurch/OtherPurch вместе с индексом владельцев той же версии: (df, OwnerIndex)"""
+        owner = self._owner_scope(table)
+        if owner is not None:
+            # Внутри transaction(owner=...) - только строки владельца с адресами строк
+            df = self.storage.select_rows(table, owner)
+            return df, OwnerIndex.build(df)
+        
+        signature = self.storage.signature(table)
+        if signature is None:
+            raise FileNotFoundError(f"Файл не найден: {self.storage.location(table)}")
+        df = self.cache.get(self._cache_key(table), signature, lambda: self.storage.read(table))
+        index = self.cache.get(self._cache_key(table, 'owner_index'), signature, lambda: OwnerIndex.build(df))
+        redo = self.redo_logs.get(table)
+        if redo is None:
+            return df, index
+        
+        with redo.lock:
+            redo_signature = redo.signature()
+            if not redo_signature:
+                return df, index
+            # Таблица с примененными отложенными обновлениями (версия - таблица + журнал повтора)
+            view_signature = (signature, redo_signature)
+            view = self.cache.get(self._cache_key(table, 'redo'), view_signature,
+                                  lambda: apply_updates(table, df, index, redo.records())[0])
+            view_index = self.cache.get(self._cache_key(table, 'redo', 'owner_index'), view_signature,
+                                        lambda: OwnerIndex.build(view))
+            return view, view_index
+    
+    def mutate(self, table, func):
+        """Выполнение изменения таблицы (чтение-изменение-запись) в ее очереди записи.
+
+        Возвращает результат func(); изменения одной таблицы не выполняются параллельно
+        ни внутри процесса, ни между процессами. Чтение таблиц очередь не ждет.
+        """
+        return self.writer.run(table, func)
+    
+    def write_table(self, table, df):
+        """Полная перезапись логической таблицы"""
+        return self.mutate(table, lambda: self._write_tracked(table, df))
+    
+    def _write_tracked(self, table, df):
+        # Служебные перезаписи (чистка, вливание журналов) идут мимо ленты - строки не меняются
+        changes = self._write_changes(table, df)
+        result = self._write_table(table, df)
+        self._record_changes(changes, [table])
+        return result
+    
+    def _write_table(self, table, df):
+        if self._defer(table, 'write', df):
+            return True
+        try:
+            with ExitStack() as stack:
+                logs = self._table_logs(table)
+                for log in logs:
+                    stack.enter_context(log.lock)
+                # DataFrame уже содержит строки журнала и отложенные обновления
+                # (прочитан через read_table / read_indexed) - журналы вливаются этой записью
+                folded = self._folding(logs)
+                self._publish(table, 'write', df, folded)
+                for log, generation in folded:
+                    log.forget(generation)
+                self._seed_owner_index(table, df)
+                return True
+        finally:
+            self._invalidate(table)
+    
+    def _table_logs(self, table):
+        """Журналы таблицы: вставок и отложенных обновлений"""
+        return [log for log in (self.journals.get(table), self.redo_logs.get(table)) if log is not None]
+    
+    def _folding(self, logs):
+        """Журналы, строки которых войдут в перезапись таблицы: [(журнал, последнее поколение)]"""
+        folded = []
+        for log in logs:
+            generation = log.pending_generation()
+            if generation is not None:
+                folded.append((log, generation))
+        return folded
+    
+    def _publish(self, table, kind, df, folded):
+        """Запись таблицы ('write' - перезапись, 'append' - вставка) вместе с отметками о влитых
+        в нее поколениях журналов folded.
+        
+        Отметки фиксируются тем же коммитом, что и таблица: у SQLite - в той же транзакции,
+        у файловых движков файл состояния журнала публикуется через CommitLog вместе с файлами
+        таблицы. После сбоя строки журнала не вливаются в таблицу повторно.
+        """
+        if not folded:
+            return self.storage.write(table, df) if kind == 'write' else self.storage.append(table, df)
+        changes = [] if kind == 'append' and df.empty else [(kind, table, df)]
+        if self.storage.supports_marks:
+            self.storage.apply_row_changes(changes, marks={log.name: generation for log, generation in folded})
+            return True
+        token = new_commit_token()
+        renames = []
+        if changes:
+            stage = self.storage.stage if kind == 'write' else self.storage.stage_append
+            renames = stage(table, df, token)
+        if renames is None:
+            # Движок не готовит таблицу во временных файлах (перезапись помесячных партиций) -
+            # таблица и отметки пишутся по очереди
+            self.storage.write(table, df) if kind == 'write' else self.storage.append(table, df)
+            for log, generation in folded:
+                log.mark_folded(generation)
+            return True
+        self.commit_log.commit(token, renames + [log.stage_state(generation, token) for log, generation in folded])
+        return True
+    
+    def append_table(self, table, df):
+        """Добавление строк в логическую таблицу (через журнал, если он включен).
+        
+        Параллельные вставки в одну таблицу объединяются в одну запись (group commit).
+        """
+        return self.writer.append(table, df, lambda rows: self._append_tracked(table, rows))
+    
+    def _append_tracked(self, table, df):
+        result = self._append_table(table, df)
+        self._record_changes(inserted_changes(table, df) if self.change_feed is not None and table in APPEND_TABLES
+                             else [], [table])
+        return result
+    
+    def _append_table(self, table, df):
+        if self._defer(table, 'append', df):
+            return len(df)
+        journal = self.journals.get(table)
+        try:
+            if journal is None:
+                return self.storage.append(table, df)
+            rows = journal.append(df.to_dict('records'))
+            self.compactor.notify(journal)
+            return rows
+        finally:
+            self._invalidate(table)
+    
+    def compact_journal(self, table):
+        """Вливание журнала вставок таблицы в основное хранилище"""
+        return self.mutate(table, lambda: self._compact_journal(table))
+    
+    def _compact_journal(self, table):
+        journal = self.journals[table]
+        with journal.lock:
+            try:
+                rows = journal.fold(lambda df, generation: self._publish(table, 'append', df, [(journal, generation)]))
+            finally:
+                self._invalidate(table)
+        if rows:
+            print(f"🗜️  Журнал {table}: влито {rows} записей в {self.storage.location(table)}")
+        return rows
+    
+    # ==================== ОБНОВЛЕНИЕ ОБЪЕМА (MAINPURCH/OTHERPURCH) ====================
+    
+    def update_purchase(self, table, criteria, new_volume_gr, new_volume):
+        """Обновление объема товара в MainPurch/OtherPurch (нулевой объем удаляет строку).
+        
+        Возвращает 'updated', 'deleted' или None (строка не найдена). С отложенной записью
+        обновление применяется к таблице в памяти и дописывается в журнал повтора (O(1)),
+        таблица перезаписывается позже - сразу за все накопленные обновления.
+        """
+        update = volume_update(criteria, new_volume_gr, new_volume)
+        if self._striped([table]):
+            # Меняются только строки владельца - параллельно с другими семьями
+            with self.transaction([table], owner=(criteria['UserID'], criteria['FamilyID'])):
+                return self._update_purchase(table, update)
+        return self.mutate(table, lambda: self._update_purchase(table, update))
+    
+    def _update_purchase(self, table, update):
+        df, index = self.read_indexed(table)
+        owner = (update['criteria']['UserID'], update['criteria']['FamilyID'])
+        # Строки владельца до обновления (apply_updates меняет DataFrame на месте)
+        before = index.select(df, index.user_rows(*owner)).copy() if self.change_feed is not None else None
+        df, (action,) = apply_updates(table, df, index, [update])
+        if action is None:
+            return None
+        changes = []
+        if before is not None:
+            changes = keyed_changes(AGGREGATION_SPECS[table], before, df, owners={owner})
+        
+        redo = self.redo_logs.get(table)
+        if redo is None:
+            self._write_table(table, df)
+            self._record_changes(changes, [table])
+            return action
+        
+        with redo.lock:
+            redo.append([update])
+            # Новая версия таблицы в памяти: следующее чтение не применяет журнал заново
+            view_signature = (self.storage.signature(table), redo.signature())
+            self.cache.put(self._cache_key(table, 'redo'), view_signature, df)
+            if action == 'updated':
+                # Позиции строк не изменились - индекс владельцев прежний
+                self.cache.put(self._cache_key(table, 'redo', 'owner_index'), view_signature, index)
+            # Обновление уже в журнале повтора - в ленту под той же блокировкой
+            self._record_changes(changes, [table])
+        self.flusher.notify(redo)
+        return action
+    
+    def flush_write_behind(self, table):
+        """Запись отложенных обновлений таблицы одной перезаписью (возвращает число обновлений)"""
+        return self.mutate(table, lambda: self._flush_write_behind(table))
+    
+    def _flush_write_behind(self, table):
+        redo = self.redo_logs[table]
+        with redo.lock:
+            updates = len(redo.records())
+            if not updates:
+                return 0
+            df, _ = self.read_indexed(table)
+            self._write_table(table, df)
+        print(f"💾 {table}: записано {updates} отложенных обновлений")
+        return updates
+    
+    # ==================== ОБСЛУЖИВАНИЕ (VACUUM) ====================
+    
+    def vacuum_tables(self):
+        """Таблицы, которые обслуживаются перезаписью в канонической форме"""
+        return list(self.clean_markers)
+    
+    def is_clean(self, table):
+        """Текущая версия таблицы записана в канонической форме (дублей ключа нет)"""
+        marker = self.clean_markers.get(table)
+        return marker is not None and marker.is_clean(self.storage.signature(table))
+    
+    def vacuum_purchases(self, table):
+        """Перезапись таблицы в канонической форме: дубли ключа агрегированы, строки
+        с нулевым объемом удалены, строки упорядочены по ключу.
+        
+        Возвращает (строк до, строк после, схлопнуто дублей, удалено нулевых) или None,
+        если таблицы нет.
+        """
+        return self.mutate(table, lambda: self._vacuum_purchases(table))
+    
+    def _vacuum_purchases(self, table):
+        if self.storage.signature(table) is None:
+            return None
+        # Вместе с отложенными обновлениями (запись таблицы очищает журнал повтора)
+        df, _ = self.read_indexed(table)
+        spec = AGGREGATION_SPECS[table]
+        canonical, duplicates, zero_rows = canonical_form(spec, df)
+        # Схлопывание дублей строки не меняет, удаленные нулевые строки - надгробия в ленте
+        changes = keyed_changes(spec, df, canonical) if self.change_feed is not None and zero_rows else []
+        self._write_table(table, canonical)
+        self._record_changes(changes, [table])
+        self.clean_markers[table].mark(self.storage.signature(table))
+        print(f"🧽 {table}: {len(df)} -> {len(canonical)} записей "
+              f"(дублей схлопнуто: {duplicates}, нулевых удалено: {zero_rows})")
+        return len(df), len(canonical), duplicates, zero_rows
+    
+    def _seed_owner_index(self, table, df):
+        if table in INDEXED_TABLES:
+            # Индекс новой версии строим по записанному DataFrame, без повторного чтения
+            self.cache.put(self._cache_key(table, 'owner_index'), self.storage.signature(table),
+                           OwnerIndex.build(df))
+    
+    # ==================== ОБЩИЙ КОММИТ ====================
+    
+    @contextmanager
+    def transaction(self, tables, owner=None):
+        """Изменения нескольких таблиц, публикуемые одним коммитом.
+        
+        Таблицы захватываются на весь блок; записи внутри блока накапливаются, на выходе
+        новые версии таблиц готовятся параллельно во временных файлах и публикуются
+        атомарными переименованиями под одним маркером коммита. Ошибка внутри блока
+        отменяет все записи. Чтение внутри блока видит таблицы до изменений.
+        
+        owner=(UserID, FamilyID) - блок меняет только строки этого владельца. С полосами
+        блокировок захватывается полоса владельца, read_indexed возвращает строки владельца,
+        а записи таблиц заменяют только их - одной транзакцией движка.
+        """
+        if owner is not None and self._striped(tables):
+            with self._owner_transaction(tables, owner):
+                yield
+            return
+        
+        with self.writer.hold(tables):
+            pending, changes = {}, []
+            self._transactions.tables = set(tables)
+            self._transactions.pending = pending
+            self._transactions.changes = changes
+            # Владелец известен - лента изменений сравнивает только его строки
+            self._transactions.owners = None if owner is None else {(str(owner[0] or ''), int(owner[1]))}
+            try:
+                yield
+            finally:
+                self._transactions.tables = None
+                self._transactions.pending = None
+                self._transactions.changes = None
+                self._transactions.owners = None
+            self._commit(pending)
+            self._record_changes(changes, tables)
+    
+    def _striped(self, tables):
+        # Отложенная запись держит таблицу в памяти целиком - такие таблицы блокируются полностью
+        return self.stripes is not None and not any(table in self.redo_logs for table in tables)
+    
+    @contextmanager
+    def _owner_transaction(self, tables, owner):
+        user_id, family_id = owner
+        where = {'UserID': user_id, 'FamilyID': int(family_id)}
+        with self.stripes.hold(tables, owner_key(user_id, family_id)), self.writer.adopt(tables):
+            pending, changes = {}, []
+            self._transactions.tables = set(tables)
+            self._transactions.pending = pending
+            self._transactions.changes = changes
+            self._transactions.owner = where
+            self._transactions.owners = {(str(user_id or ''), int(family_id))}
+            try:
+                yield
+            finally:
+                self._transactions.tables = None
+                self._transactions.pending = None
+                self._transactions.changes = None
+                self._transactions.owner = None
+                self._transactions.owners = None
+            self._commit_rows(pending, where)
+            self._record_changes(changes, tables)
+    
+    def _owner_scope(self, table):
+        """Условие на строки владельца, если таблица изменяется в transaction(owner=...)"""
+        tables = getattr(self._transactions, 'tables', None)
+        if not tables or table not in tables:
+            return None
+        return getattr(self._transactions, 'owner', None)
+    
+    def _commit_rows(self, pending, where):
+        # Вставки (в том числе в таблицы с журналом) идут той же транзакцией, что и строки владельца
+        changes = [('sync', table, where, df) if kind == 'write' else ('append', table, df)
+                   for table, (kind, df) in pending.items()]
+        try:
+            self.storage.apply_row_changes(changes)
+        finally:
+            for table in pending:
+                self._invalidate(table)
+    
+    def _write_changes(self, table, df):
+        """Изменения строк при перезаписи MainPurch/OtherPurch: разница с текущей версией таблицы
+        (внутри transaction() - с версией, уже записанной в этом блоке)"""
+        spec = AGGREGATION_SPECS.get(table)
+        if self.change_feed is None or spec is None:
+            return []
+        # Внутри transaction(owner=...) меняются только строки владельца - без хеширования таблицы
+        tables = getattr(self._transactions, 'tables', None)
+        owners = self._transactions.owners if tables and table in tables else None
+        pending = getattr(self._transactions, 'pending', None)
+        if pending and pending.get(table, (None,))[0] == 'write':
+            before = pending[table][1]
+        else:
+            try:
+                before, _ = self.read_indexed(table)
+            except FileNotFoundError:
+                before = pd.DataFrame()
+        return keyed_changes(spec, before, df, owners=owners)
+    
+    def _record_changes(self, changes, written):
+        """Запись изменений в ленту; изменения таблиц transaction() - после ее коммита.
+
+        written - записанные таблицы: без ленты записи таблиц ленты отмечаются в changes.unrecorded
+        (после записи - процесс с лентой, увидев отметку, уже видит и записанные строки).
+        """
+        tables = getattr(self._transactions, 'tables', None)
+        if self.change_feed is None:
+            if any(table in SYNC_TABLES and not (tables and table in tables) for table in written):
+                self.unrecorded.touch()
+            return
+        if not changes:
+            return
+        if tables:
+            deferred = [change for change in changes if change[0] in tables]
+            self._transactions.changes.extend(deferred)
+            changes = [change for change in changes if change[0] not in tables]
+            if not changes:
+                return
+        self.change_feed.record(changes)
+    
+    def _defer(self, table, kind, df):
+        """Запись таблицы внутри transaction() откладывается до коммита"""
+        tables = getattr(self._transactions, 'tables', None)
+        if not tables or table not in tables:
+            return False
+        pending = self._transactions.pending
+        previous = pending.get(table)
+        if previous is None or kind == 'write':
+            pending[table] = (kind, df)
+        else:
+            # Повторные вставки (или вставка после перезаписи) объединяются в одну запись
+            pending[table] = (previous[0], pd.concat([previous[1], df], ignore_index=True))
         return True
     
+    def _commit(self, pending):
+        staged, direct, journal_appends = [], [], []
+        for table, (kind, df) in pending.items():
+            if kind == 'append' and table in self.journals and not self.storage.supports_marks:
+                # Вставка в журнал - файл вставок публикуется тем же коммитом (без перезаписи таблицы)
+                journal_appends.append((table, df))
+            else:
+                # У SQLite вставка в таблицу с журналом идет в транзакцию движка вместе с остальными
+                staged.append((table, kind, df))
+        
+        token = new_commit_token()
+        results = self.commit_log.stage([
+            (lambda table=table, df=df: self.storage.stage(table, df, token)) if kind == 'write'
+            else (lambda table=table, df=df: self.storage.stage_append(table, df, token))
+            for table, kind, df in staged
+        ])
+        # Перезаписанная таблица уже содержит вставки журнала и отложенные обновления:
+        # отметки о влитых поколениях публикуются тем же коммитом
+        folded = {}
+        for (table, kind, df), result in zip(staged, results):
+            if kind == 'write' and result is not None:
+                folded[table] = self._folding(self._table_logs(table))
+        renames = [rename for result in results if result for rename in result]
+        renames += [log.stage_state(generation, token) for logs in folded.values() for log, generation in logs]
+        try:
+            renames += [self.journals[table].stage_records(df.to_dict('records'), token)
+                        for table, df in journal_appends if not df.empty]
+        except BaseException:
+            self.commit_log.discard(renames)
+            raise
+        self.commit_log.commit(token, renames)
+        
+        for (table, kind, df), result in zip(staged, results):
+            if result is None:
+                # Движок не готовит таблицу во временных файлах (SQLite) - запись ниже
+                direct.append((table, kind, df))
+                continue
+            if kind == 'write':
+                self._seed_owner_index(table, df)
+                for log, generation in folded[table]:
+                    log.forget(generation)
+            self._invalidate(table)
+        
+        if self.storage.supports_marks:
+            # Все таблицы блока - одной транзакцией движка (BEGIN ... COMMIT)
+            self._commit_transaction(direct)
+        else:
+            for table, kind, df in direct:
+                if kind == 'write':
+                    self._write_table(table, df)
+                else:
+                    self._append_table(table, df)
+        for table, _ in journal_appends:
+            self._invalidate(table)
+            self.compactor.notify(self.journals[table])
+    
+    def _commit_transaction(self, writes):
+        """Запись нескольких таблиц одной транзакцией движка вместе с отметками влитых журналов"""
+        with ExitStack() as stack:
+            folded = {}
+            for table, kind, _ in writes:
+                if kind == 'write':
+                    logs = self._table_logs(table)
+                    for log in logs:
+                        stack.enter_context(log.lock)
+                    folded[table] = self._folding(logs)
+            changes = [(kind, table, df) for table, kind, df in writes if not (kind == 'append' and df.empty)]
+            try:
+                self.storage.apply_row_changes(changes, marks={
+                    log.name: generation for logs in folded.values() for log, generation in logs})
+            finally:
+                for table, _, _ in writes:
+                    self._invalidate(table)
+            for table, kind, df in writes:
+                if kind == 'write':
+                    for log, generation in folded[table]:
+                        log.forget(generation)
+                    self._seed_owner_index(table, df)
+    
+    def _recover_commits(self):
+        """Доведение или откат коммита, прерванного сбоем (под блокировками всех таблиц)"""
+        directories = set()
+        for table, path in self.table_paths.items():
+            directories.add(os.path.dirname(path))
+            # Папка помесячных партиций таблицы
+            directories.add(os.path.join(os.path.dirname(path), table))
+        with self.writer.hold(self.table_paths):
+            self.commit_log.recover(sorted(d for d in directories if os.path.isdir(d)))
+    
+    # ==================== ЖИЗНЕННЫЙ ЦИКЛ ПРОЦЕССА ====================
+    
+    def _background_workers(self):
+        return [worker for worker in (self.compactor, self.flusher, self.vacuum) if worker is not None]
+    
+    def warm_up(self):
+        """Загрузка каталога и MainPurch/OtherPurch в кэш до первого запроса.
+        
+        Сервер с предзагрузкой вызывает ее до fork: воркеры получают готовый кэш
+        в общей памяти (copy-on-write) и не читают таблицы заново.
+        """
+        loaded = {}
+        try:
+            loaded['appdb2'] = self.catalog.preload()
+        except FileNotFoundError:
+            pass
+        for table in INDEXED_TABLES:
+            if self.storage.exists(table):
+                loaded[table] = len(self.read_indexed(table)[0])
+        print(f"🔥 Кэш прогрет: {', '.join(f'{table} ({rows})' for table, rows in loaded.items()) or 'нет таблиц'}")
+        return loaded
+    
+    def prepare_fork(self):
+        """Остановка фоновых потоков и потоков-писателей перед fork воркеров:
+        дочерние процессы не должны унаследовать блокировки, захваченные этими потоками"""
+        self.stop()
+    
+    def after_fork(self):
+        """Запуск фоновых потоков в процессе-воркере (очереди записи создаются при первом изменении)"""
+        if self.stripes is not None:
+            self.stripes.after_fork()
+        for worker in self._background_workers():
+            worker.start()
+    
+    def stop(self):
+        """Остановка фоновых потоков и потоков-писателей без вливания журналов.
+        
+        Для процесса, который завершается, пока работают другие (перезапуск воркера): журналы
+        вставок и отложенных обновлений уже на диске, их вливают компактор и flusher остальных
+        процессов или close() при остановке сервера.
+        """
+        for worker in self._background_workers():
+            worker.stop(wait=True)
+        self.writer.stop()
+    
+    def close(self):
+        """Остановка сервера: отложенные обновления и журналы вливаются в таблицы"""
+        for worker in self._background_workers():
+            worker.stop(wait=True)
+        for table in list(self.redo_logs):
+            self.flush_write_behind(table)
+        for table in self.journals:
+            self.compact_journal(table)
+        self.writer.stop()
+    
+    def _invalidate(self, table):
+        # Проекции тоже устаревают: их ключи вытесняются сменой версии таблицы
+        self.cache.invalidate(self._cache_key(table))
+        self.cache.invalidate(self._cache_key(table, 'journal', None))
+        self.cache.invalidate(self._cache_key(table, 'redo'))
+    
+    def export_excel(self, table, filepath=None):
+        """Выгрузка таблицы в .xlsx (по умолчанию - на место legacy файла) для просмотра людьми"""
+        filepath = filepath or self.table_paths[table]
+        if isinstance(self.storage, ExcelStorageEngine) and os.path.abspath(filepath) == os.path.abspath(self.table_paths[table]):
+            # Таблица и так хранится в этом файле: достаточно влить журнал
+            if table in self.journals:
+                self.compact_journal(table)
+            if table in self.redo_logs:
+                self.flush_write_behind(table)
+            return len(self.read_table(table))
+        df = self.read_table(table)
+        df.to_excel(filepath, index=False)
+        print(f"📤 {table}: выгружено {len(df)} записей в {filepath}")
+        return len(df)
+    
+    def _cache_key(self, name, *parts):
+        # Логическая таблица или ее партиция ('allpurch/2026-10'), иначе - путь к файлу
+        if name in self.table_paths or name.split('/', 1)[0] in self.table_paths:
+            return (self.storage.name, name) + parts
+        return (self.storage.name, os.path.abspath(name)) + parts
+    
+    def cache_stats(self):
+        """Счетчики кэша таблиц"""
+        return self.cache.stats()
+    
+    def writer_stats(self):
+        """Счетчики очередей записи по таблицам"""
+        return self.writer.stats()
+    
+    def commit_stats(self):
+        """Счетчики общих коммитов и восстановления"""
+        return self.commit_log.stats()
+    
+    def maintenance_stats(self):
+        """Счетчики обслуживания MainPurch/OtherPurch"""
+        if self.vacuum is None:
+            return {"enabled": False, "clean": {table: self.is_clean(table) for table in self.vacuum_tables()}}
+        return dict(self.vacuum.stats(), enabled=True)
+    
+    def write_behind_stats(self):
+        """Счетчики отложенной записи MainPurch/OtherPurch"""
+        if self.flusher is None:
+            return {"enabled": False}
+        return dict(self.flusher.stats(), enabled=True)
+    
+    def change_feed_stats(self):
+        """Счетчики ленты изменений (/sync)"""
+        if self.change_feed is None:
+            return {"enabled": False}
+        return self.change_feed.stats()
+    
+    def stripe_stats(self):
+        """Счетчики полос блокировок: захваты и ожидания по таблицам и полосам"""
+        if self.stripes is None:
+            return {"enabled": False}
+        return dict(self.stripes.stats(), enabled=True)
+    
+    def journal_stats(self):
+        """Состояние журналов вставок"""
+        if self.compactor is None:
+            return {"enabled": False}
+        return dict(self.compactor.stats(), enabled=True)
+    
     def update_purchases_files(self, df):
         """Обновление файлов MainPurch.xlsx и OtherPurch.xlsx"""
         try:
@@ -47,68 +926,12 @@ class DatabaseHandler:
             main_purch_data = df[df['StoreID'] == 1].copy()
             other_purch_data = df[df['StoreID'] != 1].copy()
             
-            # Обрабатываем MainPurch.xlsx
-            if not main_purch_data.empty:
-                if os.path.exists(self.main_purch_path):
-                    existing_main = self.read_excel(self.main_purch_path)
-                    combined_main = pd.concat([existing_main, main_purch_data], ignore_index=True)
-                    
-                    # Агрегируем по полному ключу
-                    agg_main = combined_main.groupby(['ProdID', 'UserID', 'FamilyID']).agg({
-                        'Name': 'first',
-                        'Volume': 'sum',
-                        'Unit': 'first',
-                        'VolumeGr': 'sum',
-                        'Kcal100g': 'first',
-                        'Prot100g': 'first',
-                        'Fat100g': 'first',
-                        'Carb100g': 'first',
-                        'ExpireDate': 'min',
-                        'Tag': 'first',
-                        'Cat': 'first',
-                        'Store': 'first',
-                        'StoreID': 'first',
-                        'Date': 'min',
-                        'TotalCost': 'sum',
-                        'Address': 'first',
-                        'AddressID': 'first'
-                    }).reset_index()
-                    
-                    self.save_excel(agg_main, self.main_purch_path)
-                    print(f"✅ MainPurch.xlsx обновлен. Добавлено {len(main_purch_data)} записей")
-                else:
-                    self.save_excel(main_purch_data, self.main_purch_path)
-                    print(f"✅ MainPurch.xlsx создан. Добавлено {len(main_purch_data)} записей")
-            
-            # Обрабатываем OtherPurch.xlsx
-            if not other_purch_data.empty:
-                if os.path.exists(self.other_purch_path):
-                    existing_other = self.read_excel(self.other_purch_path)
-                    combined_other = pd.concat([existing_other, other_purch_data], ignore_index=True)
-                    
-                    # Агрегируем по полному ключу
-                    agg_other = combined_other.groupby(['ProdID', 'UserID', 'FamilyID', 'StoreID', 'Date']).agg({
-                        'Name': 'first',
-                        'Volume': 'sum',
-                        'Unit': 'first',
-                        'VolumeGr': 'sum',
-                        'Kcal100g': 'first',
-                        'Prot100g': 'first',
-                        'Fat100g': 'first',
-                        'Carb100g': 'first',
-                        'Tag': 'first',
-                        'Cat': 'first',
-                        'Store': 'first',
-                        'TotalCost': 'sum',
-                        'Address': 'first',
-                        'AddressID': 'first'
-                    }).reset_index()
-                    
-                    self.save_excel(agg_other, self.other_purch_path)
-                    print(f"✅ OtherPurch.xlsx обновлен. Добавлено {len(other_purch_data)} записей")
-                else:
-                    self.save_excel(other_purch_data, self.other_purch_path)
-                    print(f"✅ OtherPurch.xlsx создан. Добавлено {len(other_purch_data)} записей")
+            for table, filepath, file_name, new_rows in (
+                ('mainpurch', self.main_purch_path, 'MainPurch', main_purch_data),
+                ('otherpurch', self.other_purch_path, 'OtherPurch', other_purch_data)
+            ):
+                if not new_rows.empty:
+                    self.mutate(table, lambda: self._merge_purchases(table, filepath, file_name, new_rows))
             
             return True
             
@@ -116,6 +939,18 @@ class DatabaseHandler:
             print(f"❌ Ошибка при обновлении файлов покупок: {e}")
             return False
     
+    def _merge_purchases(self, table, filepath, file_name, new_rows):
+        """Вливание строк в MainPurch/OtherPurch по правилам агрегации таблицы"""
+        spec = AGGREGATION_SPECS[table]
+        if self.table_exists(filepath):
+            existing, index = self.read_indexed(table)
+            merged, _, _ = spec.merge(existing, index, new_rows)
+            self.save_excel(merged, filepath)
+            print(f"✅ {file_name}.xlsx обновлен. Добавлено {len(new_rows)} записей")
+        else:
+            self.save_excel(spec.collapse(new_rows), filepath)
+            print(f"✅ {file_name}.xlsx создан. Добавлено {len(new_rows)} записей")
+    
     def get_family_data(self, family_id, file_type='main'):
         """Получение данных по FamilyID (старый метод для обратной совместимости)"""
         try:
@@ -128,7 +963,7 @@ class DatabaseHandler:
                 filepath = self.other_purch_path
                 file_name = "OtherPurch"
             
-            if not os.path.exists(filepath):
+            if not self.table_exists(filepath):
                 return None, f"{file_name}.xlsx не найден"
             
             df = self.read_excel(filepath)
@@ -143,24 +978,23 @@ class DatabaseHandler:
         """Получение данных по FamilyID или UserID с учетом типа аккаунта"""
         try:
             if file_type == 'main':
+                table = 'mainpurch'
                 filepath = self.main_purch_path
                 file_name = "MainPurch"
-                is_main_purch = True
             else:
+                table = 'otherpurch'
                 filepath = self.other_purch_path
                 file_name = "OtherPurch"
-                is_main_purch = False
             
-            if not os.path.exists(filepath):
+            if not self.table_exists(filepath):
                 return None, f"{file_name}.xlsx не найден"
             
-            df = self.read_excel(filepath)
+            # Таблица и индекс владельцев одной версии: выборка по индексу - O(размер результата)
+            df, index = self.read_indexed(table)
             
             # Проверяем наличие необходимых колонок
-            has_family_id = 'FamilyID' in df.columns
-            has_user_id = 'UserID' in df.columns
-            has_store_id = 'StoreID' in df.columns
-            has_date = 'Date' in df.columns
+            has_family_id = index.has_family_id
+            has_user_id = index.has_user_id
             
             filtered_data = pd.DataFrame()
             
@@ -169,9 +1003,8 @@ class DatabaseHandler:
                 # 1. ЛИЧНЫЙ АККАУНТ: UserID = UUID и FamilyID = 0
                 if has_user_id and has_family_id:
                     try:
-                        # Приводим FamilyID к числу для сравнения
-                        df['FamilyID_numeric'] = pd.to_numeric(df['FamilyID'], errors='coerce')
-                        filtered_data = df[(df['UserID'] == user_id) & (df['FamilyID_numeric'] == 0)]
+                        # Строки (UserID, FamilyID=0) из индекса (FamilyID в индексе приведен к числу)
+                        filtered_data = index.select(df, index.user_rows(user_id, 0))
                         print(f"🔍 {file_name}: Личный аккаунт - UserID={user_id}, FamilyID=0, найдено: {len(filtered_data)} записей")
                     except Exception as e:
                         print(f"⚠️ {file_name}: Ошибка фильтрации личного аккаунта: {e}")
@@ -190,17 +1023,15 @@ class DatabaseHandler:
                 if has_family_id:
                     try:
                         family_id_int = int(family_id)
-                        # Фильтруем по FamilyID
-                        filtered_data = df[df['FamilyID'] == family_id_int]
+                        # Строки семьи из индекса
+                        filtered_data = index.select(df, index.family_rows(family_id_int))
                         print(f"🔍 {file_name}: Семейный аккаунт - FamilyID={family_id_int}, найдено: {len(filtered_data)} записей")
                         
                         # НЕ АГРЕГИРУЕМ! Отправляем как есть, т.к. уже агрегировано при создании заказа
-                        # но для защиты на случай дублей делаем финальную агрегацию:
-                        if not filtered_data.empty:
-                            if is_main_purch:
-                                filtered_data = self._aggregate_main_purch(filtered_data)
-                            else:
-                                filtered_data = self._aggregate_other_purch(filtered_data)
+                        # но для защиты на случай дублей делаем финальную агрегацию
+                        # (после чистки таблица уже в канонической форме - пропускаем):
+                        if not filtered_data.empty and not self.is_clean(table):
+                            filtered_data = AGGREGATION_SPECS[table].rebuild(filtered_data)
                             
                             print(f"🔍 {file_name}: После финальной агрегации - {len(filtered_data)} записей")
                             
@@ -227,68 +1058,14 @@ class DatabaseHandler:
             traceback.print_exc()
             return None, str(e)
     
-    def _aggregate_main_purch(self, df):
-        """Агрегация MainPurch по полному ключу"""
-        # Определяем колонки для агрегации
-        sum_columns = ['Volume', 'VolumeGr']
-        if 'TotalCost' in df.columns:
-            sum_columns.append('TotalCost')
-        
-        # Агрегируем: суммы для числовых колонок, первое значение для остальных
-        agg_dict = {}
-        for col in df.columns:
-            if col in sum_columns:
-                agg_dict[col] = 'sum'
-            elif col == 'Date':
-                agg_dict[col] = 'min'
-            elif col == 'ExpireDate' and col in df.columns:
-                agg_dict[col] = 'min'
-            else:
-                agg_dict[col] = 'first'
-        
-        # Группируем по полному ключу
-        group_columns = ['ProdID', 'UserID', 'FamilyID']
-        existing_columns = [col for col in group_columns if col in df.columns]
-        
-        return df.groupby(existing_columns, as_index=False).agg(agg_dict)
-    
-    def _aggregate_other_purch(self, df):
-        """Агрегация OtherPurch по полному ключу"""
-        # Определяем колонки для агрегации
-        sum_columns = ['Volume', 'VolumeGr']
-        if 'TotalCost' in df.columns:
-            sum_columns.append('TotalCost')
-        
-        # Агрегируем: суммы для числовых колонок, первое значение для остальных
-        agg_dict = {}
-        for col in df.columns:
-            if col in sum_columns:
-                agg_dict[col] = 'sum'
-            else:
-                agg_dict[col] = 'first'
-        
-        # Группируем по полному ключу
-        base_columns = ['ProdID', 'UserID', 'FamilyID', 'StoreID', 'Date']
-        existing_columns = [col for col in base_columns if col in df.columns]
-        
-        return df.groupby(existing_columns, as_index=False).agg(agg_dict)
-    
     def save_to_ration_info(self, ration_data):
         """Сохранение записи в RationInfo.xlsx"""
         try:
             # Создаем DataFrame из данных
             ration_df = pd.DataFrame([ration_data])
             
-            # Проверяем существование файла
-            if os.path.exists(self.ration_info_path):
-                existing_df = self.read_excel(self.ration_info_path)
-                # Объединяем с существующими данными
-                combined_df = pd.concat([existing_df, ration_df], ignore_index=True)
-            else:
-                combined_df = ration_df
-            
-            # Сохраняем
-            self.save_excel(combined_df, self.ration_info_path)
+            # Добавляем в конец таблицы (движок сам решает, нужна ли перезапись)
+            self.append_rows(ration_df, self.ration_info_path)
             print(f"✅ Запись добавлена в RationInfo.xlsx")
             print(f"   Продукт: {ration_data.get('Name', 'Unknown')}")
             print(f"   UserID: {ration_data.get('UserID', 'Unknown')}")
@@ -302,7 +1079,7 @@ class DatabaseHandler:
     def get_family_ration(self, family_id):
         """Получение данных RationInfo по FamilyID"""
         try:
-            if not os.path.exists(self.ration_info_path):
+            if not self.table_exists(self.ration_info_path):
                 return pd.DataFrame(), None
             
             df = self.read_excel(self.ration_info_path)
@@ -321,63 +1098,33 @@ class DatabaseHandler:
             return None, str(e)
     
     def search_products(self, search_term):
-        """Поиск товаров в базе"""
+        """Поиск товаров в каталоге"""
         try:
-            df = self.read_excel(self.products_db_path)
             search_term_lower = search_term.lower()
             
-            # Функция для получения store_id
-            def get_store_id(row):
-                if 'StoreID' in df.columns:
-                    store_id = row.get('StoreID')
-                    if pd.notna(store_id):
-                        return int(store_id)
-                return 1
-            
-            # Функция для получения названия магазина
-            def get_store_name(store_id):
-                store_names = {1: "Лавка", 2: "Супермаркет", 3: "Онлайн", 4: "Рынок"}
-                return store_names.get(store_id, f"Магазин {store_id}")
+            def number(value):
+                return 0 if math.isnan(value) else value
             
-            # Поиск
             results = []
-            found_count = 0
-            
-            for _, row in df.iterrows():
-                name = str(row.get('Name', '')).lower() if pd.notna(row.get('Name')) else ''
-                tag = str(row.get('Tag', '')).lower() if pd.notna(row.get('Tag')) else ''
-                cat = str(row.get('Cat', '')).lower() if pd.notna(row.get('Cat')) else ''
-                
-                matches = (search_term_lower in name or search_term_lower in tag or search_term_lower in cat)
-                
-                if matches:
-                    found_count += 1
-                    store_id = get_store_id(row)
-                    store_name = get_store_name(store_id)
-                    
-                    # Парсим данные
-                    product = {
-                        'id': int(row.get('ProdID', 0)) if pd.notna(row.get('ProdID')) else found_count,
-                        'prod_id': int(row.get('ProdID', 0)) if pd.notna(row.get('ProdID')) else found_count,
-                        'name': str(row.get('Name', 'Без названия')).strip(),
-                        'volume': float(row.get('Volume', 0)) if pd.notna(row.get('Volume')) else 0,
-                        'unit': str(row.get('Unit', 'шт')).strip(),
-                        'volume_gr': float(row.get('VolumeGr', 0)) if pd.notna(row.get('VolumeGr')) else 0,
-                        'kcal100g': float(row.get('Kcal100g', 0)) if pd.notna(row.get('Kcal100g')) else 0,
-                        'prot100g': float(row.get('Prot100g', 0)) if pd.notna(row.get('Prot100g')) else 0,
-                        'fat100g': float(row.get('Fat100g', 0)) if pd.notna(row.get('Fat100g')) else 0,
-                        'carb100g': float(row.get('Carb100g', 0)) if pd.notna(row.get('Carb100g')) else 0,
-                        'tag': str(row.get('Tag', '')).strip(),
-                        'cat': str(row.get('Cat', '')).strip(),
-                        'total_cost': float(row.get('TotalCost', 0)) if pd.notna(row.get('TotalCost')) else 0,
-                        'store_id': store_id,
-                        'store': store_name
-                    }
-                    
-                    results.append(product)
-                    
-                    if found_count >= 50:
-                        break
+            for found_count, product in enumerate(self.catalog.search(search_term, limit=50), start=1):
+                prod_id = product.prod_id if product.prod_id is not None else found_count
+                results.append({
+                    'id': prod_id,
+                    'prod_id': prod_id,
+                    'name': product.name.strip(),
+                    'volume': number(product.volume),
+                    'unit': product.unit.strip(),
+                    'volume_gr': number(product.volume_gr),
+                    'kcal100g': number(product.kcal100g),
+                    'prot100g': number(product.prot100g),
+                    'fat100g': number(product.fat100g),
+                    'carb100g': number(product.carb100g),
+                    'tag': product.tag.strip(),
+                    'cat': product.cat.strip(),
+                    'total_cost': number(product.total_cost),
+                    'store_id': product.store_id,
+                    'store': product.store_name
+                })
             
             # Сортируем по релевантности
             results.sort(key=lambda x: (
@@ -393,21 +1140,15 @@ class DatabaseHandler:
             
     # database_handler.py - обновленная функция
 
-    def get_allpurch_by_daterange(self, start_date_str, end_date_str, user_id, family_id, user_acc_type):
-        """Получение AllPurch за период дат с учетом типа аккаунта"""
+    def get_allpurch_by_daterange(self, start_date_str, end_date_str, user_id, family_id, user_acc_type, columns=None):
+        """Получение AllPurch за период дат с учетом типа аккаунта (columns - проекция колонок)"""
         try:
-            all_purch_path = os.path.join(self.orders_dir, 'AllPurch.xlsx')
+            all_purch_path = self.all_purch_path
         
-            if not os.path.exists(all_purch_path):
+            if not self.table_exists(all_purch_path):
                 print(f"⚠️  Файл AllPurch.xlsx не найден по пути: {all_purch_path}")
                 return pd.DataFrame(), "AllPurch.xlsx not found"
         
-            df = self.read_excel(all_purch_path)
-        
-            if df.empty:
-                print("ℹ️  Файл AllPurch.xlsx пуст")
-                return df, None
-        
             # Преобразуем даты для фильтрации
             start_date = datetime.strptime(start_date_str, "%d.%m.%Y")
             end_date = datetime.strptime(end_date_str, "%d.%m.%Y")
@@ -418,25 +1159,20 @@ class DatabaseHandler:
             # Конвертируем в timestamp
             start_timestamp = int(start_date.timestamp())
             end_timestamp = int(end_date.timestamp())
-        
-            # Функция для проверки, находится ли дата в диапазоне
-            def is_in_range(timestamp):
-                if pd.isna(timestamp) or timestamp == '':
-                    return False
-                try:
-                    ts = float(timestamp)
-                    return start_timestamp <= ts <= end_timestamp
-                except:
-                    return False
-        
-            # ФИЛЬТРАЦИЯ ПО ДАТАМ (столбец Date)
-            if 'Date' in df.columns:
-                mask_date = df['Date'].apply(is_in_range)
-                filtered_df = df[mask_date]
-                print(f"📊 Записей в AllPurch за период {start_date_str}-{end_date_str}: {len(filtered_df)}")
-            else:
+            
+            if columns is not None:
+                # Колонки, нужные для фильтрации, читаем всегда
+                columns = list(columns) + ['UserID', 'FamilyID']
+            
+            # ФИЛЬТРАЦИЯ ПО ДАТАМ (столбец Date) - на уровне хранилища, без построчного apply
+            # (для личного аккаунта сразу по индексу пользователя)
+            filtered_df = self.scan_table_range('allpurch', 'Date', start_timestamp, end_timestamp, columns,
+                                                user_id=user_id if user_acc_type == 0 else None)
+            
+            if 'Date' not in filtered_df.columns:
                 print("⚠️  В AllPurch нет колонки Date для фильтрации")
                 return pd.DataFrame(), "No Date column found in AllPurch"
+            print(f"📊 Записей в AllPurch за период {start_date_str}-{end_date_str}: {len(filtered_df)}")
         
             if filtered_df.empty:
                 return filtered_df, None
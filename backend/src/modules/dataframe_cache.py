@@ -0,0 +1,90 @@
+"""
+Кэш прочитанных таблиц (DataFrame) с ключом по версии файла
+"""
+
+import threading
+import pandas as pd
+
+
+def _copy_on_write_enabled():
+    """Включен ли в pandas режим Copy-on-Write (всегда включен с pandas 3.0)"""
+    try:
+        return bool(pd.get_option('mode.copy_on_write'))
+    except Exception:
+        return False
+
+
+class DataFrameCache:
+    """Процессный кэш DataFrame (и построенных по ним индексов): ключ - путь,
+    версия - (mtime, size, inode) или версия таблицы"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, signature, loader):
+        """Получение DataFrame из кэша или загрузка через loader()"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return self._hand_out(entry[1])
+            self.misses += 1
+
+        # Загружаем вне блокировки, чтобы не задерживать чтение других таблиц
+        df = loader()
+
+        with self._lock:
+            self._entries[key] = (signature, df)
+        return self._hand_out(df)
+
+    def put(self, key, signature, value):
+        """Запись готового значения для версии таблицы (например, индекса, построенного при записи)"""
+        with self._lock:
+            self._entries[key] = (signature, value)
+
+    def invalidate(self, key):
+        """Сброс записи кэша (после записи таблицы)"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """Счетчики попаданий/промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+    @staticmethod
+    def _hand_out(df):
+        """Копия для читателя: изменения не должны попадать в кэш"""
+        if not isinstance(df, pd.DataFrame):
+            # Индексы и прочие производные структуры неизменяемы - отдаем как есть
+            return df
+        if _copy_on_write_enabled():
+            # Copy-on-Write: поверхностная копия, данные копируются только при изменении
+            return df.copy(deep=False)
+        return df.copy()
+
+
+# Глобальный кэш таблиц (общий для всех обработчиков процесса)
+_dataframe_cache = DataFrameCache()
+
+def get_dataframe_cache():
+    """Получение общего кэша таблиц"""
+    return _dataframe_cache
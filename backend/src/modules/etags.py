@@ -0,0 +1,97 @@
+"""
+ETag для чтения: тег из версий таблиц и параметров запроса, совпавший If-None-Match - 304 без чтения таблиц
+"""
+
+import hashlib
+import functools
+import threading
+
+from flask import Response, make_response, request
+
+
+def _tags(header):
+    """Теги из If-None-Match (слабые W/ сравниваются как сильные)"""
+    tags = set()
+    for part in header.split(','):
+        part = part.strip()
+        if part.startswith('W/'):
+            part = part[2:]
+        if part:
+            tags.add(part.strip('"'))
+    return tags
+
+
+class ETagTracker:
+    """Вычисление ETag и счетчики совпадений по endpoint.
+
+    Тег - хеш версий таблиц (DatabaseHandler.table_version: меняется при каждой записи,
+    в том числе из другого процесса), тела и query string запроса и кодировщика JSON.
+    """
+
+    def __init__(self, db_handler, salt=''):
+        self.db_handler = db_handler
+        self.salt = salt
+        self._guard = threading.Lock()
+        self.endpoints = {}
+
+    def compute(self, scope, tables):
+        versions = [(table, self.db_handler.table_version(table)) for table in tables]
+        digest = hashlib.sha1()
+        digest.update(repr((scope, self.salt, versions)).encode('utf-8'))
+        digest.update(request.query_string)
+        digest.update(b'\0')
+        digest.update(request.get_data())
+        return digest.hexdigest()[:32]
+
+    def record(self, scope, hit):
+        with self._guard:
+            counters = self.endpoints.setdefault(scope, {"requests": 0, "hits": 0})
+            counters["requests"] += 1
+            counters["hits"] += int(hit)
+
+    def stats(self):
+        with self._guard:
+            endpoints = {scope: dict(counters) for scope, counters in self.endpoints.items()}
+        for counters in endpoints.values():
+            counters["hit_ratio"] = round(counters["hits"] / counters["requests"], 4) if counters["requests"] else 0.0
+        requests = sum(counters["requests"] for counters in endpoints.values())
+        hits = sum(counters["hits"] for counters in endpoints.values())
+        return {
+            "enabled": True,
+            "requests": requests,
+            "hits": hits,
+            "hit_ratio": round(hits / requests, 4) if requests else 0.0,
+            "endpoints": endpoints
+        }
+
+
+def conditional(tracker, scope, tables):
+    """Декоратор Flask endpoint чтения: ответ 200 получает ETag, запрос с совпавшим
+    If-None-Match - 304 без вызова endpoint (таблицы не читаются, ответ не сериализуется).
+
+    Версии таблиц читаются до endpoint: если таблица изменится во время запроса, тег
+    останется старым и следующий запрос просто получит 200. Без tracker декоратор
+    ничего не меняет.
+    """
+    def decorator(view):
+        if tracker is None:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = tracker.compute(scope, tables)
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match and (etag in _tags(if_none_match) or if_none_match.strip() == '*'):
+                tracker.record(scope, True)
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            tracker.record(scope, False)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+
+        return wrapper
+    return decorator
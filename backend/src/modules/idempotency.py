@@ -0,0 +1,229 @@
+"""
+Ключи идемпотентности: повтор запроса с тем же ключом возвращает исходный ответ без записи в хранилище
+"""
+
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from contextlib import closing
+
+from flask import Response, make_response, request
+
+# Заголовок запроса с ключом (также принимается поле idempotency_key в JSON)
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyStore:
+    """Сохраненные ответы по ключам идемпотентности (SQLite, общий для процессов сервера).
+
+    Ключ сначала занимается (pending), после ответа в нем сохраняются статус и тело.
+    Записи старше ttl_seconds удаляются, при превышении max_entries удаляются самые старые.
+    Ключ, занятый запросом, который не завершился (сбой процесса), освобождается через
+    pending_timeout секунд.
+    """
+
+    def __init__(self, db_path, ttl_seconds=24 * 3600, max_entries=10000, pending_timeout=60):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.pending_timeout = pending_timeout
+        self._guard = threading.Lock()
+        self._since_purge = 0
+        self.requests = 0
+        self.hits = 0
+        self.conflicts = 0
+        self.stored = 0
+        self.evicted = 0
+
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS idempotency (
+                    key TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    status INTEGER,
+                    mimetype TEXT,
+                    body BLOB,
+                    created REAL NOT NULL
+                )''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idempotency_created ON idempotency (created)')
+        self.purge()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def begin(self, key, fingerprint):
+        """Занятие ключа перед выполнением запроса.
+
+        Возвращает ('new', None) - выполнять запрос; ('replay', (статус, mimetype, тело)) -
+        вернуть сохраненный ответ; ('in_progress', None) - запрос с этим ключом еще выполняется;
+        ('mismatch', None) - ключ уже использован с другим телом запроса.
+        """
+        now = time.time()
+        with self._guard:
+            self.requests += 1
+            self._since_purge += 1
+            purge = self._since_purge >= 100
+        if purge:
+            self.purge()
+
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT fingerprint, state, status, mimetype, body, created FROM idempotency WHERE key = ?',
+                    (key,)
+                ).fetchone()
+                outcome = self._resolve(row, fingerprint, now)
+                if outcome[0] == 'new':
+                    conn.execute(
+                        'INSERT OR REPLACE INTO idempotency (key, fingerprint, state, created) VALUES (?, ?, ?, ?)',
+                        (key, fingerprint, 'pending', now)
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+        with self._guard:
+            if outcome[0] == 'replay':
+                self.hits += 1
+            elif outcome[0] != 'new':
+                self.conflicts += 1
+        return outcome
+
+    def _resolve(self, row, fingerprint, now):
+        if row is None:
+            return ('new', None)
+        stored_fingerprint, state, status, mimetype, body, created = row
+        if state == 'pending':
+            if now - created > self.pending_timeout:
+                return ('new', None)
+            return ('in_progress', None)
+        if now - created > self.ttl_seconds:
+            return ('new', None)
+        if stored_fingerprint != fingerprint:
+            return ('mismatch', None)
+        return ('replay', (status, mimetype, body))
+
+    def finish(self, key, status, mimetype, body):
+        """Сохранение ответа запроса, занявшего ключ"""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'UPDATE idempotency SET state = ?, status = ?, mimetype = ?, body = ? WHERE key = ?',
+                ('done', status, mimetype, body, key)
+            )
+        with self._guard:
+            self.stored += 1
+
+    def abandon(self, key):
+        """Освобождение ключа (ошибка сервера - повтор запроса должен выполниться заново)"""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM idempotency WHERE key = ? AND state = 'pending'", (key,))
+
+    def purge(self):
+        """Удаление устаревших ключей и самых старых ключей сверх max_entries"""
+        with self._guard:
+            self._since_purge = 0
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                removed = conn.execute(
+                    "DELETE FROM idempotency WHERE state = 'done' AND created < ?",
+                    (time.time() - self.ttl_seconds,)
+                ).rowcount
+                excess = conn.execute('SELECT COUNT(*) FROM idempotency').fetchone()[0] - self.max_entries
+                if excess > 0:
+                    removed += conn.execute(
+                        "DELETE FROM idempotency WHERE key IN (SELECT key FROM idempotency "
+                        "WHERE state = 'done' ORDER BY created LIMIT ?)",
+                        (excess,)
+                    ).rowcount
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        with self._guard:
+            self.evicted += removed
+        return removed
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM idempotency').fetchone()[0]
+        with self._guard:
+            return {
+                "enabled": True,
+                "requests": self.requests,
+                "hits": self.hits,
+                "hit_ratio": round(self.hits / self.requests, 4) if self.requests else 0.0,
+                "conflicts": self.conflicts,
+                "stored": self.stored,
+                "evicted": self.evicted,
+                "entries": entries,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries
+            }
+
+
+def _request_key(scope):
+    """Ключ идемпотентности запроса (с областью: endpoint и пользователь) или None"""
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
+    key = request.headers.get(IDEMPOTENCY_HEADER) or data.get('idempotency_key')
+    if not key:
+        return None
+    return f"{scope}:{data.get('user_id', '')}:{key}"
+
+
+def idempotent(store, scope):
+    """Декоратор Flask endpoint: ответы на запросы с ключом идемпотентности сохраняются в store.
+
+    Повтор с тем же ключом получает сохраненный ответ (заголовок Idempotent-Replayed: true),
+    пока исходный запрос выполняется - 409, тот же ключ с другим телом - 422. Ответы 5xx не
+    сохраняются: повтор после ошибки сервера выполняется заново (поэтому сбои записи endpoint
+    возвращает как 5xx, а 4xx - только для ошибок самого запроса). Без store декоратор ничего
+    не меняет.
+    """
+    def decorator(view):
+        if store is None:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = _request_key(scope)
+            if key is None:
+                return view(*args, **kwargs)
+
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            outcome, saved = store.begin(key, fingerprint)
+            if outcome == 'replay':
+                status, mimetype, body = saved
+                print(f"♻️  Повтор запроса {scope} с ключом идемпотентности - исходный ответ")
+                return Response(body, status=status, mimetype=mimetype, headers={REPLAYED_HEADER: 'true'})
+            if outcome == 'in_progress':
+                return Response('{"status":"error","message":"Request with this idempotency key is in progress"}',
+                                status=409, mimetype='application/json')
+            if outcome == 'mismatch':
+                return Response('{"status":"error","message":"Idempotency key was used with a different request"}',
+                                status=422, mimetype='application/json')
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                store.abandon(key)
+                raise
+            if response.status_code >= 500:
+                store.abandon(key)
+            else:
+                store.finish(key, response.status_code, response.mimetype, response.get_data())
+            return response
+
+        return wrapper
+    return decorator
+
@@ -0,0 +1,77 @@
+"""
+Кодирование JSON ответов: orjson (если установлен) или стандартный json, numpy значения без преобразования
+"""
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # без orjson - стандартный json
+    orjson = None
+
+
+def _default(value):
+    """Значения, которых нет в JSON: numpy скаляры и массивы, остальное - по правилам Flask"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return DefaultJSONProvider.default(value)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Стандартный json Flask, дополнительно понимает numpy скаляры и массивы"""
+
+    name = 'stdlib'
+    default = staticmethod(_default)
+
+
+class OrjsonJSONProvider(DefaultJSONProvider):
+    """JSON на orjson: ответ кодируется сразу в bytes, списки кортежей и numpy значения
+    без промежуточных объектов. Ключи сортируются, как у стандартного провайдера Flask;
+    NaN и бесконечность кодируются как null (стандартный json пишет NaN - это не JSON).
+    """
+
+    name = 'orjson'
+
+    def _option(self, indent=False):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Нестандартные параметры json.dumps (indent, separators и т.п.)
+            return super().dumps(obj, default=_default, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._option()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=_default, option=self._option(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'stdlib': StdlibJSONProvider,
+    'orjson': OrjsonJSONProvider,
+}
+
+
+def create_json_provider(app, name='auto'):
+    """JSON провайдер для app.json: 'orjson', 'stdlib' или 'auto' (orjson, если установлен)"""
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name == 'orjson' and orjson is None:
+        print("⚠️ orjson не установлен - JSON кодируется стандартным json")
+        name = 'stdlib'
+    return JSON_PROVIDERS[name](app)
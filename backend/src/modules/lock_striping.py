@@ -0,0 +1,145 @@
+"""
+Полосы блокировок по владельцу: изменения разных семей в MainPurch/OtherPurch идут параллельно
+"""
+
+import os
+import time
+import zlib
+import threading
+from contextlib import contextmanager, ExitStack
+
+from modules.table_writer import TableFileLock
+
+
+def owner_key(user_id, family_id):
+    """Владелец строк: семья (FamilyID != 0) или пользователь с личным аккаунтом"""
+    try:
+        family_id = int(family_id)
+    except (TypeError, ValueError):
+        family_id = 0
+    return f"family:{family_id}" if family_id else f"user:{user_id}"
+
+
+class _Stripe:
+    """Одна полоса таблицы: блокировка потоков процесса + flock на `<table>.stripe-<n>.lock`"""
+
+    def __init__(self, lock_path):
+        self.lock = threading.Lock()
+        self.file_lock = TableFileLock(lock_path)
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self):
+        started = time.perf_counter()
+        # Полоса занята, если ее держит другой поток процесса или другой процесс
+        contended = not self.lock.acquire(blocking=False)
+        if contended:
+            self.lock.acquire()
+        try:
+            if not self.file_lock.acquire(blocking=False):
+                contended = True
+                self.file_lock.acquire()
+        except BaseException:
+            self.lock.release()
+            raise
+        waited = time.perf_counter() - started
+        # Счетчики меняются только под блокировкой полосы
+        self.acquisitions += 1
+        self.contended += int(contended)
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def release(self):
+        self.file_lock.release()
+        self.lock.release()
+
+    def stats(self):
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": round(self.wait_seconds / self.acquisitions * 1000, 3) if self.acquisitions else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3)
+        }
+
+
+class StripedLocks:
+    """Блокировки строк одного владельца в таблицах.
+
+    Владелец попадает в одну из stripes полос таблицы (crc32 ключа владельца). Изменение строк
+    держит разделяемую блокировку `<table>.lock` (запись таблицы целиком через TableWriter
+    ждет, пока ее отпустят) и исключительную блокировку полосы в таблицах striped_tables.
+    Таблицы и полосы захватываются в одном порядке, поэтому взаимных блокировок нет.
+    """
+
+    def __init__(self, lock_paths, striped_tables, stripes=16):
+        self.lock_paths = lock_paths
+        self.striped_tables = set(striped_tables)
+        self.stripes = stripes
+        self._stripes = {}
+        self._guard = threading.Lock()
+        self.holds = 0
+        self.table_wait_seconds = 0.0
+
+    def stripe_index(self, key):
+        return zlib.crc32(key.encode('utf-8')) % self.stripes
+
+    def _stripe(self, table, index):
+        with self._guard:
+            stripe = self._stripes.get((table, index))
+            if stripe is None:
+                base = os.path.splitext(self.lock_paths[table])[0]
+                stripe = _Stripe(f"{base}.stripe-{index}.lock")
+                self._stripes[(table, index)] = stripe
+            return stripe
+
+    @contextmanager
+    def hold(self, tables, key):
+        """Захват таблиц tables для изменения строк владельца key на время блока"""
+        index = self.stripe_index(key)
+        tables = sorted(set(tables))
+        with ExitStack() as stack:
+            started = time.perf_counter()
+            for table in tables:
+                table_lock = TableFileLock(self.lock_paths[table], shared=True)
+                stack.callback(table_lock.close)
+                table_lock.acquire()
+                stack.callback(table_lock.release)
+            table_wait = time.perf_counter() - started
+            for table in tables:
+                if table in self.striped_tables:
+                    stripe = self._stripe(table, index)
+                    stripe.acquire()
+                    stack.callback(stripe.release)
+            with self._guard:
+                self.holds += 1
+                self.table_wait_seconds += table_wait
+            yield
+
+    def after_fork(self):
+        """Сброс полос в дочернем процессе: flock дескрипторов родителя общий с ним"""
+        self._stripes = {}
+        self._guard = threading.Lock()
+
+    def stats(self):
+        with self._guard:
+            stripes = sorted(self._stripes.items())
+            result = {
+                "stripes": self.stripes,
+                "holds": self.holds,
+                "avg_table_wait_ms": round(self.table_wait_seconds / self.holds * 1000, 3) if self.holds else 0.0,
+                "tables": {}
+            }
+        for (table, index), stripe in stripes:
+            result["tables"].setdefault(table, {})[str(index)] = stripe.stats()
+        for table, table_stripes in result["tables"].items():
+            contended = sum(s["contended"] for s in table_stripes.values())
+            acquisitions = sum(s["acquisitions"] for s in table_stripes.values())
+            result["tables"][table] = {
+                "acquisitions": acquisitions,
+                "contended": contended,
+                "contention_ratio": round(contended / acquisitions, 4) if acquisitions else 0.0,
+                "stripes": table_stripes
+            }
+        return result
@@ -0,0 +1,119 @@
+"""
+Обслуживание MainPurch/OtherPurch: периодическая перезапись в канонической форме (vacuum)
+"""
+
+import json
+import os
+import time
+import threading
+import pandas as pd
+
+
+def canonical_form(spec, df):
+    """Каноническая форма таблицы: одна строка на ключ (агрегация по правилам spec),
+    без строк с нулевым объемом, строки упорядочены по ключу.
+
+    Возвращает (DataFrame, схлопнуто дублей, удалено нулевых строк).
+    """
+    rebuilt = spec.rebuild(df)
+    duplicates = len(df) - len(rebuilt)
+    if 'TotalVolumeGr' in rebuilt.columns:
+        volume = pd.to_numeric(rebuilt['TotalVolumeGr'], errors='coerce')
+        zero = (volume == 0).to_numpy()
+        if zero.any():
+            rebuilt = rebuilt[~zero].reset_index(drop=True)
+        return rebuilt, duplicates, int(zero.sum())
+    return rebuilt, duplicates, 0
+
+
+class CleanMarker:
+    """Отметка `<table>.clean`: версия таблицы, записанная в канонической форме.
+
+    Пока версия таблицы совпадает с отметкой, чтение может не агрегировать строки повторно.
+    """
+
+    def __init__(self, base_path):
+        self.path = os.path.splitext(base_path)[0] + '.clean'
+
+    def signature(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("signature")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def mark(self, signature):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"signature": list(signature), "marked_at": time.time()}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_clean(self, signature):
+        return signature is not None and self.signature() == list(signature)
+
+
+class PurchaseVacuum:
+    """Фоновое обслуживание: таблицы, измененные после прошлой чистки, переписываются
+    в канонической форме раз в interval_seconds"""
+
+    def __init__(self, db_handler, interval_seconds=3600):
+        self.db_handler = db_handler
+        self.interval_seconds = interval_seconds
+        self.runs = 0
+        self.duplicates_merged = 0
+        self.zero_rows_dropped = 0
+        self.last_run = {}
+        self._stats_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            # Повторный запуск - после stop() или в процессе-воркере после fork
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='purchase-vacuum', daemon=True)
+            self._thread.start()
+            print(f"🧽 Обслуживание MainPurch/OtherPurch запущено (каждые {self.interval_seconds} с)")
+
+    def stop(self, wait=False):
+        self._stopped.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval_seconds):
+            for table in self.db_handler.vacuum_tables():
+                try:
+                    if not self.db_handler.is_clean(table):
+                        self.vacuum(table)
+                except Exception as e:
+                    print(f"❌ Ошибка обслуживания {table}: {e}")
+
+    def vacuum(self, table):
+        """Перезапись таблицы в канонической форме"""
+        started = time.perf_counter()
+        result = self.db_handler.vacuum_purchases(table)
+        if result is None:
+            return None
+        rows_before, rows_after, duplicates, zero_rows = result
+        with self._stats_lock:
+            self.runs += 1
+            self.duplicates_merged += duplicates
+            self.zero_rows_dropped += zero_rows
+            self.last_run[table] = {
+                "rows_before": rows_before,
+                "rows_after": rows_after,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "finished_at": time.time()
+            }
+        return result
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "runs": self.runs,
+                "duplicates_merged": self.duplicates_merged,
+                "zero_rows_dropped": self.zero_rows_dropped,
+                "last_run": dict(self.last_run),
+                "clean": {table: self.db_handler.is_clean(table) for table in self.db_handler.vacuum_tables()}
+            }
@@ -0,0 +1,135 @@
+"""
+Общий коммит нескольких таблиц: временные файлы готовятся параллельно и публикуются по маркеру коммита
+"""
+
+import os
+import json
+import glob
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.storage_engines import STAGING_PREFIX, publish
+
+
+def _fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path):
+    """Фиксация переименований в папке (на Windows недоступно - пропускаем)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def new_commit_token():
+    return uuid.uuid4().hex[:16]
+
+
+class CommitLog:
+    """Маркеры коммитов (`commits/<token>.commit`) и восстановление после сбоя.
+
+    Порядок коммита: все временные файлы записаны и сброшены на диск -> атомарно записан
+    маркер со списком переименований -> переименования -> маркер удален. Если маркер есть,
+    коммит доводится до конца (roll forward); временные файлы без маркера - незавершенная
+    подготовка, они удаляются (roll back).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.commits = 0
+        self.recovered_forward = 0
+        self.recovered_back = 0
+
+    def _marker_path(self, token):
+        return os.path.join(self.directory, f"{token}.commit")
+
+    def stage(self, jobs, max_workers=None):
+        """Параллельная подготовка: jobs - функции, возвращающие [(временный файл, файл таблицы)]
+        или None (движок не умеет готовить таблицу). Результаты - в порядке jobs.
+
+        При ошибке любой подготовки уже записанные временные файлы удаляются.
+        """
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(max_workers=max_workers or len(jobs), thread_name_prefix='commit-stage') as pool:
+            futures = [pool.submit(job) for job in jobs]
+        results, error = [], None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(None)
+                error = error or e
+        if error is not None:
+            self.discard([rename for result in results if result for rename in result])
+            raise error
+        return results
+
+    def discard(self, renames):
+        """Удаление подготовленных, но не опубликованных файлов"""
+        for tmp_path, _ in renames:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def commit(self, token, renames):
+        """Публикация подготовленных файлов одним коммитом"""
+        if not renames:
+            return
+        for tmp_path, _ in renames:
+            _fsync_file(tmp_path)
+        os.makedirs(self.directory, exist_ok=True)
+        marker_path = self._marker_path(token)
+        tmp_marker = marker_path + '.tmp'
+        with open(tmp_marker, 'w', encoding='utf-8') as f:
+            json.dump({"renames": renames}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_marker, marker_path)
+        _fsync_dir(self.directory)
+
+        # Точка фиксации пройдена: дальше коммит только доводится до конца
+        publish(renames)
+        for directory in {os.path.dirname(filepath) for _, filepath in renames}:
+            _fsync_dir(directory)
+        os.remove(marker_path)
+        self.commits += 1
+
+    def recover(self, directories):
+        """Доведение или откат незавершенных коммитов (вызывать под блокировками всех таблиц)"""
+        for marker_path in sorted(glob.glob(os.path.join(glob.escape(self.directory), '*.commit'))):
+            try:
+                with open(marker_path, 'r', encoding='utf-8') as f:
+                    renames = json.load(f)["renames"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Коммит {os.path.basename(marker_path)}: маркер не читается ({e})")
+                continue
+            # Часть файлов могла быть переименована до сбоя - доводим остальные
+            publish([(tmp_path, filepath) for tmp_path, filepath in renames if os.path.exists(tmp_path)])
+            os.remove(marker_path)
+            self.recovered_forward += 1
+            print(f"♻️  Коммит {os.path.basename(marker_path)} доведен до конца ({len(renames)} файлов)")
+
+        # Незакоммиченные временные файлы (сбой во время подготовки или записи)
+        for directory in directories:
+            for tmp_path in glob.glob(os.path.join(glob.escape(directory), glob.escape(STAGING_PREFIX) + '*')):
+                os.remove(tmp_path)
+                self.recovered_back += 1
+                print(f"🧹 Удален незакоммиченный временный файл {tmp_path}")
+        for tmp_marker in glob.glob(os.path.join(glob.escape(self.directory), '*.commit.tmp')):
+            os.remove(tmp_marker)
+
+    def stats(self):
+        return {
+            "commits": self.commits,
+            "recovered_forward": self.recovered_forward,
+            "recovered_back": self.recovered_back
+        }
@@ -0,0 +1,254 @@
+"""
+Помесячное партиционирование растущих таблиц (AllPurch, RationInfo)
+"""
+
+import os
+from datetime import datetime
+import pandas as pd
+
+from modules.storage_engines import StorageEngine, select_frame_rows, sync_frame_rows
+from modules.multi_commit import new_commit_token
+
+# Таблица -> колонка с timestamp, по которой строки раскладываются по месяцам
+DEFAULT_PARTITION_COLUMNS = {
+    'allpurch': 'Date',
+    'rationinfo': 'RationDate'
+}
+
+# Партиция для строк без корректной даты (в диапазонные выборки не попадает)
+UNDATED_PARTITION = 'undated'
+
+
+def month_key(timestamp):
+    """Ключ месяца 'YYYY-MM' по timestamp (локальное время, как и во всех датах сервера)"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m')
+
+
+def month_keys(values):
+    """Ключи месяцев для колонки timestamp: datetime строится один раз на уникальное значение"""
+    numeric = pd.to_numeric(values, errors='coerce')
+    keys = pd.Series(UNDATED_PARTITION, index=values.index, dtype=object)
+    valid = numeric.notna()
+    if valid.any():
+        uniques = numeric[valid].unique()
+        mapping = {value: month_key(float(value)) for value in uniques}
+        keys[valid] = numeric[valid].map(mapping)
+    return keys
+
+
+class MonthPartitionedEngine(StorageEngine):
+    """Обертка над движком: таблицы-истории лежат помесячными партициями.
+
+    Партиция 'allpurch/2026-10' хранится внутренним движком как отдельная таблица,
+    например orders/allpurch/2026-10.xlsx (.parquet / .arrow) или таблица SQLite.
+    Вставки затрагивают только партиции своих месяцев, диапазонные выборки
+    открывают только партиции, пересекающиеся с диапазоном.
+    commit_log - CommitLog для публикации раскладки существующей таблицы одним коммитом.
+    """
+
+    def __init__(self, inner, partition_columns=None, commit_log=None):
+        super().__init__(inner.table_paths)
+        self.inner = inner
+        self.name = f"{inner.name}+monthly"
+        self.native_range_scan = inner.native_range_scan
+        self.supports_staging = inner.supports_staging
+        self.supports_marks = inner.supports_marks
+        self.partition_columns = dict(DEFAULT_PARTITION_COLUMNS if partition_columns is None else partition_columns)
+        self.commit_log = commit_log
+
+        for table in self.partition_columns:
+            self._migrate_unpartitioned(table)
+
+    # ---------- партиции ----------
+
+    def _partition_dir(self, table):
+        return os.path.join(os.path.dirname(self.table_paths[table]), table)
+
+    def _partition_name(self, table, month):
+        partition = f"{table}/{month}"
+        if partition not in self.inner.table_paths:
+            legacy_path = os.path.join(self._partition_dir(table), f"{month}.xlsx")
+            self.inner.register_table(partition, legacy_path)
+        return partition
+
+    def partitions(self, table):
+        """Существующие партиции таблицы в порядке месяцев (партиция без даты - последней)"""
+        names = self.inner.list_tables(table, self._partition_dir(table))
+        for name in names:
+            self._partition_name(table, name.split('/', 1)[1])
+        return sorted(names, key=lambda name: (name.endswith('/' + UNDATED_PARTITION), name))
+
+    def partitions_for_range(self, table, column, start, end):
+        """Партиции, которые могут содержать строки из диапазона (partition pruning)"""
+        if table not in self.partition_columns:
+            return [table]
+        names = self.partitions(table)
+        if column != self.partition_columns[table]:
+            return names
+        first_month, last_month = month_key(start), month_key(end)
+        return [name for name in names
+                if name.split('/', 1)[1] != UNDATED_PARTITION
+                and first_month <= name.split('/', 1)[1] <= last_month]
+
+    def _split_by_month(self, table, df):
+        column = self.partition_columns[table]
+        if column not in df.columns:
+            return [(UNDATED_PARTITION, df)]
+        keys = month_keys(df[column])
+        return [(month, df[keys == month]) for month in sorted(keys.unique())]
+
+    def _written_partitions(self, table, df):
+        if df.empty:
+            return [f"{table}/{UNDATED_PARTITION}"]
+        return [f"{table}/{month}" for month, _ in self._split_by_month(table, df)]
+
+    def _migrate_unpartitioned(self, table):
+        """Однократная раскладка существующей таблицы по месяцам (исходная таблица остается архивом).
+
+        Все партиции публикуются одним коммитом - маркером CommitLog (файловые движки) или
+        транзакцией движка (SQLite): после сбоя партиций либо нет и раскладка повторяется
+        при следующем запуске, либо они есть все.
+        """
+        if self.partitions(table) or not self.inner.exists(table):
+            return
+        df = self.inner.read(table)
+        frames = self._partition_frames(table, df)
+        if self.inner.supports_staging and self.commit_log is not None:
+            token = new_commit_token()
+            results = self.commit_log.stage([
+                lambda partition=partition, part_df=part_df: self.inner.stage(partition, part_df, token)
+                for partition, part_df in frames
+            ])
+            self.commit_log.commit(token, [rename for result in results for rename in result])
+        elif self.inner.supports_marks:
+            self.inner.apply_row_changes([('write', partition, part_df) for partition, part_df in frames])
+        else:
+            raise ValueError(f"Движок {self.inner.name}: раскладка {table} по месяцам требует CommitLog")
+        print(f"🗂️  {table}: {len(df)} записей разложено по месяцам в {self._partition_dir(table)}")
+
+    def _write_partitions(self, table, df):
+        for partition, part_df in self._partition_frames(table, df):
+            self.inner.write(partition, part_df)
+
+    def _partition_frames(self, table, df):
+        if df.empty:
+            # Пустая таблица: сохраняем схему в партиции без даты
+            return [(self._partition_name(table, UNDATED_PARTITION), df)]
+        return [(self._partition_name(table, month), part_df.reset_index(drop=True))
+                for month, part_df in self._split_by_month(table, df)]
+
+    # ---------- интерфейс StorageEngine ----------
+
+    def exists(self, table):
+        if table in self.partition_columns:
+            return bool(self.partitions(table))
+        return self.inner.exists(table)
+
+    def read(self, table, columns=None):
+        if table not in self.partition_columns:
+            return self.inner.read(table, columns)
+        names = self.partitions(table)
+        if not names:
+            raise FileNotFoundError(f"Таблица не найдена: {table}")
+        frames = [self.inner.read(name, columns) for name in names]
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def write(self, table, df):
+        if table not in self.partition_columns:
+            return self.inner.write(table, df)
+        old_names = set(self.partitions(table))
+        self._write_partitions(table, df)
+        # Партиции месяцев, которых больше нет в таблице, удаляем
+        for name in old_names - set(self._written_partitions(table, df)):
+            self.inner.drop(name)
+        return True
+
+    def append(self, table, df):
+        if table not in self.partition_columns:
+            return self.inner.append(table, df)
+        # Затрагиваются только партиции месяцев новых строк (обычно - текущего)
+        for month, part_df in self._split_by_month(table, df):
+            self.inner.append(self._partition_name(table, month), part_df.reset_index(drop=True))
+        return len(df)
+
+    def stage(self, table, df, token):
+        if table not in self.partition_columns:
+            return self.inner.stage(table, df, token)
+        # Полная перезапись удаляет партиции ушедших месяцев - публикуется обычным write
+        return None
+
+    def stage_append(self, table, df, token):
+        if table not in self.partition_columns:
+            return self.inner.stage_append(table, df, token)
+        if not self.supports_staging:
+            return None
+        renames = []
+        for month, part_df in self._split_by_month(table, df):
+            renames.extend(self.inner.stage_append(self._partition_name(table, month),
+                                                   part_df.reset_index(drop=True), token))
+        return renames
+
+    def signature(self, table):
+        if table not in self.partition_columns:
+            return self.inner.signature(table)
+        names = self.partitions(table)
+        if not names:
+            return None
+        return tuple((name, self.inner.signature(name)) for name in names)
+
+    def select_rows(self, table, where):
+        if table not in self.partition_columns:
+            return self.inner.select_rows(table, where)
+        return select_frame_rows(self.read(table) if self.exists(table) else pd.DataFrame(), where)
+
+    def apply_row_changes(self, changes, marks=None):
+        # Вставки и перезаписи раскладываются по партициям и идут одной транзакцией с остальными
+        # изменениями; 'sync' партиционированной таблицы - перезаписью (в рабочих путях не встречается)
+        inner_changes, rewrites = [], {}
+        for change in changes:
+            table = change[1]
+            if table not in self.partition_columns:
+                inner_changes.append(change)
+            elif change[0] == 'append':
+                inner_changes.extend(('append', self._partition_name(table, month), part_df.reset_index(drop=True))
+                                     for month, part_df in self._split_by_month(table, change[2]))
+            elif change[0] == 'write':
+                written = self._partition_frames(table, change[2])
+                inner_changes.extend(('write', partition, part_df) for partition, part_df in written)
+                # Партиции месяцев, которых больше нет в таблице, удаляются той же транзакцией
+                inner_changes.extend(('drop', name) for name in
+                                     set(self.partitions(table)) - {partition for partition, _ in written})
+            elif change[0] == 'drop':
+                inner_changes.extend(('drop', name) for name in self.partitions(table))
+            else:
+                df = rewrites.get(table)
+                if df is None:
+                    df = self.read(table) if self.exists(table) else pd.DataFrame()
+                rewrites[table] = sync_frame_rows(df, change[2], change[3])
+        self.inner.apply_row_changes(inner_changes, marks)
+        for table, df in rewrites.items():
+            self.write(table, df)
+
+    def read_mark(self, name):
+        return self.inner.read_mark(name)
+
+    def scan_range(self, table, column, start, end, columns=None, inclusive='both'):
+        frames = [self.inner.scan_range(name, column, start, end, columns, inclusive)
+                  for name in self.partitions_for_range(table, column, start, end)]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def drop(self, table):
+        if table not in self.partition_columns:
+            return self.inner.drop(table)
+        for name in self.partitions(table):
+            self.inner.drop(name)
+
+    def list_tables(self, prefix, directory):
+        return self.inner.list_tables(prefix, directory)
+
+    def location(self, table):
+        if table in self.partition_columns:
+            return self._partition_dir(table)
+        return self.inner.location(table)
@@ -0,0 +1,170 @@
+"""
+Каталог товаров (appdb2 + prodlinks): загружается один раз на версию файла, поиск по ProdID за O(1)
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Optional
+import pandas as pd
+
+from modules.storage_engines import file_signature
+
+STORE_NAMES = {1: "Лавка", 2: "Супермаркет", 3: "Онлайн", 4: "Рынок"}
+
+
+class ProdLinksFormatError(ValueError):
+    """В prodlinks нет обязательной колонки"""
+
+
+@dataclass(frozen=True)
+class Product:
+    """Товар каталога. Строковые поля - как str() ячейки, пустые числа - nan"""
+    prod_id: Optional[int]
+    name: str
+    volume: float
+    unit: str
+    volume_gr: float
+    kcal100g: float
+    prot100g: float
+    fat100g: float
+    carb100g: float
+    tag: str
+    cat: str
+    store: str
+    store_id: int
+    total_cost: float
+
+    @property
+    def store_name(self):
+        return STORE_NAMES.get(self.store_id, f"Магазин {self.store_id}")
+
+
+def _to_prod_id(value):
+    try:
+        return None if pd.isna(value) else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _to_store_id(value):
+    """StoreID товара (пустой или некорректный - 1, основной магазин)"""
+    if pd.isna(value):
+        return 1
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _search_key(value):
+    return '' if pd.isna(value) else str(value).lower()
+
+
+class _CatalogSnapshot:
+    """Разобранная версия appdb2: товары в порядке файла, индекс ProdID и ключи поиска"""
+
+    def __init__(self, df):
+        self.products = []
+        self.by_id = {}
+        self.search_keys = []
+        for record in df.to_dict('records'):
+            raw_id = record.get('ProdID')
+            product = Product(
+                prod_id=_to_prod_id(raw_id),
+                name=str(record.get('Name', '')),
+                volume=_to_float(record.get('Volume', 0)),
+                unit=str(record.get('Unit', 'шт')),
+                volume_gr=_to_float(record.get('VolumeGr', 0)),
+                kcal100g=_to_float(record.get('Kcal100g', 0)),
+                prot100g=_to_float(record.get('Prot100g', 0)),
+                fat100g=_to_float(record.get('Fat100g', 0)),
+                carb100g=_to_float(record.get('Carb100g', 0)),
+                tag=str(record.get('Tag', '')),
+                cat=str(record.get('Cat', '')),
+                store=str(record.get('Store', 'Лавка')),
+                store_id=_to_store_id(record.get('StoreID')),
+                total_cost=_to_float(record.get('TotalCost', 0))
+            )
+            self.products.append(product)
+            self.search_keys.append((_search_key(record.get('Name')),
+                                     _search_key(record.get('Tag')),
+                                     _search_key(record.get('Cat'))))
+            # Как и раньше, при дублях ProdID используется первая строка
+            if not pd.isna(raw_id):
+                self.by_id.setdefault(raw_id, product)
+
+
+class ProductCatalog:
+    """Общий каталог товаров процесса.
+
+    Снимки appdb2 и prodlinks хранятся в кэше таблиц под версией файла: при изменении
+    файла следующее обращение перечитывает его, остальные обращения не трогают диск.
+    """
+
+    def __init__(self, db_handler, prodlinks_path):
+        self.db_handler = db_handler
+        self.prodlinks_path = prodlinks_path
+
+    def _snapshot(self):
+        db_handler = self.db_handler
+        signature = db_handler.storage.signature('appdb2')
+        if signature is None:
+            raise FileNotFoundError(f"Файл не найден: {db_handler.storage.location('appdb2')}")
+        return db_handler.cache.get(db_handler._cache_key('appdb2', 'catalog'), signature,
+                                    lambda: _CatalogSnapshot(db_handler.read_table('appdb2')))
+
+    def preload(self):
+        """Загрузка снимков каталога заранее (до первого запроса); возвращает число товаров"""
+        products = len(self._snapshot().products)
+        if file_signature(self.prodlinks_path) is not None:
+            self._links()
+        return products
+
+    def get(self, prod_id):
+        """Товар по ProdID (None, если его нет в каталоге)"""
+        return self._snapshot().by_id.get(prod_id)
+
+    def search(self, search_term, limit=50):
+        """Товары, у которых название, тег или категория содержат search_term (в порядке файла)"""
+        term = search_term.lower()
+        snapshot = self._snapshot()
+        results = []
+        for product, (name, tag, cat) in zip(snapshot.products, snapshot.search_keys):
+            if term in name or term in tag or term in cat:
+                results.append(product)
+                if len(results) >= limit:
+                    break
+        return results
+
+    # ---------- ссылки на товары ----------
+
+    def _links(self):
+        signature = file_signature(self.prodlinks_path)
+        if signature is None:
+            raise FileNotFoundError(f"Файл не найден: {self.prodlinks_path}")
+        return self.db_handler.cache.get(self.db_handler._cache_key(self.prodlinks_path, 'links'), signature,
+                                         self._load_links)
+
+    def _load_links(self):
+        df = pd.read_excel(self.prodlinks_path)
+        for column in ('ProdID', 'ProductURL'):
+            if column not in df.columns:
+                raise ProdLinksFormatError(f"Excel file must contain '{column}' column")
+        links = {}
+        for prod_id, url_value in zip(df['ProdID'].tolist(), df['ProductURL'].tolist()):
+            if pd.isna(prod_id) or prod_id in links:
+                continue
+            url = str(url_value).strip() if pd.notna(url_value) else ''
+            links[prod_id] = url if url and url.lower() != 'nan' else None
+        return links
+
+    def product_url(self, prod_id):
+        """Ссылка на товар из prodlinks (None, если ссылки нет)"""
+        return self._links().get(prod_id)
@@ -0,0 +1,53 @@
+"""
+Вторичный индекс MainPurch/OtherPurch по владельцу: FamilyID и (UserID, FamilyID) -> позиции строк
+"""
+
+import numpy as np
+import pandas as pd
+
+# Таблицы, для которых поддерживается индекс владельцев
+INDEXED_TABLES = ('mainpurch', 'otherpurch')
+
+_EMPTY = np.array([], dtype=np.intp)
+
+
+class OwnerIndex:
+    """Позиции строк таблицы по семье и по паре (пользователь, семья).
+
+    Строится один раз на версию таблицы (группировкой, без прохода по строкам в Python),
+    после чего выборка холодильника семьи или пользователя стоит O(размер результата).
+    FamilyID сравнивается как число, UserID - как есть.
+    """
+
+    def __init__(self, by_family, by_user_family, has_family_id, has_user_id):
+        self.by_family = by_family
+        self.by_user_family = by_user_family
+        self.has_family_id = has_family_id
+        self.has_user_id = has_user_id
+
+    @classmethod
+    def build(cls, df):
+        has_family_id = 'FamilyID' in df.columns
+        has_user_id = 'UserID' in df.columns
+        by_family, by_user_family = {}, {}
+        positions = pd.Series(np.arange(len(df), dtype=np.intp))
+        if has_family_id:
+            family = pd.to_numeric(df['FamilyID'], errors='coerce').reset_index(drop=True)
+            by_family = positions.groupby(family).indices
+            if has_user_id:
+                user = df['UserID'].reset_index(drop=True)
+                by_user_family = positions.groupby([user, family]).indices
+        return cls(by_family, by_user_family, has_family_id, has_user_id)
+
+    def family_rows(self, family_id):
+        """Позиции строк семьи"""
+        return self.by_family.get(family_id, _EMPTY)
+
+    def user_rows(self, user_id, family_id=0):
+        """Позиции строк пользователя в семье (family_id=0 - личный аккаунт)"""
+        return self.by_user_family.get((user_id, family_id), _EMPTY)
+
+    @staticmethod
+    def select(df, rows):
+        """Строки DataFrame по позициям индекса (позиции идут в порядке таблицы)"""
+        return df.iloc[rows]
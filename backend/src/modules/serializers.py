@@ -0,0 +1,275 @@
+"""
+Сериализация таблиц в позиционные кортежи для моделей iOS (по колонкам, без iterrows)
+
+Каждая колонка приводится к списку Python значений целиком (даты форматируются один раз
+на уникальный день), кортежи собираются через zip. Результат совпадает с прежней построчной
+сборкой: те же типы, те же значения по умолчанию для пустых ячеек и отсутствующих колонок.
+
+Те же колонки отдаются и без сборки кортежей - ответ по колонкам (format=columnar):
+{имя колонки: список значений}.
+"""
+
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+
+from modules.timestamp_index import local_day_keys
+
+DATE_FORMAT = "%d.%m.%Y"
+
+# Признак обязательной колонки: при ее отсутствии - KeyError, как при row['Column']
+REQUIRED = object()
+
+
+def _is_numeric(series):
+    return series.dtype.kind in 'iuf'
+
+
+def _column(df, column, default):
+    """Колонка или None, если ее нет (для обязательной колонки - KeyError)"""
+    if column in df.columns:
+        return df[column]
+    if default is REQUIRED and len(df):
+        raise KeyError(column)
+    return None
+
+
+def _constant(df, default, na, cast=str):
+    """Значение для отсутствующей колонки: na, иначе cast(default) (как row.get(column, default))"""
+    if not len(df):
+        return []
+    return [cast(default) if na is None else na] * len(df)
+
+
+def _fill_missing(series, values, na):
+    """Замена пустых ячеек (NaN/None) значением na"""
+    if na is None:
+        return values
+    missing = series.isna().to_numpy()
+    if not missing.any():
+        return values
+    return [na if is_missing else value for value, is_missing in zip(values, missing)]
+
+
+def str_values(df, column, default='', na=None):
+    """str(значение); пустые ячейки - na (None - как str(NaN): 'nan').
+
+    Пустая строка - тоже пустая ячейка: Excel читает ее как NaN, а SQLite, Parquet/Arrow
+    и журнал вставок хранят '' (или NULL) - ответ не зависит от движка хранения.
+    """
+    series = _column(df, column, default)
+    if series is None:
+        return _constant(df, default, na)
+    values = series.tolist()
+    if _is_numeric(series):
+        return _fill_missing(series, [str(value) for value in values], na)
+    missing = series.isna().to_numpy()
+    empty = str(np.nan) if na is None else na
+    return [empty if is_missing or value == '' else str(value) for value, is_missing in zip(values, missing)]
+
+
+def int_values(df, column, default=0, na=None):
+    """int(значение); пустые ячейки - na (None - ошибка, как у int(nan))"""
+    series = _column(df, column, default)
+    if series is None:
+        return _constant(df, default, na, int)
+    if na is not None and series.isna().any():
+        missing = series.isna().to_numpy()
+        return [na if is_missing else int(value) for value, is_missing in zip(series.tolist(), missing)]
+    if _is_numeric(series):
+        values = series.to_numpy()
+        if values.dtype.kind == 'f' and np.isnan(values).any():
+            raise ValueError("cannot convert float NaN to integer")
+        return values.astype(np.int64).tolist()
+    return [int(value) for value in series.tolist()]
+
+
+def float_values(df, column, default=0, na=None):
+    """float(значение); пустые ячейки - na (None - остаются nan)"""
+    series = _column(df, column, default)
+    if series is None:
+        return _constant(df, default, na, float)
+    if _is_numeric(series):
+        return _fill_missing(series, series.to_numpy(dtype=float).tolist(), na)
+    if na is not None and series.isna().any():
+        missing = series.isna().to_numpy()
+        return [na if is_missing else float(value) for value, is_missing in zip(series.tolist(), missing)]
+    return [float(value) for value in series.tolist()]
+
+
+def _format_date(value):
+    if pd.isna(value):
+        return ""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value).strftime(DATE_FORMAT)
+    return str(value)
+
+
+def date_strings(df, column, default=""):
+    """Дата 'дд.мм.гггг' из timestamp; пустые ячейки - "", строки - как есть"""
+    series = _column(df, column, default)
+    if series is None:
+        return _constant(df, default, None)
+    if not _is_numeric(series):
+        return [_format_date(value) for value in series.tolist()]
+
+    timestamps = series.to_numpy(dtype=float)
+    valid = ~np.isnan(timestamps)
+    result = np.full(len(timestamps), "", dtype=object)
+    if valid.any():
+        # Строка формируется один раз на календарный день, а не на каждую строку таблицы
+        uniques, inverse = np.unique(timestamps[valid], return_inverse=True)
+        days, day_inverse = np.unique(local_day_keys(uniques), return_inverse=True)
+        labels = np.array([date.fromordinal(int(day)).strftime(DATE_FORMAT) for day in days], dtype=object)
+        result[valid] = labels[day_inverse][inverse]
+    return result.tolist()
+
+
+def tuples(columns):
+    """Позиционные кортежи из колонок (имя, значения)"""
+    return list(zip(*[values for _, values in columns]))
+
+
+def columnar(columns):
+    """Ответ по колонкам: {имя: значения} в порядке позиций кортежа"""
+    return {name: values for name, values in columns}
+
+
+# ==================== МОДЕЛИ iOS ====================
+
+def main_purch_columns(df):
+    """MainPurch: 20 элементов (с UserID и FamilyID)"""
+    return [
+        ('ProdID', int_values(df, 'ProdID', REQUIRED)),
+        ('Name', str_values(df, 'Name', REQUIRED)),
+        ('TotalVolume', float_values(df, 'TotalVolume', REQUIRED)),
+        ('Unit', str_values(df, 'Unit', REQUIRED)),
+        ('TotalVolumeGr', float_values(df, 'TotalVolumeGr', REQUIRED)),
+        ('Kcal100g', float_values(df, 'Kcal100g', REQUIRED)),
+        ('Prot100g', float_values(df, 'Prot100g', REQUIRED)),
+        ('Fat100g', float_values(df, 'Fat100g', REQUIRED)),
+        ('Carb100g', float_values(df, 'Carb100g', REQUIRED)),
+        ('ExpireDate', date_strings(df, 'ExpireDate', REQUIRED)),
+        ('Tag', str_values(df, 'Tag', REQUIRED)),
+        ('Cat', str_values(df, 'Cat', REQUIRED)),
+        ('Store', str_values(df, 'Store', REQUIRED)),
+        ('StoreID', int_values(df, 'StoreID', REQUIRED)),
+        ('Date', date_strings(df, 'Date', REQUIRED)),
+        ('TotalCostPerCount', float_values(df, 'TotalCostPerCount', REQUIRED)),
+        ('Address', str_values(df, 'Address', REQUIRED)),
+        ('AddressID', int_values(df, 'AddressID', REQUIRED)),
+        ('UserID', str_values(df, 'UserID', na="")),
+        ('FamilyID', int_values(df, 'FamilyID', na=0))
+    ]
+
+
+def main_purch_tuples(df):
+    """MainPurch: позиционные кортежи для модели iOS"""
+    return tuples(main_purch_columns(df))
+
+
+def other_purch_columns(df):
+    """OtherPurch: 19 элементов (с UserID и FamilyID, без срока годности)"""
+    return [
+        ('ProdID', int_values(df, 'ProdID', REQUIRED)),
+        ('Name', str_values(df, 'Name', REQUIRED)),
+        ('TotalVolume', float_values(df, 'TotalVolume', REQUIRED)),
+        ('Unit', str_values(df, 'Unit', REQUIRED)),
+        ('TotalVolumeGr', float_values(df, 'TotalVolumeGr', REQUIRED)),
+        ('Kcal100g', float_values(df, 'Kcal100g', REQUIRED)),
+        ('Prot100g', float_values(df, 'Prot100g', REQUIRED)),
+        ('Fat100g', float_values(df, 'Fat100g', REQUIRED)),
+        ('Carb100g', float_values(df, 'Carb100g', REQUIRED)),
+        ('Tag', str_values(df, 'Tag', REQUIRED)),
+        ('Cat', str_values(df, 'Cat', REQUIRED)),
+        ('Store', str_values(df, 'Store', REQUIRED)),
+        ('StoreID', int_values(df, 'StoreID', REQUIRED)),
+        ('Date', date_strings(df, 'Date', REQUIRED)),
+        ('TotalCostPerCount', float_values(df, 'TotalCostPerCount', REQUIRED)),
+        ('Address', str_values(df, 'Address', REQUIRED)),
+        ('AddressID', int_values(df, 'AddressID', REQUIRED)),
+        ('UserID', str_values(df, 'UserID', na="")),
+        ('FamilyID', int_values(df, 'FamilyID', na=0))
+    ]
+
+
+def other_purch_tuples(df):
+    """OtherPurch: позиционные кортежи для модели iOS"""
+    return tuples(other_purch_columns(df))
+
+
+def ration_columns(df):
+    """RationInfo: 22 элемента (дата рациона - позиция 14)"""
+    return [
+        ('ProdID', int_values(df, 'ProdID', na=0)),
+        ('Name', str_values(df, 'Name')),
+        ('Volume', float_values(df, 'Volume')),
+        ('Unit', str_values(df, 'Unit')),
+        ('VolumeGr', float_values(df, 'VolumeGr')),
+        ('Kcal100g', float_values(df, 'Kcal100g')),
+        ('Prot100g', float_values(df, 'Prot100g')),
+        ('Fat100g', float_values(df, 'Fat100g')),
+        ('Carb100g', float_values(df, 'Carb100g')),
+        ('ExpireDate', date_strings(df, 'ExpireDate')),
+        ('Tag', str_values(df, 'Tag')),
+        ('Cat', str_values(df, 'Cat')),
+        ('MealID', int_values(df, 'MealID')),
+        ('MealName', str_values(df, 'MealName')),
+        ('RationDate', date_strings(df, 'RationDate')),
+        ('VolumeServ', float_values(df, 'VolumeServ')),
+        ('VolumeServGr', float_values(df, 'VolumeServGr')),
+        ('KcalServ', float_values(df, 'KcalServ')),
+        ('ProtServ', float_values(df, 'ProtServ')),
+        ('FatServ', float_values(df, 'FatServ')),
+        ('CarbServ', float_values(df, 'CarbServ')),
+        ('UserID', str_values(df, 'UserID'))
+    ]
+
+
+def ration_tuples(df):
+    """RationInfo: позиционные кортежи для модели iOS"""
+    return tuples(ration_columns(df))
+
+
+def allpurch_total_costs(df):
+    """Стоимость покупки: TotalCostPerCount, при пустом значении - TotalCost, иначе 0.0"""
+    costs = [0.0] * len(df)
+    # Запасная колонка применяется первой, основная - поверх нее
+    for column in ('TotalCost', 'TotalCostPerCount'):
+        if column in df.columns:
+            missing = df[column].isna().to_numpy()
+            costs = [cost if is_missing else value
+                     for cost, value, is_missing in zip(costs, float_values(df, column, na=0.0), missing)]
+    return costs
+
+
+def allpurch_columns(df):
+    """AllPurch: 20 элементов для модели статистики"""
+    rows = len(df)
+    return [
+        ('ProdID', int_values(df, 'ProdID', na=0)),
+        ('Name', str_values(df, 'Name')),
+        ('Volume', float_values(df, 'Volume', na=0)),
+        ('Unit', str_values(df, 'Unit')),
+        ('VolumeGr', float_values(df, 'VolumeGr', na=0)),
+        ('Kcal100g', float_values(df, 'Kcal100g', na=0)),
+        ('Prot100g', float_values(df, 'Prot100g', na=0)),
+        ('Fat100g', float_values(df, 'Fat100g', na=0)),
+        ('Carb100g', float_values(df, 'Carb100g', na=0)),
+        ('ExpireDate', date_strings(df, 'ExpireDate')),
+        ('Tag', str_values(df, 'Tag')),
+        ('Cat', str_values(df, 'Cat')),
+        ('Store', str_values(df, 'Store', na="")),
+        ('StoreID', int_values(df, 'StoreID', na=0)),
+        ('Date', date_strings(df, 'Date')),
+        ('PrefMealID', [0] * rows),    # нет в AllPurch
+        ('PrefMeal', [""] * rows),     # нет в AllPurch
+        ('TotalCost', allpurch_total_costs(df)),
+        ('Address', str_values(df, 'Address', na="")),
+        ('AddressID', int_values(df, 'AddressID', na=0))
+    ]
+
+
+def allpurch_tuples(df):
+    """AllPurch: позиционные кортежи для модели iOS"""
+    return tuples(allpurch_columns(df))
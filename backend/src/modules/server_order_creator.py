@@ -4,8 +4,14 @@
 
 import pandas as pd
 import os
+import time
 from datetime import datetime
 
+from modules.aggregation import MAIN_PURCH_SPEC, OTHER_PURCH_SPEC
+
+# Таблицы, которые заказ изменяет одним коммитом
+ORDER_TABLES = ('allpurch', 'mainpurch', 'otherpurch')
+
 class ServerOrderCreator:
     """Серверный обработчик создания заказов (заменяет SwiftData логику)"""
     
@@ -19,7 +25,11 @@ class ServerOrderCreator:
         
     def _ensure_allpurch_file(self):
         """Создает файл AllPurch.xlsx если его не существует (с новыми колонками)"""
-        if not os.path.exists(self.all_purch_path):
+        # Проверка и создание - в очереди записи allpurch: файл может создавать и другой процесс
+        self.db_handler.mutate('allpurch', self._create_allpurch_file)
+    
+    def _create_allpurch_file(self):
+        if not self.db_handler.table_exists(self.all_purch_path):
             print(f"📄 Создаю файл AllPurch.xlsx...")
             
             # Определяем колонки (добавляем новые)
@@ -36,7 +46,7 @@ class ServerOrderCreator:
             df = pd.DataFrame(columns=columns)
             
             # Сохраняем
-            df.to_excel(self.all_purch_path, index=False)
+            self.db_handler.save_excel(df, self.all_purch_path)
             print(f"✅ Файл AllPurch.xlsx создан: {self.all_purch_path}")
     
     def create_order_from_cart(self, order_data):
@@ -60,62 +70,103 @@ class ServerOrderCreator:
         # Получаем user_id если есть
         user_id = order_data.get('user_id', '')
         
-        # Получаем данные из базы товаров
-        products_df = self.db_handler.read_excel(self.db_handler.products_db_path)
+        # Каталог товаров (общий для процесса, перечитывается только при изменении appdb2)
+        catalog = self.db_handler.catalog
         
         # Готовим данные для сохранения
+        all_items, main_items, other_items, missing = self._prepare_order(order_data, catalog.get)
+        for prod_id in missing:
+            print(f"⚠️ Товар ProdID {prod_id} не найден в базе, пропускаем")
+        
+        if not all_items:
+            return {"status": "error", "message": "No valid items found in cart"}
+        
+        print(f"📦 Подготовлено для сохранения:")
+        print(f"   Всего товаров: {len(all_items)}")
+        print(f"   UserID: {user_id}")
+        print(f"   Для MainPurch (StoreID=1): {len(main_items)}")
+        print(f"   Для OtherPurch: {len(other_items)}")
+        
+        # Сохраняем в файлы
+        try:
+            # Три таблицы публикуются одним коммитом: файлы готовятся параллельно,
+            # после сбоя заказ либо записан целиком, либо не записан вовсе.
+            # Заказ меняет только строки владельца - с полосами блокировок заказы
+            # разных семей записываются параллельно. Ошибка любой таблицы выходит
+            # из блока и отменяет весь заказ
+            owner = (user_id, int(order_data['family_id']))
+            with self.db_handler.transaction(ORDER_TABLES, owner=owner):
+                # 1. Сохраняем в AllPurch
+                all_saved = self._save_to_all_purch(all_items)
+                
+                # 2. Сохраняем/обновляем в MainPurch (с новой агрегацией)
+                main_updated = self._update_main_purch_with_aggregation(main_items)
+                
+                # 3. Сохраняем в OtherPurch с агрегацией
+                other_saved = self._save_to_other_purch(other_items)
+            
+            return {
+                "status": "success",
+                "message": f"✅ Заказ успешно создан! Сохранено {all_saved} товаров в AllPurch, обновлено {main_updated} в MainPurch, обновлено {other_saved} в OtherPurch",
+                "data": {
+                    "all_saved": all_saved,
+                    "main_updated": main_updated,
+                    "other_saved": other_saved,
+                    "total_items": len(all_items),
+                    "user_id": user_id
+                }
+            }
+            
+        except Exception as e:
+            print(f"❌ Ошибка при сохранении заказа: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            # Сбой хранилища - не ошибка запроса: повтор с тем же ключом выполняется заново
+            return {"status": "error", "message": f"Error saving order: {str(e)}", "retryable": True}
+    
+    def _prepare_order(self, order_data, lookup):
+        """Записи заказа по товарам корзины: (все, для MainPurch, для OtherPurch, ненайденные ProdID).
+        
+        lookup - поиск товара по ProdID (каталог или заранее разрешенный словарь)
+        """
+        user_id = order_data.get('user_id', '')
         all_items = []
         main_items = []
         other_items = []
+        missing = []
         
         for cart_item in order_data['items']:
             prod_id = cart_item.get('prod_id')
             quantity = cart_item.get('quantity', 1)
             
-            # Ищем товар в базе
-            product_row = products_df[products_df['ProdID'] == prod_id]
+            # Ищем товар в каталоге по ProdID
+            product = lookup(prod_id)
             
-            if product_row.empty:
-                print(f"⚠️ Товар ProdID {prod_id} не найден в базе, пропускаем")
+            if product is None:
+                missing.append(prod_id)
                 continue
             
-            # Получаем данные товара
-            row = product_row.iloc[0]
-            
-            # Обрабатываем StoreID
-            store_id_value = row.get('StoreID')
-            if pd.isna(store_id_value):
-                store_id = 1
-            else:
-                try:
-                    store_id = int(store_id_value)
-                except:
-                    store_id = 1
-            
-            # Сохраняем исходные значения (для 1 единицы товара)
-            volume_per_unit = float(row.get('Volume', 0))
-            volume_gr_per_unit = float(row.get('VolumeGr', 0))
-            total_cost_per_unit = float(row.get('TotalCost', 0))
+            store_id = product.store_id
             
             # Формируем запись с оригинальными значениями (для 1 единицы)
             record = {
                 'ProdID': int(prod_id),
-                'Name': str(row.get('Name', '')),
-                'Volume': float(volume_per_unit),  # Для 1 единицы
-                'Unit': str(row.get('Unit', 'шт')),
-                'VolumeGr': float(volume_gr_per_unit),  # Для 1 единицы
-                'Kcal100g': float(row.get('Kcal100g', 0)),
-                'Prot100g': float(row.get('Prot100g', 0)),
-                'Fat100g': float(row.get('Fat100g', 0)),
-                'Carb100g': float(row.get('Carb100g', 0)),
+                'Name': product.name,
+                'Volume': product.volume,  # Для 1 единицы
+                'Unit': product.unit,
+                'VolumeGr': product.volume_gr,  # Для 1 единицы
+                'Kcal100g': product.kcal100g,
+                'Prot100g': product.prot100g,
+                'Fat100g': product.fat100g,
+                'Carb100g': product.carb100g,
                 'ExpireDate': '',  # Пустая строка
-                'Tag': str(row.get('Tag', '')),
-                'Cat': str(row.get('Cat', '')),
-                'Store': str(row.get('Store', 'Лавка')),
-                'StoreID': int(store_id),
+                'Tag': product.tag,
+                'Cat': product.cat,
+                'Store': product.store,
+                'StoreID': store_id,
                 'Date': str(order_data['order_date']),
                 'FamilyID': int(order_data['family_id']),
-                'TotalCost': float(total_cost_per_unit),  # Для 1 единицы
+                'TotalCost': product.total_cost,  # Для 1 единицы
                 'Address': f"Адрес {order_data['address_id']}",
                 'AddressID': int(order_data['address_id']),
                 'UserID': user_id,  # ← UserID из заказа
@@ -130,306 +181,263 @@ class ServerOrderCreator:
             else:
                 other_items.append(record)
         
+        return all_items, main_items, other_items, missing
+    
+    def create_orders_batch(self, orders):
+        """Пакетная загрузка заказов (перенос истории заказов партнера).
+        
+        ProdID всех заказов разрешаются по каталогу за один проход, строки всех заказов
+        агрегируются вместе, и каждая таблица записывается один раз - одним общим коммитом
+        AllPurch, MainPurch и OtherPurch. Некорректные заказы пропускаются и перечисляются
+        в rejected, остальные сохраняются.
+        """
+        started = time.perf_counter()
+        catalog = self.db_handler.catalog
+        
+        rejected = []
+        valid_orders = []
+        for index, order_data in enumerate(orders):
+            message = self._validate_batch_order(order_data)
+            if message:
+                rejected.append({"index": index, "message": message})
+            else:
+                valid_orders.append((index, order_data))
+        
+        # Каждый ProdID ищется в каталоге один раз на весь пакет
+        products = {}
+        for _, order_data in valid_orders:
+            for cart_item in order_data['items']:
+                prod_id = cart_item.get('prod_id')
+                if prod_id not in products:
+                    products[prod_id] = catalog.get(prod_id)
+        
+        all_items = []
+        main_items = []
+        other_items = []
+        missing_products = set()
+        accepted = 0
+        for index, order_data in valid_orders:
+            order_all, order_main, order_other, missing = self._prepare_order(order_data, products.get)
+            missing_products.update(missing)
+            if not order_all:
+                rejected.append({"index": index, "message": "No valid items found in cart"})
+                continue
+            accepted += 1
+            all_items.extend(order_all)
+            main_items.extend(order_main)
+            other_items.extend(order_other)
+        
+        if missing_products:
+            print(f"⚠️ Не найдено в каталоге ProdID: {len(missing_products)}, такие товары пропущены")
+        
         if not all_items:
-            return {"status": "error", "message": "No valid items found in cart"}
+            return {"status": "error", "message": "No valid orders in batch", "data": {"rejected": rejected}}
         
-        print(f"📦 Подготовлено для сохранения:")
-        print(f"   Всего товаров: {len(all_items)}")
-        print(f"   UserID: {user_id}")
-        print(f"   Для MainPurch (StoreID=1): {len(main_items)}")
-        print(f"   Для OtherPurch: {len(other_items)}")
+        print(f"📦 Пакет заказов: принято {accepted} из {len(orders)}, товаров {len(all_items)} "
+              f"(MainPurch: {len(main_items)}, OtherPurch: {len(other_items)})")
         
-        # Сохраняем в файлы
         try:
-            # 1. Сохраняем в AllPurch
-            all_saved = self._save_to_all_purch(all_items)
-            
-            # 2. Сохраняем/обновляем в MainPurch (с новой агрегацией)
-            main_updated = self._update_main_purch_with_aggregation(main_items)
-            
-            # 3. Сохраняем в OtherPurch с агрегацией
-            other_saved = self._save_to_other_purch(other_items)
-            
-            return {
-                "status": "success",
-                "message": f"✅ Заказ успешно создан! Сохранено {all_saved} товаров в AllPurch, обновлено {main_updated} в MainPurch, обновлено {other_saved} в OtherPurch",
-                "data": {
-                    "all_saved": all_saved,
-                    "main_updated": main_updated,
-                    "other_saved": other_saved,
-                    "total_items": len(all_items),
-                    "user_id": user_id
-                }
-            }
-            
+            # Одна запись на таблицу: строки всех заказов вливаются в MainPurch/OtherPurch разом
+            with self.db_handler.transaction(ORDER_TABLES):
+                all_saved = self._save_to_all_purch(all_items)
+                main_updated = self._update_main_purch_with_aggregation(main_items)
+                other_saved = self._save_to_other_purch(other_items)
         except Exception as e:
-            print(f"❌ Ошибка при сохранении заказа: {str(e)}")
+            print(f"❌ Ошибка при сохранении пакета заказов: {str(e)}")
             import traceback
             traceback.print_exc()
-            return {"status": "error", "message": f"Error saving order: {str(e)}"}
+            return {"status": "error", "message": f"Error saving orders batch: {str(e)}", "retryable": True}
+        
+        elapsed = time.perf_counter() - started
+        orders_per_second = accepted / elapsed if elapsed > 0 else 0.0
+        print(f"✅ Пакет сохранен за {elapsed:.2f} с: {orders_per_second:.1f} заказов/с")
+        
+        return {
+            "status": "success",
+            "message": f"✅ Загружено {accepted} заказов из {len(orders)} ({orders_per_second:.1f} заказов/с)",
+            "data": {
+                "orders": len(orders),
+                "accepted": accepted,
+                "rejected": rejected,
+                "missing_products": sorted(missing_products, key=str),
+                "all_saved": all_saved,
+                "main_updated": main_updated,
+                "other_saved": other_saved,
+                "total_items": len(all_items),
+                "elapsed_seconds": round(elapsed, 3),
+                "orders_per_second": round(orders_per_second, 1)
+            }
+        }
+    
+    def _validate_batch_order(self, order_data):
+        """Причина отказа для заказа пакета (None - заказ корректен)"""
+        if not isinstance(order_data, dict):
+            return "Order must be an object"
+        
+        required_fields = ['family_id', 'address_id', 'order_date', 'items']
+        missing_fields = [field for field in required_fields if field not in order_data]
+        if missing_fields:
+            return f"Missing required fields: {', '.join(missing_fields)}"
+        
+        if not order_data['items'] or not isinstance(order_data['items'], list):
+            return "Cart is empty"
+        
+        # Ошибка в одном заказе не должна срывать запись всего пакета
+        try:
+            int(order_data['family_id'])
+            int(order_data['address_id'])
+            datetime.strptime(str(order_data['order_date']), "%d.%m.%Y")
+        except (TypeError, ValueError) as e:
+            return f"Invalid order field: {e}"
+        
+        if not all(isinstance(cart_item, dict) for cart_item in order_data['items']):
+            return "Cart items must be objects"
+        return None
     
     def _save_to_all_purch(self, items):
         """Сохраняет все товары в AllPurch.xlsx (с расчетными полями, но без агрегации)"""
-        try:
-            if not items:
-                return 0
+        if not items:
+            return 0
+        
+        # Подготавливаем данные для AllPurch с расчетными полями
+        all_purch_items = []
+        for item in items:
+            quantity = item.get('quantity', 1)
             
-            # Подготавливаем данные для AllPurch с расчетными полями
-            all_purch_items = []
-            for item in items:
-                quantity = item.get('quantity', 1)
-                
-                order_date = datetime.strptime(item['Date'], "%d.%m.%Y")
-                item['Date'] = int(order_date.timestamp())
-                
-                # Копируем основные поля
-                all_purch_item = {k: v for k, v in item.items()
-                                 if k not in ['quantity']}
-                
-                # Добавляем расчетные поля
-                all_purch_item['Count'] = quantity
-                all_purch_item['TotalVolume'] = item['Volume'] * quantity
-                all_purch_item['TotalVolumeGr'] = item['VolumeGr'] * quantity
-                all_purch_item['TotalCostPerCount'] = item['TotalCost'] * quantity
-                
-                # Убедимся, что UserID есть
-                if 'UserID' not in all_purch_item:
-                    all_purch_item['UserID'] = item.get('UserID', '')
-                
-                all_purch_items.append(all_purch_item)
+            order_date = datetime.strptime(item['Date'], "%d.%m.%Y")
+            item['Date'] = int(order_date.timestamp())
             
-            # Создаем DataFrame
-            df = pd.DataFrame(all_purch_items)
+            # Копируем основные поля
+            all_purch_item = {k: v for k, v in item.items()
+                             if k not in ['quantity']}
             
-            # Если файл существует, добавляем к существующим данным
-            if os.path.exists(self.all_purch_path):
-                existing_df = pd.read_excel(self.all_purch_path)
-                
-                # Заполняем NaN в новых столбцах
-                for col in ['Count', 'TotalVolume', 'TotalVolumeGr', 'TotalCostPerCount']:
-                    if col in existing_df.columns:
-                        existing_df[col] = existing_df[col].fillna(0)
-                    else:
-                        # Если столбца нет, создаем его с нулями
-                        existing_df[col] = 0
-                
-                # Для UserID заполняем пустыми строками
-                if 'UserID' in existing_df.columns:
-                    existing_df['UserID'] = existing_df['UserID'].fillna('')
-                else:
-                    existing_df['UserID'] = ''
-                
-                combined_df = pd.concat([existing_df, df], ignore_index=True)
-            else:
-                combined_df = df
+            # Добавляем расчетные поля
+            all_purch_item['Count'] = quantity
+            all_purch_item['TotalVolume'] = item['Volume'] * quantity
+            all_purch_item['TotalVolumeGr'] = item['VolumeGr'] * quantity
+            all_purch_item['TotalCostPerCount'] = item['TotalCost'] * quantity
             
-            # Сохраняем
-            combined_df.to_excel(self.all_purch_path, index=False)
-            print(f"✅ Сохранено {len(items)} товаров в AllPurch.xlsx (с расчетными полями)")
-            return len(items)
+            # Убедимся, что UserID есть
+            if 'UserID' not in all_purch_item:
+                all_purch_item['UserID'] = item.get('UserID', '')
             
-        except Exception as e:
-            print(f"❌ Ошибка сохранения в AllPurch: {e}")
-            import traceback
-            traceback.print_exc()
-            return 0
+            all_purch_items.append(all_purch_item)
+        
+        # Создаем DataFrame
+        df = pd.DataFrame(all_purch_items)
+        
+        # Добавляем к существующим данным (AllPurch - только вставки, без агрегации)
+        self.db_handler.append_rows(df, self.all_purch_path)
+        print(f"✅ Сохранено {len(items)} товаров в AllPurch.xlsx (с расчетными полями)")
+        return len(items)
     
     def _update_main_purch_with_aggregation(self, items):
-        """Обновляет MainPurch.xlsx с агрегацией (ProdID + FamilyID + UserID)"""
-        try:
-            if not items:
-                return 0
-                
-            main_purch_path = self.db_handler.main_purch_path
+        """Обновляет MainPurch.xlsx с агрегацией по ключу (ProdID + FamilyID + UserID)"""
+        if not items:
+            return 0
             
-            print(f"🔄 Обновление MainPurch: получено {len(items)} товаров")
+        print(f"🔄 Обновление MainPurch: получено {len(items)} товаров")
+        
+        # Создаем DataFrame из новых товаров с расчетными полями
+        new_items_list = []
+        for item in items:
+            quantity = item.get('quantity', 1)
+            new_item = item.copy()  # Копируем все поля
             
-            # Создаем DataFrame из новых товаров с расчетными полями
-            new_items_list = []
-            for item in items:
-                quantity = item.get('quantity', 1)
-                new_item = item.copy()  # Копируем все поля
-                
-                # Добавляем расчетные поля
-                new_item['Count'] = quantity
-                new_item['TotalVolume'] = item['Volume'] * quantity
-                new_item['TotalVolumeGr'] = item['VolumeGr'] * quantity
-                new_item['TotalCostPerCount'] = item['TotalCost'] * quantity
-                
-                # Удаляем временное поле quantity
-                if 'quantity' in new_item:
-                    del new_item['quantity']
-                
-                new_items_list.append(new_item)
+            # Добавляем расчетные поля
+            new_item['Count'] = quantity
+            new_item['TotalVolume'] = item['Volume'] * quantity
+            new_item['TotalVolumeGr'] = item['VolumeGr'] * quantity
+            new_item['TotalCostPerCount'] = item['TotalCost'] * quantity
             
-            new_df = pd.DataFrame(new_items_list)
+            # Удаляем временное поле quantity
+            if 'quantity' in new_item:
+                del new_item['quantity']
             
-            if os.path.exists(main_purch_path):
-                # Читаем существующие данные
-                existing_df = pd.read_excel(main_purch_path)
-                print(f"📊 Существующий MainPurch содержит {len(existing_df)} записей")
-                
-                # Объединяем
-                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-                print(f"📊 После объединения: {len(combined_df)} записей")
-                
-                # Заполняем NaN значения
-                for col in ['Count', 'TotalVolume', 'TotalVolumeGr', 'TotalCostPerCount']:
-                    if col in combined_df.columns:
-                        combined_df[col] = combined_df[col].fillna(0)
-                
-                # Заполняем UserID пустыми строками
-                if 'UserID' in combined_df.columns:
-                    combined_df['UserID'] = combined_df['UserID'].fillna('')
-                else:
-                    combined_df['UserID'] = ''
-                
-                # Определяем функции агрегации
-                agg_functions = {
-                    'Name': 'first',
-                    'Volume': 'first',
-                    'Unit': 'first',
-                    'VolumeGr': 'first',
-                    'Kcal100g': 'first',
-                    'Prot100g': 'first',
-                    'Fat100g': 'first',
-                    'Carb100g': 'first',
-                    'ExpireDate': 'first',
-                    'Tag': 'first',
-                    'Cat': 'first',
-                    'Store': 'first',
-                    'StoreID': 'first',
-                    'Date': 'min',
-                    'TotalCost': 'first',
-                    'Address': 'first',
-                    'AddressID': 'first',
-                    'Count': 'sum',
-                    'TotalVolume': 'sum',
-                    'TotalVolumeGr': 'sum',
-                    'TotalCostPerCount': 'sum'
-                }
-                
-                # Убираем столбцы, которых нет в DataFrame
-                agg_functions = {k: v for k, v in agg_functions.items()
-                               if k in combined_df.columns}
-                
-                # Агрегируем по ProdID, FamilyID и UserID
-                print(f"🔍 Агрегация по ['ProdID', 'FamilyID', 'UserID']...")
-                agg_df = combined_df.groupby(['ProdID', 'FamilyID', 'UserID']).agg(agg_functions).reset_index()
-                
-                print(f"📊 После агрегации: {len(agg_df)} уникальных записей (ProdID+FamilyID+UserID)")
-                
-                # Сохраняем агрегированные данные
-                agg_df.to_excel(main_purch_path, index=False)
-                print(f"✅ MainPurch обновлен. Уникальных записей: {len(agg_df)}")
-                return len(agg_df)
-            else:
-                # Создаем новый файл
-                new_df.to_excel(main_purch_path, index=False)
-                print(f"✅ MainPurch создан. Добавлено {len(items)} товаров")
-                return len(items)
-                
-        except Exception as e:
-            print(f"❌ Ошибка обновления MainPurch: {e}")
-            import traceback
-            traceback.print_exc()
-            return 0
+            new_items_list.append(new_item)
+        
+        new_df = pd.DataFrame(new_items_list)
+        
+        # Чтение, агрегация и запись - одной операцией в очереди записи таблицы
+        return self.db_handler.mutate('mainpurch', lambda: self._merge_main_purch(new_df))
+    
+    def _merge_main_purch(self, new_df):
+        """Слияние новых строк с MainPurch по ключу (выполняется в очереди записи mainpurch)"""
+        main_purch_path = self.db_handler.main_purch_path
+        
+        if self.db_handler.table_exists(main_purch_path):
+            # Индекс владельцев: строки ищутся среди строк пользователя в семье
+            existing_df, index = self.db_handler.read_indexed('mainpurch')
+            print(f"📊 Существующий MainPurch содержит {len(existing_df)} записей")
+            
+            # Upsert по ключу MainPurch: у совпавших строк обновляются суммы и минимальная дата,
+            # остальные строки не переагрегируются
+            df, updated, inserted = MAIN_PURCH_SPEC.merge(existing_df, index, new_df)
+            print(f"📊 Обновлено записей: {updated}, добавлено новых: {inserted}")
+            
+            self.db_handler.save_excel(df, main_purch_path)
+            print(f"✅ MainPurch обновлен. Уникальных записей: {len(df)}")
+            # Строки, затронутые заказом (а не размер таблицы: с полосами блокировок df -
+            # только строки владельца)
+            return updated + inserted
+        else:
+            # Создаем новый файл
+            self.db_handler.save_excel(new_df, main_purch_path)
+            print(f"✅ MainPurch создан. Добавлено {len(new_df)} товаров")
+            return len(new_df)
     
     def _save_to_other_purch(self, items):
         """Сохраняет товары в OtherPurch.xlsx с агрегацией (ProdID + FamilyID + StoreID + Date + UserID)"""
-        try:
-            if not items:
-                return 0
-                
-            other_purch_path = self.db_handler.other_purch_path
+        if not items:
+            return 0
             
-            print(f"🔄 Обновление OtherPurch: получено {len(items)} товаров")
+        print(f"🔄 Обновление OtherPurch: получено {len(items)} товаров")
+        
+        # Создаем DataFrame из новых товаров с расчетными полями
+        new_items_list = []
+        for item in items:
+            quantity = item.get('quantity', 1)
+            new_item = item.copy()  # Копируем все поля
             
-            # Создаем DataFrame из новых товаров с расчетными полями
-            new_items_list = []
-            for item in items:
-                quantity = item.get('quantity', 1)
-                new_item = item.copy()  # Копируем все поля
-                
-                # Добавляем расчетные поля
-                new_item['Count'] = quantity
-                new_item['TotalVolume'] = item['Volume'] * quantity
-                new_item['TotalVolumeGr'] = item['VolumeGr'] * quantity
-                new_item['TotalCostPerCount'] = item['TotalCost'] * quantity
-                
-                # Удаляем временное поле quantity
-                if 'quantity' in new_item:
-                    del new_item['quantity']
-                
-                new_items_list.append(new_item)
+            # Добавляем расчетные поля
+            new_item['Count'] = quantity
+            new_item['TotalVolume'] = item['Volume'] * quantity
+            new_item['TotalVolumeGr'] = item['VolumeGr'] * quantity
+            new_item['TotalCostPerCount'] = item['TotalCost'] * quantity
             
-            new_df = pd.DataFrame(new_items_list)
+            # Удаляем временное поле quantity
+            if 'quantity' in new_item:
+                del new_item['quantity']
             
-            if os.path.exists(other_purch_path):
-                # Читаем существующие данные
-                existing_df = pd.read_excel(other_purch_path)
-                print(f"📊 Существующий OtherPurch содержит {len(existing_df)} записей")
-                
-                # Объединяем
-                combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-                print(f"📊 После объединения: {len(combined_df)} записей")
-                
-                # Заполняем NaN значения
-                for col in ['Count', 'TotalVolume', 'TotalVolumeGr', 'TotalCostPerCount']:
-                    if col in combined_df.columns:
-                        combined_df[col] = combined_df[col].fillna(0)
-                
-                # Заполняем UserID пустыми строками
-                if 'UserID' in combined_df.columns:
-                    combined_df['UserID'] = combined_df['UserID'].fillna('')
-                else:
-                    combined_df['UserID'] = ''
-                
-                # Определяем функции агрегации
-                agg_functions = {
-                    'Name': 'first',
-                    'Volume': 'first',
-                    'Unit': 'first',
-                    'VolumeGr': 'first',
-                    'Kcal100g': 'first',
-                    'Prot100g': 'first',
-                    'Fat100g': 'first',
-                    'Carb100g': 'first',
-                    'ExpireDate': 'first',
-                    'Tag': 'first',
-                    'Cat': 'first',
-                    'Store': 'first',
-                    'TotalCost': 'first',
-                    'Address': 'first',
-                    'AddressID': 'first',
-                    'Count': 'sum',
-                    'TotalVolume': 'sum',
-                    'TotalVolumeGr': 'sum',
-                    'TotalCostPerCount': 'sum'
-                }
-                
-                # Убираем столбцы, которых нет в DataFrame
-                agg_functions = {k: v for k, v in agg_functions.items()
-                               if k in combined_df.columns}
-                
-                # Агрегируем по ProdID, FamilyID, StoreID, Date и UserID
-                print(f"🔍 Агрегация OtherPurch по ['ProdID', 'FamilyID', 'StoreID', 'Date', 'UserID']...")
-                agg_df = combined_df.groupby(['ProdID', 'FamilyID', 'StoreID', 'Date', 'UserID']).agg(agg_functions).reset_index()
-                
-                print(f"📊 После агрегации: {len(agg_df)} уникальных записей")
-                
-                # Сохраняем агрегированные данные
-                agg_df.to_excel(other_purch_path, index=False)
-                print(f"✅ OtherPurch обновлен. Уникальных записей: {len(agg_df)}")
-                return len(agg_df)
-            else:
-                # Создаем новый файл
-                new_df.to_excel(other_purch_path, index=False)
-                print(f"✅ OtherPurch создан. Добавлено {len(items)} товаров")
-                return len(items)
-                
-        except Exception as e:
-            print(f"❌ Ошибка обновления OtherPurch: {e}")
-            import traceback
-            traceback.print_exc()
-            return 0
+            new_items_list.append(new_item)
+        
+        new_df = pd.DataFrame(new_items_list)
+        
+        # Чтение, агрегация и запись - одной операцией в очереди записи таблицы
+        return self.db_handler.mutate('otherpurch', lambda: self._merge_other_purch(new_df))
+    
+    def _merge_other_purch(self, new_df):
+        """Слияние новых строк с OtherPurch по ключу (выполняется в очереди записи otherpurch)"""
+        other_purch_path = self.db_handler.other_purch_path
+        
+        if self.db_handler.table_exists(other_purch_path):
+            # Индекс владельцев: строки ищутся среди строк пользователя в семье
+            existing_df, index = self.db_handler.read_indexed('otherpurch')
+            print(f"📊 Существующий OtherPurch содержит {len(existing_df)} записей")
+            
+            # Upsert по ключу OtherPurch (ProdID, FamilyID, StoreID, Date, UserID): у совпавших строк
+            # обновляются суммы, остальные строки не переагрегируются
+            df, updated, inserted = OTHER_PURCH_SPEC.merge(existing_df, index, new_df)
+            print(f"📊 Обновлено записей: {updated}, добавлено новых: {inserted}")
+            
+            self.db_handler.save_excel(df, other_purch_path)
+            print(f"✅ OtherPurch обновлен. Уникальных записей: {len(df)}")
+            # Строки, затронутые заказом (а не размер таблицы: с полосами блокировок df -
+            # только строки владельца)
+            return updated + inserted
+        else:
+            # Создаем новый файл
+            self.db_handler.save_excel(new_df, other_purch_path)
+            print(f"✅ OtherPurch создан. Добавлено {len(new_df)} товаров")
+            return len(new_df)
+
@@ -94,7 +94,8 @@ class ServerRationHandler:
             else:
                 return {
                     "status": "error",
-                    "message": "Не удалось сохранить в RationInfo"
+                    "message": "Не удалось сохранить в RationInfo",
+                    "retryable": True
                 }
                 
         except Exception as e:
@@ -106,47 +107,29 @@ class ServerRationHandler:
                 "message": f"Ошибка сервера: {str(e)[:200]}"
             }
     
-    def get_ration_by_date(self, ration_date_str):
-        """Получение ВСЕГО рациона по дате (без фильтрации по UserID)"""
+    def get_ration_by_date(self, ration_date_str, columns=None, user_id=None):
+        """Получение рациона по дате (user_id=None - всех пользователей)"""
         try:
-            if not os.path.exists(self.db_handler.ration_info_path):
+            if not self.db_handler.table_exists(self.db_handler.ration_info_path):
                 return pd.DataFrame()
             
-            df = self.db_handler.read_excel(self.db_handler.ration_info_path)
+            ration_day = datetime.strptime(ration_date_str, "%d.%m.%Y").date()
             
-            if df.empty:
-                return df
-            
-            # Преобразуем дату для фильтрации
-            ration_date = datetime.strptime(ration_date_str, "%d.%m.%Y")
-            ration_timestamp = int(ration_date.timestamp())
-            
-            # Фильтруем по дате (совпадение дня, месяца, года)
-            def is_same_date(timestamp1, timestamp2):
-                if pd.isna(timestamp1) or timestamp1 == '':
-                    return False
-                dt1 = datetime.fromtimestamp(float(timestamp1))
-                dt2 = datetime.fromtimestamp(float(timestamp2))
-                return dt1.date() == dt2.date()
-            
-            mask = df['RationDate'].apply(lambda x: is_same_date(x, ration_timestamp))
-            return df[mask]
+            # Фильтруем по календарному дню через индекс RationDate (пустые/нечисловые даты не попадают)
+            if columns is not None:
+                columns = list(columns) + ['UserID']
+            return self.db_handler.scan_table_day('rationinfo', 'RationDate', ration_day, columns, user_id=user_id)
             
         except Exception as e:
             print(f"❌ Ошибка получения рациона: {str(e)}")
             return pd.DataFrame()
             
-    def get_ration_by_daterange(self, start_date_str, end_date_str):
-        """Получение рациона за период дат"""
+    def get_ration_by_daterange(self, start_date_str, end_date_str, columns=None, user_id=None):
+        """Получение рациона за период дат (user_id=None - всех пользователей)"""
         try:
-            if not os.path.exists(self.db_handler.ration_info_path):
+            if not self.db_handler.table_exists(self.db_handler.ration_info_path):
                 return pd.DataFrame()
         
-            df = self.db_handler.read_excel(self.db_handler.ration_info_path)
-        
-            if df.empty:
-                return df
-        
             # Преобразуем даты для фильтрации
             start_date = datetime.strptime(start_date_str, "%d.%m.%Y")
             end_date = datetime.strptime(end_date_str, "%d.%m.%Y")
@@ -158,18 +141,11 @@ class ServerRationHandler:
             start_timestamp = int(start_date.timestamp())
             end_timestamp = int(end_date.timestamp())
         
-            # Фильтруем по периоду дат
-            def is_in_range(timestamp):
-                if pd.isna(timestamp) or timestamp == '':
-                    return False
-                try:
-                    ts = float(timestamp)
-                    return start_timestamp <= ts <= end_timestamp
-                except:
-                    return False
-        
-            mask = df['RationDate'].apply(is_in_range)
-            return df[mask]
+            # Фильтруем по периоду дат на уровне хранилища (пустые/нечисловые даты не попадают)
+            if columns is not None:
+                columns = list(columns) + ['UserID']
+            return self.db_handler.scan_table_range('rationinfo', 'RationDate', start_timestamp, end_timestamp, columns,
+                                                    user_id=user_id)
         
         except Exception as e:
             print(f"❌ Ошибка получения рациона за период: {str(e)}")
@@ -0,0 +1,726 @@
+"""
+Движки хранения таблиц для DatabaseHandler (Excel / SQLite / Parquet / Arrow IPC)
+"""
+
+import os
+import glob
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# pyarrow нужен только для колоночных форматов
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = feather = pq = None
+
+
+def file_signature(filepath):
+    """Версия файла: (mtime, size, inode) или None, если файла нет"""
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# Адрес строки в DataFrame, прочитанном через select_rows
+ROWID_COLUMN = '_rowid'
+
+
+# Временные файлы записи: скрытые (не попадают в glob таблиц), с токеном записи или коммита
+STAGING_PREFIX = '.tmp-'
+
+
+def staging_path(filepath, token):
+    """Путь временного файла для публикации filepath (`.tmp-<token>-<имя>` в той же папке)"""
+    directory, filename = os.path.split(filepath)
+    return os.path.join(directory, f"{STAGING_PREFIX}{token}-{filename}")
+
+
+def write_token():
+    """Токен обычной записи: свой у каждого процесса, чтобы временные файлы не пересекались"""
+    return f"write{os.getpid()}"
+
+
+def publish(renames):
+    """Атомарная подмена файлов таблиц подготовленными временными файлами"""
+    for tmp_path, filepath in renames:
+        os.replace(tmp_path, filepath)
+
+
+class StorageEngine(ABC):
+    """Базовый интерфейс движка хранения (таблица -> DataFrame).
+
+    exists / read / write / signature обязательны: движок без них не создается.
+    """
+
+    name = 'base'
+    # Расширение файлов таблиц (None - таблицы хранятся не в отдельных файлах)
+    extension = None
+
+    def __init__(self, table_paths):
+        # Таблица -> путь к legacy Excel файлу
+        self.table_paths = dict(table_paths)
+
+    def register_table(self, table, legacy_path):
+        """Регистрация дополнительной таблицы (например, партиции) и пути ее legacy файла"""
+        self.table_paths[table] = legacy_path
+
+    def file_path(self, table):
+        """Файл таблицы для файловых движков"""
+        root, _ = os.path.splitext(self.table_paths[table])
+        return root + self.extension
+
+    def list_tables(self, prefix, directory):
+        """Имена существующих таблиц вида '<prefix>/<name>' из файлов папки directory"""
+        names = []
+        for path in glob.glob(os.path.join(glob.escape(directory), '*' + self.extension)):
+            names.append(f"{prefix}/{os.path.basename(path)[:-len(self.extension)]}")
+        return sorted(names)
+
+    def drop(self, table):
+        """Удаление таблицы"""
+        filepath = self.file_path(table)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+    @abstractmethod
+    def exists(self, table):
+        """Проверка существования таблицы"""
+
+    @abstractmethod
+    def read(self, table, columns=None):
+        """Чтение таблицы в DataFrame (columns - только указанные колонки, если они есть)"""
+
+    @abstractmethod
+    def write(self, table, df):
+        """Полная перезапись таблицы"""
+
+    def append(self, table, df):
+        """Добавление строк в конец таблицы (по умолчанию через перезапись)"""
+        if self.exists(table):
+            combined_df = pd.concat([self.read(table), df], ignore_index=True)
+        else:
+            combined_df = df
+        self.write(table, combined_df)
+        return len(df)
+
+    # Движок умеет готовить новую версию таблицы во временных файлах (stage) для общего коммита
+    supports_staging = False
+
+    def stage(self, table, df, token):
+        """Запись новой версии таблицы во временные файлы без публикации.
+
+        Возвращает [(временный файл, файл таблицы)] для publish() или None, если движок
+        не поддерживает подготовку (тогда таблица пишется обычным write).
+        """
+        return None
+
+    def stage_append(self, table, df, token):
+        """Как stage, но для добавления строк: готовится таблица вместе с новыми строками"""
+        if not self.supports_staging:
+            return None
+        if self.exists(table):
+            df = pd.concat([self.read(table), df], ignore_index=True)
+        return self.stage(table, df, token)
+
+    @abstractmethod
+    def signature(self, table):
+        """Версия таблицы: меняется при каждой записи (ключ для кэшей)"""
+
+    # Движок меняет отдельные строки на месте (иначе select_rows / apply_row_changes
+    # работают через перезапись таблиц и DatabaseHandler их не использует)
+    supports_row_updates = False
+
+    @abstractmethod
+    def select_rows(self, table, where):
+        """Строки, у которых колонки where равны значениям; колонка ROWID_COLUMN - адрес строки"""
+
+    @abstractmethod
+    def apply_row_changes(self, changes, marks=None):
+        """Изменения строк нескольких таблиц одной транзакцией.
+
+        ('sync', table, where, df) - df заменяет строки, выбранные where: строки с адресом
+        обновляются, строки без адреса добавляются, не вошедшие в df удаляются;
+        ('append', table, df) - добавление строк; ('write', table, df) - перезапись таблицы;
+        ('drop', table) - удаление таблицы.
+        marks - отметки {имя: число}, сохраняемые той же транзакцией (только supports_marks).
+        """
+
+    # Движок хранит отметки (например, влитое поколение журнала) в одной транзакции с данными
+    supports_marks = False
+
+    def read_mark(self, name):
+        """Значение отметки, записанной через apply_row_changes(marks=...), или None"""
+        return None
+
+    # Движок умеет фильтровать диапазон сам, не загружая таблицу целиком
+    native_range_scan = False
+
+    def scan_range(self, table, column, start, end, columns=None, inclusive='both'):
+        """Строки, у которых числовое значение column попадает в диапазон [start, end].
+
+        inclusive - как в pandas.Series.between: 'both' или 'left' (полуинтервал [start, end)).
+        Пустые и нечисловые значения в диапазон не попадают.
+        """
+        df = self.read(table, None if columns is None else list(columns) + [column])
+        return filter_range(df, column, start, end, inclusive)
+
+    def partitions_for_range(self, table, column, start, end):
+        """Таблицы, в которых нужно искать строки диапазона (без партиционирования - сама таблица)"""
+        return [table]
+
+    def location(self, table):
+        """Человекочитаемое место хранения таблицы (для логов)"""
+        return self.table_paths.get(table, table)
+
+
+class ExcelStorageEngine(StorageEngine):
+    """Legacy движок: каждая таблица - отдельный .xlsx файл"""
+
+    name = 'excel'
+    extension = '.xlsx'
+
+    def exists(self, table):
+        return os.path.exists(self.table_paths[table])
+
+    def read(self, table, columns=None):
+        filepath = self.table_paths[table]
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Файл не найден: {filepath}")
+        if columns is not None:
+            wanted = set(columns)
+            return pd.read_excel(filepath, usecols=lambda col: col in wanted)
+        return pd.read_excel(filepath)
+
+    supports_staging = True
+
+    def stage(self, table, df, token):
+        filepath = self.table_paths[table]
+        tmp_path = staging_path(filepath, token)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        df.to_excel(tmp_path, index=False)
+        return [(tmp_path, filepath)]
+
+    def write(self, table, df):
+        # Временный файл со скрытым именем (не попадает в list_tables) и атомарная подмена:
+        # читатели без блокировок видят либо старую, либо новую версию файла
+        publish(self.stage(table, df, write_token()))
+        return True
+
+    def signature(self, table):
+        return file_signature(self.table_paths[table])
+
+    def select_rows(self, table, where):
+        return select_frame_rows(self.read(table) if self.exists(table) else pd.DataFrame(), where)
+
+    def apply_row_changes(self, changes, marks=None):
+        rewrite_row_changes(self, changes, marks)
+
+
+class SQLiteStorageEngine(StorageEngine):
+    """Встроенный SQLite (WAL): все таблицы в одном файле базы"""
+
+    name = 'sqlite'
+
+    def __init__(self, table_paths, db_path, import_legacy=True):
+        super().__init__(table_paths)
+        self.db_path = db_path
+        self._local = threading.local()
+
+        self._connect().execute('PRAGMA journal_mode=WAL')
+        # Версии таблиц (для кэшей): увеличиваются в той же транзакции, что и запись
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS _portion_meta (tbl TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            # Отметки (влитые поколения журналов) - в той же транзакции, что и запись таблиц
+            conn.execute('CREATE TABLE IF NOT EXISTS _portion_marks (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+        # Однократный перенос данных из legacy Excel файлов
+        if import_legacy:
+            self._import_legacy_tables()
+
+    def _connect(self):
+        """Соединение потока: одно на поток, после fork в процессе-воркере открывается заново"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # isolation_level=None - транзакции только явные (_transaction), чтение без транзакции
+            local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            local.conn.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.conn
+
+    @contextmanager
+    def _transaction(self):
+        """Транзакция записи (BEGIN IMMEDIATE ... COMMIT): DDL и вставки публикуются вместе"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _import_legacy_tables(self):
+        for table, filepath in self.table_paths.items():
+            if self.exists(table) or not os.path.exists(filepath):
+                continue
+            df = pd.read_excel(filepath)
+            self.write(table, df)
+            print(f"📥 SQLite: таблица {table} импортирована из {os.path.basename(filepath)} ({len(df)} записей)")
+
+    @staticmethod
+    def _quote(identifier):
+        return '"' + str(identifier).replace('"', '""') + '"'
+
+    @staticmethod
+    def _python_rows(df):
+        """Строки DataFrame в виде кортежей Python-значений (NaN -> NULL)"""
+        columns = []
+        for col in df.columns:
+            values = df[col].tolist()
+            missing = df[col].isna().tolist()
+            columns.append([None if is_missing else value
+                            for value, is_missing in zip(values, missing)])
+        return list(zip(*columns))
+
+    def _table_columns(self, conn, table):
+        rows = conn.execute(f'PRAGMA table_info({self._quote(table)})').fetchall()
+        return [row[1] for row in rows]
+
+    def _bump_version(self, conn, table):
+        conn.execute(
+            'INSERT INTO _portion_meta (tbl, version) VALUES (?, 1) '
+            'ON CONFLICT(tbl) DO UPDATE SET version = version + 1',
+            (table,)
+        )
+
+    def _insert(self, conn, table, df):
+        if df.empty:
+            return
+        columns = ', '.join(self._quote(col) for col in df.columns)
+        placeholders = ', '.join('?' for _ in df.columns)
+        conn.executemany(
+            f'INSERT INTO {self._quote(table)} ({columns}) VALUES ({placeholders})',
+            self._python_rows(df)
+        )
+
+    def exists(self, table):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        return row is not None
+
+    def read(self, table, columns=None):
+        if not self.exists(table):
+            raise FileNotFoundError(f"Таблица не найдена: {table}")
+        conn = self._connect()
+        selected = '*'
+        if columns is not None:
+            existing_columns = self._table_columns(conn, table)
+            selected = ', '.join(self._quote(col) for col in existing_columns if col in set(columns))
+            if not selected:
+                return pd.DataFrame()
+        return pd.read_sql_query(f'SELECT {selected} FROM {self._quote(table)} ORDER BY rowid', conn)
+
+    def write(self, table, df):
+        with self._transaction() as conn:
+            self._replace(conn, table, df)
+            self._bump_version(conn, table)
+        return True
+
+    def _replace(self, conn, table, df):
+        # Колонки без объявленного типа: значения хранятся как есть (int / float / str)
+        columns = ', '.join(self._quote(col) for col in df.columns)
+        conn.execute(f'DROP TABLE IF EXISTS {self._quote(table)}')
+        conn.execute(f'CREATE TABLE {self._quote(table)} ({columns})')
+        self._insert(conn, table, df)
+
+    def _ensure_columns(self, conn, table, columns):
+        """Создание таблицы или добавление недостающих колонок (так же, как это сделал бы pd.concat)"""
+        existing_columns = self._table_columns(conn, table)
+        if not existing_columns:
+            conn.execute(f'CREATE TABLE {self._quote(table)} ({", ".join(self._quote(col) for col in columns)})')
+            return list(columns)
+        for col in columns:
+            if col not in existing_columns:
+                conn.execute(f'ALTER TABLE {self._quote(table)} ADD COLUMN {self._quote(col)}')
+                existing_columns.append(col)
+        return existing_columns
+
+    def append(self, table, df):
+        with self._transaction() as conn:
+            self._ensure_columns(conn, table, list(df.columns))
+            self._insert(conn, table, df)
+            self._bump_version(conn, table)
+        return len(df)
+
+    supports_row_updates = True
+
+    def _where(self, where):
+        clause = ' AND '.join(f'{self._quote(col)} = ?' for col in where)
+        return clause, tuple(where.values())
+
+    def select_rows(self, table, where):
+        conn = self._connect()
+        columns = self._table_columns(conn, table)
+        if not columns:
+            return pd.DataFrame(columns=[ROWID_COLUMN])
+        if any(col not in columns for col in where):
+            return pd.DataFrame(columns=[ROWID_COLUMN] + columns)
+        clause, params = self._where(where)
+        return pd.read_sql_query(
+            f'SELECT rowid AS {ROWID_COLUMN}, * FROM {self._quote(table)} WHERE {clause} ORDER BY rowid',
+            conn, params=params
+        )
+
+    def apply_row_changes(self, changes, marks=None):
+        if not changes and not marks:
+            return
+        with self._transaction() as conn:
+            for change in changes:
+                if change[0] == 'sync':
+                    _, table, where, df = change
+                    self._sync_rows(conn, table, where, df)
+                elif change[0] == 'write':
+                    _, table, df = change
+                    self._replace(conn, table, df)
+                elif change[0] == 'drop':
+                    _, table = change
+                    conn.execute(f'DROP TABLE IF EXISTS {self._quote(table)}')
+                else:
+                    _, table, df = change
+                    self._ensure_columns(conn, table, list(df.columns))
+                    self._insert(conn, table, df)
+                self._bump_version(conn, table)
+            for name, value in (marks or {}).items():
+                conn.execute(
+                    'INSERT INTO _portion_marks (name, value) VALUES (?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET value = excluded.value',
+                    (name, int(value))
+                )
+
+    supports_marks = True
+
+    def read_mark(self, name):
+        row = self._connect().execute('SELECT value FROM _portion_marks WHERE name = ?', (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def _sync_rows(self, conn, table, where, df):
+        """Строки df на месте строк, выбранных where (порядок строк таблицы сохраняется)"""
+        data_columns = [col for col in df.columns if col != ROWID_COLUMN]
+        table_columns = self._table_columns(conn, table)
+        if table_columns and all(col in table_columns for col in where):
+            clause, params = self._where(where)
+            existing = {row[0] for row in conn.execute(
+                f'SELECT rowid FROM {self._quote(table)} WHERE {clause}', params)}
+        else:
+            existing = set()
+        self._ensure_columns(conn, table, data_columns)
+
+        rowids = df[ROWID_COLUMN] if ROWID_COLUMN in df.columns else pd.Series(float('nan'), index=df.index)
+        addressed = rowids.notna().to_numpy() & rowids.isin(list(existing)).to_numpy()
+        kept = df[addressed]
+        kept_ids = [int(rowid) for rowid in kept[ROWID_COLUMN]] if len(kept) else []
+
+        deleted = existing - set(kept_ids)
+        if deleted:
+            conn.executemany(f'DELETE FROM {self._quote(table)} WHERE rowid = ?', [(rowid,) for rowid in deleted])
+        if kept_ids and data_columns:
+            assignments = ', '.join(f'{self._quote(col)} = ?' for col in data_columns)
+            conn.executemany(
+                f'UPDATE {self._quote(table)} SET {assignments} WHERE rowid = ?',
+                [row + (rowid,) for row, rowid in zip(self._python_rows(kept[data_columns]), kept_ids)]
+            )
+        self._insert(conn, table, df[~addressed][data_columns])
+
+    def signature(self, table):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?), "
+            "(SELECT version FROM _portion_meta WHERE tbl = ?)",
+            (table, table)
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return (self.db_path, row[1] or 0)
+
+    def list_tables(self, prefix, directory):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND substr(name, 1, ?) = ?",
+            (len(prefix) + 1, prefix + '/')
+        ).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def drop(self, table):
+        with self._transaction() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS {self._quote(table)}')
+            self._bump_version(conn, table)
+
+    native_range_scan = True
+
+    def scan_range(self, table, column, start, end, columns=None, inclusive='both'):
+        if not self.exists(table):
+            raise FileNotFoundError(f"Таблица не найдена: {table}")
+        upper = '<=' if inclusive == 'both' else '<'
+        conn = self._connect()
+        existing_columns = self._table_columns(conn, table)
+        if column not in existing_columns:
+            return pd.DataFrame(columns=existing_columns)
+        selected = existing_columns if columns is None else [col for col in existing_columns if col in set(columns)]
+        # Пустые строки и NULL не являются числами и в диапазон не попадают
+        return pd.read_sql_query(
+            f'SELECT {", ".join(self._quote(col) for col in selected)} FROM {self._quote(table)} '
+            f'WHERE typeof({self._quote(column)}) IN (\'integer\', \'real\') '
+            f'AND {self._quote(column)} >= ? AND {self._quote(column)} {upper} ? ORDER BY rowid',
+            conn, params=(start, end)
+        )
+
+    def location(self, table):
+        return f"{self.db_path}::{table}"
+
+
+def filter_range(df, column, start, end, inclusive='both'):
+    """Векторная фильтрация DataFrame по числовому диапазону колонки"""
+    if column not in df.columns:
+        return df.iloc[0:0]
+    values = pd.to_numeric(df[column], errors='coerce')
+    return df[values.between(start, end, inclusive=inclusive)]
+
+
+def select_frame_rows(df, where):
+    """select_rows по DataFrame: адрес строки (ROWID_COLUMN) - ее позиция в таблице"""
+    if any(col not in df.columns for col in where):
+        return pd.DataFrame(columns=[ROWID_COLUMN] + list(df.columns))
+    mask = np.ones(len(df), dtype=bool)
+    for col, value in where.items():
+        mask &= (df[col] == value).to_numpy()
+    rows = df[mask].reset_index(drop=True)
+    rows.insert(0, ROWID_COLUMN, np.flatnonzero(mask))
+    return rows
+
+
+def sync_frame_rows(df, where, rows):
+    """Операция 'sync' над DataFrame (порядок строк таблицы сохраняется, новые - в конце)"""
+    data = rows.drop(columns=[ROWID_COLUMN], errors='ignore')
+    existing = select_frame_rows(df, where)[ROWID_COLUMN].astype(int).tolist()
+    rowids = rows[ROWID_COLUMN] if ROWID_COLUMN in rows.columns else pd.Series(np.nan, index=rows.index)
+    addressed = (rowids.notna() & rowids.isin(existing)).to_numpy()
+
+    positions = np.arange(len(df))
+    untouched = df.set_axis(positions)[~np.isin(positions, existing)]
+    updated = data[addressed].set_axis(rowids[addressed].astype(int).to_numpy())
+    kept = [frame for frame in (untouched, updated) if len(frame)]
+    merged = pd.concat(kept).sort_index(kind='stable') if kept else untouched
+    added = data[~addressed]
+    if added.empty:
+        return merged.reset_index(drop=True)
+    return pd.concat([merged, added], ignore_index=True) if len(merged) else added.reset_index(drop=True)
+
+
+def rewrite_row_changes(engine, changes, marks=None):
+    """apply_row_changes для файловых движков: изменения собираются в памяти,
+    затем каждая таблица перезаписывается целиком (атомарно по файлу)"""
+    if marks:
+        raise ValueError(f"Движок {engine.name} не хранит отметки: используйте stage и CommitLog")
+    frames, dropped = {}, []
+    for change in changes:
+        table = change[1]
+        if change[0] == 'drop':
+            frames.pop(table, None)
+            dropped.append(table)
+            continue
+        if change[0] == 'write':
+            frames[table] = change[2]
+            continue
+        if table not in frames:
+            exists = table not in dropped and engine.exists(table)
+            frames[table] = engine.read(table) if exists else pd.DataFrame()
+        if change[0] == 'sync':
+            frames[table] = sync_frame_rows(frames[table], change[2], change[3])
+        elif frames[table].empty:
+            frames[table] = change[2].reset_index(drop=True)
+        else:
+            frames[table] = pd.concat([frames[table], change[2]], ignore_index=True)
+    for table in dropped:
+        if table not in frames:
+            engine.drop(table)
+    for table, df in frames.items():
+        engine.write(table, df)
+
+
+def normalize_for_columnar(df):
+    """Приведение смешанных object-колонок к одному типу для Arrow/Parquet.
+
+    Колонки вида ['', 1769720400, NaN] становятся числовыми ('' -> NaN),
+    остальные смешанные колонки - строковыми.
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col]
+        present = values[values.notna() & (values.astype(str) != '')]
+        if present.empty:
+            # Только пустые значения: храним как строки
+            df[col] = values.where(values.notna(), None)
+            continue
+        numeric = pd.to_numeric(present, errors='coerce')
+        if numeric.notna().all():
+            df[col] = pd.to_numeric(values.where(values.astype(str) != '', np.nan), errors='coerce')
+        else:
+            df[col] = values.where(values.isna(), values.astype(str))
+    return df
+
+
+class ParquetStorageEngine(StorageEngine):
+    """Колоночный движок: каждая таблица - .parquet файл рядом с legacy .xlsx"""
+
+    name = 'parquet'
+    extension = '.parquet'
+
+    def __init__(self, table_paths, migrate_legacy=True):
+        if pq is None:
+            raise RuntimeError("Для движка parquet требуется пакет pyarrow")
+        super().__init__(table_paths)
+
+        # Однократная миграция legacy Excel файлов при старте
+        if migrate_legacy:
+            self.migrate_from_excel()
+
+    def migrate_from_excel(self):
+        """Конвертация существующих .xlsx в колоночный формат (только отсутствующие таблицы)"""
+        migrated = []
+        for table, excel_path in self.table_paths.items():
+            if self.exists(table) or not os.path.exists(excel_path):
+                continue
+            df = pd.read_excel(excel_path)
+            self.write(table, df)
+            migrated.append(table)
+            print(f"📥 {self.name}: {os.path.basename(excel_path)} -> {os.path.basename(self.file_path(table))} ({len(df)} записей)")
+        return migrated
+
+    def exists(self, table):
+        return os.path.exists(self.file_path(table))
+
+    def _existing_columns(self, table, columns):
+        if columns is None:
+            return None
+        schema_names = pq.read_schema(self.file_path(table)).names
+        return [col for col in schema_names if col in set(columns)]
+
+    def read(self, table, columns=None):
+        filepath = self.file_path(table)
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Файл не найден: {filepath}")
+        return pd.read_parquet(filepath, columns=self._existing_columns(table, columns))
+
+    def _write_file(self, df, filepath):
+        normalize_for_columnar(df).to_parquet(filepath, index=False)
+
+    supports_staging = True
+
+    def stage(self, table, df, token):
+        filepath = self.file_path(table)
+        tmp_path = staging_path(filepath, token)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        self._write_file(df, tmp_path)
+        return [(tmp_path, filepath)]
+
+    def write(self, table, df):
+        # Пишем во временный файл и атомарно подменяем: читатели видят либо старую, либо новую версию
+        publish(self.stage(table, df, write_token()))
+        return True
+
+    def signature(self, table):
+        return file_signature(self.file_path(table))
+
+    def select_rows(self, table, where):
+        return select_frame_rows(self.read(table) if self.exists(table) else pd.DataFrame(), where)
+
+    def apply_row_changes(self, changes, marks=None):
+        rewrite_row_changes(self, changes, marks)
+
+    def location(self, table):
+        return self.file_path(table)
+
+
+class ArrowStorageEngine(ParquetStorageEngine):
+    """Arrow IPC (Feather v2) без сжатия: чтение через memory map без копирования.
+
+    Диапазонные выборки сканируют колонку дат прямо в отображенных страницах файла,
+    в память процесса материализуются только подходящие строки. Параллельные запросы
+    (и процессы) делят один page cache вместо собственных копий таблицы.
+    """
+
+    name = 'arrow'
+    extension = '.arrow'
+    native_range_scan = True
+
+    def __init__(self, table_paths, migrate_legacy=True):
+        self._mapped = {}
+        self._mapped_lock = threading.Lock()
+        super().__init__(table_paths, migrate_legacy)
+
+    def _write_file(self, df, filepath):
+        feather.write_feather(normalize_for_columnar(df), filepath, compression='uncompressed')
+
+    def _mapped_table(self, table):
+        """Отображенная в память таблица (переоткрывается при смене версии файла)"""
+        filepath = self.file_path(table)
+        signature = file_signature(filepath)
+        if signature is None:
+            raise FileNotFoundError(f"Файл не найден: {filepath}")
+        with self._mapped_lock:
+            entry = self._mapped.get(table)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+            source = pa.memory_map(filepath, 'r')
+            arrow_table = pa.ipc.open_file(source).read_all()
+            self._mapped[table] = (signature, arrow_table)
+            return arrow_table
+
+    def _select(self, arrow_table, columns):
+        if columns is None:
+            return arrow_table
+        wanted = set(columns)
+        return arrow_table.select([col for col in arrow_table.column_names if col in wanted])
+
+    def read(self, table, columns=None):
+        return self._select(self._mapped_table(table), columns).to_pandas()
+
+    def scan_range(self, table, column, start, end, columns=None, inclusive='both'):
+        arrow_table = self._mapped_table(table)
+        if column not in arrow_table.column_names:
+            return self._select(arrow_table, columns).slice(0, 0).to_pandas()
+        values = arrow_table.column(column)
+        if not (pa.types.is_integer(values.type) or pa.types.is_floating(values.type)):
+            # Даты, сохраненные строками: приводим без падения на пустых значениях
+            return filter_range(self.read(table, None if columns is None else list(columns) + [column]),
+                                column, start, end, inclusive)
+        upper = pc.less_equal if inclusive == 'both' else pc.less
+        mask = pc.and_(pc.greater_equal(values, start), upper(values, end))
+        # filter копирует только подходящие строки, колонка дат читается из отображения
+        return self._select(arrow_table, columns).filter(pc.fill_null(mask, False)).to_pandas()
+
+
+def create_storage_engine(name, table_paths, **options):
+    """Создание движка хранения по имени из конфигурации"""
+    if name in (None, '', 'excel'):
+        return ExcelStorageEngine(table_paths)
+    if name == 'sqlite':
+        return SQLiteStorageEngine(table_paths, options['sqlite_path'])
+    if name == 'parquet':
+        return ParquetStorageEngine(table_paths)
+    if name == 'arrow':
+        return ArrowStorageEngine(table_paths)
+    raise ValueError(f"Неизвестный движок хранения: {name}")
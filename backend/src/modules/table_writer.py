@@ -0,0 +1,330 @@
+"""
+Запись таблиц: одна очередь (поток-писатель) на таблицу и межпроцессная блокировка файла
+"""
+
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+
+class TableFileLock:
+    """Advisory блокировка таблицы между процессами (flock на `<table>.lock`).
+
+    Блокировку берут только писатели; читатели ее не запрашивают и никогда не ждут.
+    shared=True - разделяемая блокировка (изменения отдельных строк под полосами StripedLocks):
+    несколько держателей одновременно, но не вместе с записью таблицы целиком.
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        """Захват блокировки; blocking=False - без ожидания (False, если занята)"""
+        if fcntl is None:
+            return True
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        if blocking:
+            fcntl.flock(self._fd, operation)
+            return True
+        try:
+            fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _AppendBatch:
+    """Вставки, собранные за окно group commit: одна физическая запись и общий Future"""
+
+    def __init__(self, write, window):
+        self.write = write
+        self.frames = []
+        self.future = Future()
+        self.opened = time.perf_counter()
+        self.deadline = self.opened + window
+        self.full = threading.Event()
+
+
+class _TableQueue:
+    """Очередь изменений одной таблицы и ее поток-писатель"""
+
+    def __init__(self, table, lock_path, group_window=None, max_batch=500):
+        self.table = table
+        self.lock = TableFileLock(lock_path)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f'writer-{table}', daemon=True)
+        self.mutations = 0
+        self.failures = 0
+        self.lock_wait_seconds = 0.0
+        self.max_depth = 0
+
+        # Group commit: открытая пачка вставок, к которой присоединяются новые вызовы
+        self.group_window = group_window
+        self.max_batch = max_batch
+        self._open_batch = None
+        self._batch_guard = threading.Lock()
+        self.group_commits = 0
+        self.grouped_inserts = 0
+        self.max_batch_size = 0
+        self.commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.batch_seconds = 0.0
+
+        self.thread.start()
+
+    def put(self, func, future):
+        self._enqueue((func, future))
+
+    def _enqueue(self, item):
+        self.queue.put(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def append(self, df, write):
+        """Присоединение вставки к открытой пачке (или открытие новой); Future общий на пачку"""
+        with self._batch_guard:
+            batch = self._open_batch
+            if batch is None:
+                batch = _AppendBatch(write, self.group_window)
+                self._open_batch = batch
+                self._enqueue(batch)
+            batch.frames.append(df)
+            if len(batch.frames) >= self.max_batch:
+                # Пачка заполнена - пишем, не дожидаясь конца окна
+                self._open_batch = None
+                batch.full.set()
+        return batch.future
+
+    def _commit(self, batch):
+        batch.full.wait(max(0.0, batch.deadline - time.perf_counter()))
+        with self._batch_guard:
+            if self._open_batch is batch:
+                self._open_batch = None
+        if not batch.future.set_running_or_notify_cancel():
+            return
+        frames = batch.frames
+        started = time.perf_counter()
+        try:
+            with self.lock:
+                self.lock_wait_seconds += time.perf_counter() - started
+                df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+                result = batch.write(df)
+        except BaseException as e:
+            self.failures += 1
+            batch.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        self.group_commits += 1
+        self.grouped_inserts += len(frames)
+        self.max_batch_size = max(self.max_batch_size, len(frames))
+        self.commit_seconds += finished - started
+        self.max_commit_seconds = max(self.max_commit_seconds, finished - started)
+        self.batch_seconds += finished - batch.opened
+        batch.future.set_result(result)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if isinstance(item, _AppendBatch):
+                self._commit(item)
+                continue
+            func, future = item
+            if func is None:
+                self.lock.close()
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                with self.lock:
+                    self.lock_wait_seconds += time.perf_counter() - started
+                    result = func()
+            except BaseException as e:
+                self.failures += 1
+                future.set_exception(e)
+            else:
+                self.mutations += 1
+                future.set_result(result)
+
+    def stats(self):
+        result = {
+            "mutations": self.mutations,
+            "failures": self.failures,
+            "queued": self.queue.qsize(),
+            "max_queued": self.max_depth,
+            "lock_wait_ms": round(self.lock_wait_seconds * 1000, 2)
+        }
+        if self.group_commits:
+            result["group_commit"] = {
+                "commits": self.group_commits,
+                "inserts": self.grouped_inserts,
+                "avg_batch": round(self.grouped_inserts / self.group_commits, 2),
+                "max_batch": self.max_batch_size,
+                "avg_commit_ms": round(self.commit_seconds / self.group_commits * 1000, 2),
+                "max_commit_ms": round(self.max_commit_seconds * 1000, 2),
+                # От первой вставки пачки до завершения записи (включая окно ожидания)
+                "avg_latency_ms": round(self.batch_seconds / self.group_commits * 1000, 2)
+            }
+        return result
+
+
+class TableWriter:
+    """Единственный писатель для каждой таблицы.
+
+    Все изменения таблицы (вставки, перезаписи, read-modify-write) выполняются по одному
+    в потоке-писателе таблицы под межпроцессной блокировкой, поэтому параллельные запросы
+    и другие процессы сервера не теряют изменения друг друга. Чтение идет мимо очереди.
+
+    При group_window (секунды) вставки, пришедшие в течение окна, объединяются в одну
+    физическую запись (group commit).
+    """
+
+    def __init__(self, lock_paths, group_window=None, max_batch=500):
+        # Таблица -> путь файла блокировки
+        self.lock_paths = dict(lock_paths)
+        self.group_window = group_window
+        self.max_batch = max_batch
+        self._queues = {}
+        self._guard = threading.Lock()
+        # Таблицы, захваченные текущим потоком через hold()
+        self._local = threading.local()
+
+    def _queue(self, table):
+        with self._guard:
+            table_queue = self._queues.get(table)
+            if table_queue is None:
+                table_queue = _TableQueue(table, self.lock_paths[table], self.group_window, self.max_batch)
+                self._queues[table] = table_queue
+            return table_queue
+
+    def _held(self):
+        held = getattr(self._local, 'tables', None)
+        if held is None:
+            held = self._local.tables = set()
+        return held
+
+    def in_writer(self, table):
+        """Выполняется ли текущий код в потоке-писателе таблицы (или в потоке, захватившем ее)"""
+        if table in self._held():
+            return True
+        table_queue = self._queues.get(table)
+        return table_queue is not None and table_queue.thread is threading.current_thread()
+
+    @contextmanager
+    def hold(self, tables):
+        """Захват нескольких таблиц текущим потоком (для изменений, которые публикуются вместе).
+
+        Очереди таблиц занимаются в порядке имен (без взаимоблокировок между процессами):
+        поток-писатель каждой таблицы держит ее блокировку и ждет конца блока. Изменения
+        захваченных таблиц внутри блока выполняются сразу, в текущем потоке.
+        """
+        tables = sorted(set(tables) - self._held())
+        releases = []
+        try:
+            for table in tables:
+                acquired, release = threading.Event(), threading.Event()
+
+                def wait_for_release(acquired=acquired, release=release):
+                    acquired.set()
+                    release.wait()
+
+                future = self.submit(table, wait_for_release)
+                releases.append((release, future))
+                # Future завершится раньше события, только если блокировку взять не удалось
+                future.add_done_callback(lambda _, acquired=acquired: acquired.set())
+                acquired.wait()
+                if future.done():
+                    future.result()
+            self._held().update(tables)
+            yield
+        finally:
+            self._held().difference_update(tables)
+            for release, future in releases:
+                release.set()
+            for release, future in releases:
+                future.exception()
+
+    @contextmanager
+    def adopt(self, tables):
+        """Таблицы, которые текущий поток уже захватил сам (полосы блокировок StripedLocks):
+        изменения этих таблиц внутри блока выполняются сразу, без очереди."""
+        tables = set(tables) - self._held()
+        self._held().update(tables)
+        try:
+            yield
+        finally:
+            self._held().difference_update(tables)
+
+    def submit(self, table, func):
+        """Постановка изменения в очередь таблицы (Future с результатом func())"""
+        future = Future()
+        self._queue(table).put(func, future)
+        return future
+
+    def run(self, table, func):
+        """Выполнение изменения таблицы и ожидание результата.
+
+        Вызов из потока-писателя той же таблицы выполняется сразу (вложенная запись
+        внутри read-modify-write), иначе - через очередь.
+        """
+        if self.in_writer(table):
+            return func()
+        return self.submit(table, func).result()
+
+    def append(self, table, df, write):
+        """Вставка строк через group commit: write(DataFrame) вызывается один раз на пачку.
+
+        Вызывающий ждет общий Future пачки: возврат означает, что строки записаны.
+        Без group_window (или из потока-писателя таблицы) write вызывается сразу.
+        """
+        if self.group_window is None:
+            return self.run(table, lambda: write(df))
+        if self.in_writer(table):
+            return write(df)
+        self._queue(table).append(df, write).result()
+        return len(df)
+
+    def stop(self):
+        """Остановка потоков-писателей (уже поставленные изменения выполняются)"""
+        with self._guard:
+            queues = list(self._queues.values())
+            self._queues.clear()
+        for table_queue in queues:
+            table_queue.put(None, None)
+        for table_queue in queues:
+            table_queue.thread.join()
+
+    def stats(self):
+        """Счетчики очередей по таблицам"""
+        with self._guard:
+            queues = dict(self._queues)
+        return {table: table_queue.stats() for table, table_queue in queues.items()}
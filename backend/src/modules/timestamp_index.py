@@ -0,0 +1,95 @@
+"""
+Отсортированный индекс по колонке timestamp (RationDate, Date) с бинарным поиском диапазонов
+"""
+
+from datetime import date, datetime, time, timedelta
+import numpy as np
+import pandas as pd
+
+# Значения вне этого диапазона (мусор, миллисекунды и т.п.) не индексируются:
+# ни в одну выборку по реальным датам они не попадают
+MIN_TIMESTAMP = 0
+MAX_TIMESTAMP = 32503680000  # 01.01.3000
+
+_EMPTY = np.array([], dtype=np.intp)
+
+
+def local_day_keys(timestamps):
+    """Ключ локального календарного дня (date.toordinal) для отсортированных timestamp.
+
+    datetime строится только для полуночей охваченного периода, а не для каждой строки.
+    """
+    if len(timestamps) == 0:
+        return np.array([], dtype=np.int64)
+    first_day = date.fromtimestamp(timestamps[0])
+    last_day = date.fromtimestamp(timestamps[-1])
+    midnights = np.array([
+        datetime.combine(first_day + timedelta(days=offset), time.min).timestamp()
+        for offset in range((last_day - first_day).days + 2)
+    ])
+    return first_day.toordinal() + np.searchsorted(midnights, timestamps, side='right') - 1
+
+
+class TimestampIndex:
+    """Позиции строк, отсортированные по timestamp (по всей таблице и внутри каждого пользователя).
+
+    Выборка за день или диапазон - два бинарных поиска и срез, O(log n + размер результата).
+    Позиции возвращаются в порядке строк таблицы.
+    """
+
+    def __init__(self, timestamps, positions, day_keys, user_slices):
+        # Массивы упорядочены по (пользователь, timestamp); user_slices: UserID -> (начало, конец)
+        self.timestamps = timestamps
+        self.positions = positions
+        self.day_keys = day_keys
+        self.user_slices = user_slices
+        # Та же раскладка без учета пользователя
+        order = np.argsort(timestamps, kind='stable')
+        self.all_timestamps = timestamps[order]
+        self.all_positions = positions[order]
+        self.all_day_keys = day_keys[order]
+
+    @classmethod
+    def build(cls, df, column, user_column='UserID'):
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+        with np.errstate(invalid='ignore'):
+            valid = np.flatnonzero((values >= MIN_TIMESTAMP) & (values < MAX_TIMESTAMP))
+
+        if user_column in df.columns:
+            codes, users = pd.factorize(df[user_column].to_numpy()[valid])
+        else:
+            codes, users = np.full(len(valid), -1), []
+        # Сортировка по пользователю, внутри пользователя - по времени
+        order = np.lexsort((values[valid], codes))
+        positions = valid[order]
+        codes = codes[order]
+        timestamps = values[positions]
+        bounds = np.searchsorted(codes, np.arange(len(users) + 1))
+        user_slices = {user: (bounds[i], bounds[i + 1]) for i, user in enumerate(users)}
+
+        # Ключи дней считаем по общей сортировке (монотонные timestamp), затем раскладываем обратно
+        by_time = np.argsort(timestamps, kind='stable')
+        day_keys = np.empty(len(timestamps), dtype=np.int64)
+        day_keys[by_time] = local_day_keys(timestamps[by_time])
+        return cls(timestamps, positions, day_keys, user_slices)
+
+    def _arrays(self, user_id):
+        if user_id is None:
+            return self.all_timestamps, self.all_positions, self.all_day_keys
+        start, end = self.user_slices.get(user_id, (0, 0))
+        return self.timestamps[start:end], self.positions[start:end], self.day_keys[start:end]
+
+    def range_rows(self, start, end, inclusive='both', user_id=None):
+        """Позиции строк с timestamp в [start, end] ('both') или [start, end) ('left')"""
+        timestamps, positions, _ = self._arrays(user_id)
+        lo = np.searchsorted(timestamps, start, side='left')
+        hi = np.searchsorted(timestamps, end, side='right' if inclusive == 'both' else 'left')
+        return np.sort(positions[lo:hi]) if hi > lo else _EMPTY
+
+    def day_rows(self, day, user_id=None):
+        """Позиции строк за календарный день day (по местному времени)"""
+        _, positions, day_keys = self._arrays(user_id)
+        key = day.toordinal()
+        lo = np.searchsorted(day_keys, key, side='left')
+        hi = np.searchsorted(day_keys, key, side='right')
+        return np.sort(positions[lo:hi]) if hi > lo else _EMPTY
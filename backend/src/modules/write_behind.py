@@ -0,0 +1,149 @@
+"""
+Обновления объема в MainPurch/OtherPurch и отложенная запись (write-behind) через журнал повтора
+"""
+
+import time
+import threading
+from datetime import datetime
+import pandas as pd
+
+
+def volume_update(criteria, new_volume_gr, new_volume):
+    """Запись обновления объема (она же - запись журнала повтора).
+
+    criteria - UserID, FamilyID, ProdID (для OtherPurch также StoreID и Date в формате дд.мм.гггг).
+    Нулевой объем удаляет строку.
+    """
+    return {"criteria": criteria, "TotalVolumeGr": new_volume_gr, "TotalVolume": new_volume}
+
+
+def _date_string(value):
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value).strftime("%d.%m.%Y")
+        except (OverflowError, OSError, ValueError):
+            return str(value)
+    return str(value)
+
+
+def match_rows(table, df, index, criteria, deleted=()):
+    """Метки строк, которые изменяет обновление.
+
+    MainPurch - все строки товара у владельца (UserID, FamilyID); OtherPurch - первая строка
+    товара в магазине с той же датой заказа. Строки из deleted не учитываются.
+    """
+    owner_rows = index.select(df, index.user_rows(criteria['UserID'], criteria['FamilyID']))
+    if table == 'mainpurch':
+        return [label for label in owner_rows.index[owner_rows['ProdID'] == criteria['ProdID']]
+                if label not in deleted]
+
+    candidates = owner_rows[(owner_rows['ProdID'] == criteria['ProdID']) & (owner_rows['StoreID'] == criteria['StoreID'])]
+    for label, date_value in zip(candidates.index, candidates['Date']):
+        if label in deleted or pd.isna(date_value):
+            continue
+        if _date_string(date_value) == criteria['Date']:
+            return [label]
+    return []
+
+
+def apply_updates(table, df, index, updates):
+    """Применение обновлений объема по порядку к таблице (df и OwnerIndex одной версии).
+
+    Возвращает (новый DataFrame, действия): 'updated', 'deleted' или None (строка не найдена).
+    Удаленные строки убираются в конце, поэтому позиции индекса верны для всех обновлений.
+    """
+    deleted = set()
+    actions = []
+    for update in updates:
+        labels = match_rows(table, df, index, update['criteria'], deleted)
+        if not labels:
+            actions.append(None)
+        elif update['TotalVolumeGr'] == 0:
+            deleted.update(labels)
+            actions.append('deleted')
+        else:
+            df.loc[labels, 'TotalVolumeGr'] = update['TotalVolumeGr']
+            df.loc[labels, 'TotalVolume'] = update['TotalVolume']
+            actions.append('updated')
+    if deleted:
+        df = df.drop([label for label in df.index if label in deleted])
+    return df, actions
+
+
+class WriteBehindFlusher:
+    """Фоновый сброс отложенных обновлений в таблицы: по числу обновлений или по времени"""
+
+    def __init__(self, db_handler, max_dirty=50, max_age_seconds=5, check_interval=1):
+        self.db_handler = db_handler
+        self.max_dirty = max_dirty
+        self.max_age_seconds = max_age_seconds
+        self.check_interval = check_interval
+        self.flushes = 0
+        self.coalesced_updates = 0
+        self.max_coalesced = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            # Повторный запуск - после stop() или в процессе-воркере после fork
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='write-behind-flusher', daemon=True)
+            self._thread.start()
+            print(f"💾 Отложенная запись MainPurch/OtherPurch (порог {self.max_dirty} обновлений / {self.max_age_seconds} с)")
+
+    def stop(self, wait=False):
+        self._stopped.set()
+        self._wakeup.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def notify(self, redo):
+        """Вызывается после обновления: будит сброс при превышении порога обновлений"""
+        if len(redo.records()) >= self.max_dirty:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            for table, redo in self.db_handler.redo_logs.items():
+                try:
+                    if redo.size_bytes() == 0:
+                        continue
+                    if len(redo.records()) >= self.max_dirty or redo.age_seconds() >= self.max_age_seconds:
+                        self.flush(table)
+                except Exception as e:
+                    print(f"❌ Ошибка отложенной записи {table}: {e}")
+
+    def flush(self, table):
+        """Сброс отложенных обновлений таблицы одной записью"""
+        started = time.perf_counter()
+        updates = self.db_handler.flush_write_behind(table)
+        elapsed = time.perf_counter() - started
+        if updates:
+            with self._stats_lock:
+                self.flushes += 1
+                self.coalesced_updates += updates
+                self.max_coalesced = max(self.max_coalesced, updates)
+                self.flush_seconds += elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        return updates
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "flushes": self.flushes,
+                "coalesced_updates": self.coalesced_updates,
+                "avg_coalesced": round(self.coalesced_updates / self.flushes, 2) if self.flushes else 0.0,
+                "max_coalesced": self.max_coalesced,
+                "avg_flush_ms": round(self.flush_seconds / self.flushes * 1000, 2) if self.flushes else 0.0,
+                "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+                "pending_updates": {table: len(redo.records()) for table, redo in self.db_handler.redo_logs.items()}
+            }
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Запуск сервера для эксплуатации: WSGI сервер вместо встроенного сервера Flask.
+
+gunicorn (Linux/macOS) - несколько процессов-воркеров с потоками. Приложение, каталог товаров
+и кэш MainPurch/OtherPurch загружаются один раз до fork, воркеры делят эту память
+(copy-on-write). Воркер перезапускается после --max-requests запросов (со случайным разбросом,
+чтобы воркеры не перезапускались одновременно): он дописывает начатые запросы и останавливает
+фоновые потоки, журналы остаются на диске для компактора. Отложенные обновления и журналы
+вливаются в таблицы при остановке сервера.
+waitress (Windows или без gunicorn) - один процесс с пулом потоков.
+uvicorn - ASGI вариант (asgi.py): обработчики в пулах потоков, легкие запросы в отдельном пуле.
+
+Примеры:
+    python serve.py
+    python serve.py --workers 4 --threads 8
+    PORTION_SERVER=waitress python serve.py --port 8080
+    python serve.py --server uvicorn --workers 2 --threads 8
+"""
+
+import argparse
+import os
+import sys
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Запуск сервера Порции через WSGI сервер")
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'waitress', 'uvicorn'),
+                        default=os.environ.get('PORTION_SERVER', 'auto'),
+                        help="WSGI сервер (auto - gunicorn, если он доступен, иначе waitress)")
+    parser.add_argument('--host', default=os.environ.get('PORTION_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=_env_int('PORTION_PORT', 8000))
+    parser.add_argument('--workers', type=int, default=_env_int('PORTION_WORKERS', min(4, os.cpu_count() or 1)),
+                        help="Процессов-воркеров (gunicorn, uvicorn)")
+    parser.add_argument('--threads', type=int, default=_env_int('PORTION_THREADS', 4),
+                        help="Потоков на воркер")
+    parser.add_argument('--max-requests', type=int, default=_env_int('PORTION_MAX_REQUESTS', 1000),
+                        help="Перезапуск воркера после числа запросов (0 - без перезапуска)")
+    parser.add_argument('--max-requests-jitter', type=int, default=_env_int('PORTION_MAX_REQUESTS_JITTER', 100))
+    parser.add_argument('--timeout', type=int, default=_env_int('PORTION_TIMEOUT', 60),
+                        help="Секунд на запрос до перезапуска зависшего воркера")
+    parser.add_argument('--graceful-timeout', type=int, default=_env_int('PORTION_GRACEFUL_TIMEOUT', 30),
+                        help="Секунд на завершение начатых запросов при перезапуске")
+    return parser.parse_args(argv)
+
+
+def load_app():
+    """Создание приложения (main_server) и прогрев кэша"""
+    import main_server
+    main_server.db_handler.warm_up()
+    return main_server
+
+
+def _gunicorn_available():
+    try:
+        import gunicorn  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    server = load_app()
+    db_handler = server.db_handler
+
+    def when_ready(arbiter):
+        # Мастер только управляет воркерами: его фоновые потоки останавливаются до fork
+        db_handler.prepare_fork()
+        print(f"🚀 gunicorn: {args.workers} воркеров x {args.threads} потоков на http://{args.host}:{args.port}")
+
+    def post_fork(arbiter, worker):
+        db_handler.after_fork()
+
+    def worker_exit(arbiter, worker):
+        # Перезапуск воркера не переписывает таблицы: журналы вливают компактор и flusher
+        db_handler.stop()
+
+    def on_exit(arbiter):
+        db_handler.close()
+
+    options = {
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread' if args.threads > 1 else 'sync',
+        'preload_app': True,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests_jitter if args.max_requests else 0,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'on_exit': on_exit,
+    }
+
+    class PortionApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return server.app
+
+    PortionApplication().run()
+
+
+def run_waitress(args):
+    from waitress import serve
+
+    server = load_app()
+    if args.workers > 1:
+        print("⚠️ waitress работает в одном процессе - --workers не используется")
+    print(f"🚀 waitress: {args.threads} потоков на http://{args.host}:{args.port}")
+    try:
+        serve(server.app, host=args.host, port=args.port, threads=args.threads)
+    finally:
+        server.db_handler.close()
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    # Настройки пулов читает asgi.py в каждом процессе-воркере
+    os.environ['PORTION_ASGI_THREADS'] = str(args.threads)
+    print(f"🚀 uvicorn: {args.workers} воркеров x {args.threads} потоков на http://{args.host}:{args.port}")
+    uvicorn.run('asgi:application', host=args.host, port=args.port, workers=args.workers,
+                timeout_graceful_shutdown=args.graceful_timeout,
+                limit_max_requests=args.max_requests or None)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = args.server
+    if server == 'auto':
+        server = 'gunicorn' if _gunicorn_available() else 'waitress'
+    try:
+        if server == 'gunicorn':
+            run_gunicorn(args)
+        elif server == 'uvicorn':
+            run_uvicorn(args)
+        else:
+            run_waitress(args)
+    except ImportError as e:
+        print(f"❌ WSGI сервер {server} не установлен ({e}): pip install {server}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""
+Общие настройки тестов: модули сервера импортируются из backend/src
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
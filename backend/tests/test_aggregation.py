@@ -0,0 +1,104 @@
+"""
+Инкрементальная агрегация MainPurch/OtherPurch совпадает с прежним полным groupby
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.aggregation import MAIN_PURCH_SPEC, OTHER_PURCH_SPEC, PURCHASE_SUMS
+from modules.purch_index import OwnerIndex
+
+
+def make_purchases(rows, seed):
+    """Покупки нескольких семей с повторяющимися товарами, магазинами и датами"""
+    rng = np.random.default_rng(seed)
+    user = rng.integers(0, 12, rows)
+    return pd.DataFrame({
+        'ProdID': rng.integers(1, 8, rows),
+        'Name': 'Товар',
+        'Volume': 1.0,
+        'Unit': 'шт',
+        'VolumeGr': 500.0,
+        'Tag': 'Тег',
+        'Cat': 'Категория',
+        'Store': 'Лавка',
+        'StoreID': rng.integers(1, 3, rows),
+        'Date': (1.7e9 + rng.integers(0, 5, rows) * 86400).astype(np.int64),
+        'FamilyID': user // 4,
+        'TotalCost': 99.9,
+        'UserID': user.astype(str),
+        'Count': rng.integers(1, 4, rows),
+        'TotalVolume': rng.uniform(0, 3, rows),
+        'TotalVolumeGr': rng.uniform(0, 1500, rows),
+        'TotalCostPerCount': rng.uniform(0, 300, rows)
+    })
+
+
+def legacy_groupby(df, key):
+    """Прежняя агрегация: пустые суммы - 0, пустой UserID - '', полный groupby по ключу"""
+    df = df.copy()
+    for column in PURCHASE_SUMS:
+        df[column] = df[column].fillna(0)
+    df['UserID'] = df['UserID'].fillna('')
+    agg = {column: 'sum' if column in PURCHASE_SUMS else 'min' if column == 'Date' and 'Date' not in key
+           else 'first'
+           for column in df.columns if column not in key}
+    return df.groupby(list(key)).agg(agg).reset_index()
+
+
+def normalized(df, key):
+    return df.sort_values(list(key)).reset_index(drop=True)[sorted(df.columns)]
+
+
+@pytest.mark.parametrize('spec', [MAIN_PURCH_SPEC, OTHER_PURCH_SPEC], ids=lambda spec: spec.table)
+def test_rebuild_matches_groupby(spec):
+    purchases = make_purchases(300, seed=1)
+    pd.testing.assert_frame_equal(normalized(spec.rebuild(purchases), spec.key),
+                                  normalized(legacy_groupby(purchases, spec.key), spec.key))
+
+
+@pytest.mark.parametrize('spec', [MAIN_PURCH_SPEC, OTHER_PURCH_SPEC], ids=lambda spec: spec.table)
+def test_merge_matches_groupby(spec):
+    history = make_purchases(300, seed=2)
+    table = spec.rebuild(history)
+    everything = history
+    for seed in range(3, 8):
+        # Заказ одного пользователя: часть ключей уже есть в таблице, часть новые
+        order = make_purchases(12, seed=seed)
+        order['UserID'], order['FamilyID'] = '5', 1
+        table, updated, inserted = spec.merge(table, OwnerIndex.build(table), order)
+        everything = pd.concat([everything, order], ignore_index=True)
+
+        assert updated + inserted == len(spec.collapse(order))
+        pd.testing.assert_frame_equal(normalized(table, spec.key),
+                                      normalized(legacy_groupby(everything, spec.key), spec.key),
+                                      check_dtype=False)
+
+
+def test_merge_keeps_other_rows_and_source_untouched():
+    table = MAIN_PURCH_SPEC.rebuild(make_purchases(100, seed=9))
+    before = table.copy()
+    order = table.iloc[[0]].copy()
+    order['Count'] = 2
+    order['Date'] = int(order['Date'].iloc[0]) - 86400
+
+    merged, updated, inserted = MAIN_PURCH_SPEC.merge(table, OwnerIndex.build(table), order)
+
+    assert (updated, inserted) == (1, 0)
+    pd.testing.assert_frame_equal(table, before)
+    assert merged['Count'].iloc[0] == before['Count'].iloc[0] + 2
+    assert merged['Date'].iloc[0] == order['Date'].iloc[0]
+    pd.testing.assert_frame_equal(merged.iloc[1:], before.iloc[1:])
+
+
+def test_merge_treats_missing_user_as_empty():
+    table = MAIN_PURCH_SPEC.rebuild(make_purchases(20, seed=10))
+    order = make_purchases(2, seed=11)
+    order['UserID'] = None
+    order['ProdID'] = 100
+
+    merged, updated, inserted = MAIN_PURCH_SPEC.merge(table, OwnerIndex.build(table), order)
+
+    assert updated == 0
+    assert merged['UserID'].iloc[-inserted:].tolist() == [''] * inserted
@@ -0,0 +1,61 @@
+"""
+Журнал вставок: влитые сегменты не попадают в таблицу повторно после сбоя
+"""
+
+import os
+
+from modules.append_journal import AppendJournal
+
+
+def test_fold_passes_generation_and_forgets_segments(tmp_path):
+    journal = AppendJournal(str(tmp_path / 'AllPurch.xlsx'), fsync=False)
+    journal.append([{'ProdID': 1}, {'ProdID': 2}])
+    folded = []
+
+    rows = journal.fold(lambda df, generation: folded.append((df['ProdID'].tolist(), generation)))
+
+    assert rows == 2
+    assert folded == [([1, 2], 1)]
+    assert journal.records() == []
+    assert journal.size_bytes() == 0
+
+
+def test_crash_after_commit_does_not_fold_twice(tmp_path):
+    base_path = str(tmp_path / 'AllPurch.xlsx')
+    journal = AppendJournal(base_path, fsync=False)
+    journal.append([{'ProdID': 1}])
+    generation = journal.pending_generation()
+    # Таблица и отметка о влитом поколении записаны, сегмент удалить не успели
+    journal.mark_folded(generation)
+
+    restarted = AppendJournal(base_path, fsync=False)
+
+    assert restarted.records() == []
+    assert not os.path.exists(f"{tmp_path / 'AllPurch'}.journal.{generation}.jsonl")
+    restarted.append([{'ProdID': 2}])
+    assert restarted.pending_generation() == generation + 1
+
+
+def test_crash_before_commit_keeps_segment(tmp_path):
+    base_path = str(tmp_path / 'AllPurch.xlsx')
+    journal = AppendJournal(base_path, fsync=False)
+    journal.append([{'ProdID': 1}])
+    journal.pending_generation()
+
+    restarted = AppendJournal(base_path, fsync=False)
+
+    assert restarted.records() == [{'ProdID': 1}]
+    assert restarted.age_seconds() == float('inf')
+
+
+def test_folded_generation_from_storage_engine(tmp_path):
+    base_path = str(tmp_path / 'AllPurch.xlsx')
+    marks = {}
+    journal = AppendJournal(base_path, fsync=False, folded_source=marks.get)
+    journal.append([{'ProdID': 1}])
+    generation = journal.pending_generation()
+    # Движок записал отметку в той же транзакции, что и строки таблицы
+    marks[journal.name] = generation
+
+    assert journal.records() == []
+    assert AppendJournal(base_path, fsync=False, folded_source=marks.get).records() == []
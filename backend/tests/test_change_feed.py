@@ -0,0 +1,102 @@
+"""
+Лента изменений: свертка по строке и reset, если лента не видела всех записей таблиц
+"""
+
+from modules.change_feed import ChangeFeed, UnrecordedMarker, coalesce
+
+
+def test_row_created_and_removed_in_window_is_dropped():
+    entries = [
+        (1, 'insert', 'k1', {'Count': 1}),
+        (2, 'update', 'k1', {'Count': 2}),
+        (3, 'delete', 'k1', {'Count': 2}),
+    ]
+    assert coalesce(entries) == ([], [], [])
+
+
+def test_inserted_row_returns_last_version():
+    entries = [
+        (1, 'insert', 'k1', {'Count': 1}),
+        (2, 'update', 'k1', {'Count': 3}),
+    ]
+    assert coalesce(entries) == ([{'Count': 3}], [], [])
+
+
+def test_existing_row_update_and_delete():
+    entries = [
+        (1, 'update', 'k1', {'Count': 2}),
+        (2, 'update', 'k2', {'Count': 5}),
+        (3, 'update', 'k1', {'Count': 4}),
+        (4, 'delete', 'k2', {'Count': 5}),
+    ]
+    assert coalesce(entries) == ([], [{'Count': 4}], [{'Count': 5}])
+
+
+def test_deleted_and_reinserted_row_is_update():
+    entries = [
+        (1, 'delete', 'k1', {'Count': 1}),
+        (2, 'insert', 'k1', {'Count': 7}),
+    ]
+    assert coalesce(entries) == ([], [{'Count': 7}], [])
+
+
+def test_rows_without_key_are_separate_inserts():
+    entries = [
+        (1, 'insert', None, {'ProdID': 1}),
+        (2, 'insert', None, {'ProdID': 1}),
+    ]
+    assert coalesce(entries) == ([{'ProdID': 1}, {'ProdID': 1}], [], [])
+
+
+ROW = {'UserID': 'u1', 'FamilyID': 0, 'ProdID': 1}
+
+
+def feed_path(tmp_path):
+    return str(tmp_path / 'changes.sqlite3')
+
+
+def test_start_from_zero_is_reset(tmp_path):
+    feed = ChangeFeed(feed_path(tmp_path))
+
+    first = feed.changes('allpurch', 0, 'u1')
+
+    assert first['reset']
+    assert not feed.changes('allpurch', first['seq'], 'u1')['reset']
+
+
+def test_restart_invalidates_issued_versions(tmp_path):
+    # Между запусками таблицы могли меняться без ленты (лента выключена, сбой процесса)
+    feed = ChangeFeed(feed_path(tmp_path))
+    feed.record([('allpurch', 'insert', None, ROW)])
+    seq = feed.changes('allpurch', None, 'u1')['seq']
+
+    restarted = ChangeFeed(feed_path(tmp_path))
+
+    assert restarted.changes('allpurch', seq, 'u1')['reset']
+
+
+def test_write_without_feed_forces_reset(tmp_path):
+    feed = ChangeFeed(feed_path(tmp_path))
+    marker = UnrecordedMarker(str(tmp_path / 'changes.unrecorded'))
+    feed.watch(marker)
+    feed.record([('allpurch', 'insert', None, ROW)])
+    seq = feed.changes('allpurch', None, 'u1')['seq']
+    assert not feed.changes('allpurch', seq, 'u1')['reset']
+
+    # Другой процесс записал таблицу без ленты
+    marker.touch()
+    after = feed.changes('allpurch', seq, 'u1')
+
+    assert after['reset']
+    assert not feed.changes('allpurch', after['seq'], 'u1')['reset']
+
+
+def test_recorded_changes_are_returned_after_cursor(tmp_path):
+    feed = ChangeFeed(feed_path(tmp_path))
+    seq = feed.changes('allpurch', None, 'u1')['seq']
+    feed.record([('allpurch', 'insert', None, ROW), ('allpurch', 'insert', None, dict(ROW, UserID='u2'))])
+
+    result = feed.changes('allpurch', seq, 'u1')
+
+    assert not result['reset']
+    assert result['inserted'] == [ROW]
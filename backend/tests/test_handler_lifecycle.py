@@ -0,0 +1,38 @@
+"""
+Остановка процесса: перезапуск воркера не вливает журналы, остановка сервера - вливает
+"""
+
+import contextlib
+import io
+
+import pandas as pd
+
+from modules.database_handler import DatabaseHandler
+
+
+def make_handler(root):
+    for name in ('orders', 'users', 'products'):
+        (root / name).mkdir(exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DatabaseHandler(str(root / 'orders'), str(root / 'users'), str(root / 'products'),
+                               storage_engine='parquet', journal=True,
+                               journal_options={'max_bytes': 10 ** 9, 'max_age_seconds': 10 ** 9})
+
+
+def test_stop_keeps_journal_and_close_folds_it(tmp_path):
+    db_handler = make_handler(tmp_path)
+    db_handler.write_table('rationinfo', pd.DataFrame({'ProdID': [1], 'UserID': ['u1']}))
+    db_handler.append_table('rationinfo', pd.DataFrame({'ProdID': [2], 'UserID': ['u1']}))
+    journal = db_handler.journals['rationinfo']
+
+    db_handler.stop()
+    assert len(journal.records()) == 1
+    assert len(db_handler.storage.read('rationinfo')) == 1
+
+    # Другой процесс продолжает писать и видит строки журнала
+    worker = make_handler(tmp_path)
+    assert len(worker.read_table('rationinfo')) == 2
+
+    worker.close()
+    assert journal.records() == []
+    assert len(db_handler.storage.read('rationinfo')) == 2
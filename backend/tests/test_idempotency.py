@@ -0,0 +1,113 @@
+"""
+Декоратор идемпотентности: какие ответы сохраняются и повторяются
+"""
+
+import hashlib
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+from modules.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyStore, idempotent
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IdempotencyStore(str(tmp_path / 'idempotency.sqlite'))
+
+
+@pytest.fixture
+def app(store):
+    app = Flask(__name__)
+    app.calls = 0
+    app.status = 200
+
+    @app.route('/create_order', methods=['POST'])
+    @idempotent(store, 'create_order')
+    def create_order():
+        app.calls += 1
+        return jsonify({"status": "success" if app.status < 400 else "error", "call": app.calls}), app.status
+
+    return app
+
+
+def post(client, body, key='key-1'):
+    return client.post('/create_order', data=json.dumps(body), content_type='application/json',
+                       headers={IDEMPOTENCY_HEADER: key})
+
+
+@pytest.mark.parametrize('status', [200, 400])
+def test_final_answers_are_replayed(app, status):
+    app.status = status
+    client = app.test_client()
+
+    first = post(client, {'user_id': 'u1'})
+    second = post(client, {'user_id': 'u1'})
+
+    assert first.status_code == second.status_code == status
+    assert second.get_json() == first.get_json()
+    assert REPLAYED_HEADER not in first.headers
+    assert second.headers[REPLAYED_HEADER] == 'true'
+    assert app.calls == 1
+
+
+def test_server_error_is_not_cached(app):
+    app.status = 500
+    client = app.test_client()
+
+    assert post(client, {'user_id': 'u1'}).status_code == 500
+    app.status = 200
+    retry = post(client, {'user_id': 'u1'})
+
+    assert retry.status_code == 200
+    assert REPLAYED_HEADER not in retry.headers
+    assert app.calls == 2
+
+
+def test_exception_releases_key(store):
+    app = Flask(__name__)
+    calls = []
+
+    @app.route('/create_order', methods=['POST'])
+    @idempotent(store, 'create_order')
+    def create_order():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('storage is down')
+        return jsonify({"status": "success"})
+
+    client = app.test_client()
+    assert post(client, {'user_id': 'u1'}).status_code == 500
+    assert post(client, {'user_id': 'u1'}).status_code == 200
+    assert len(calls) == 2
+
+
+def test_request_in_progress_gets_409(app, store):
+    body = json.dumps({'user_id': 'u1'}).encode()
+    store.begin('create_order:u1:key-1', hashlib.sha256(body).hexdigest())
+
+    response = post(app.test_client(), {'user_id': 'u1'})
+
+    assert response.status_code == 409
+    assert app.calls == 0
+
+
+def test_same_key_with_other_body_gets_422(app):
+    client = app.test_client()
+    post(client, {'user_id': 'u1', 'items': [1]})
+
+    response = post(client, {'user_id': 'u1', 'items': [2]})
+
+    assert response.status_code == 422
+    assert app.calls == 1
+
+
+def test_keys_are_scoped_by_user_and_requests_without_key_run(app):
+    client = app.test_client()
+    post(client, {'user_id': 'u1'})
+    other_user = post(client, {'user_id': 'u2'})
+    no_key = client.post('/create_order', json={'user_id': 'u1'})
+
+    assert REPLAYED_HEADER not in other_user.headers
+    assert REPLAYED_HEADER not in no_key.headers
+    assert app.calls == 3
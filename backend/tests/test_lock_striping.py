@@ -0,0 +1,95 @@
+"""
+Полосы блокировок: заказы разных владельцев и перезапись таблицы целиком не теряют изменений
+"""
+
+import contextlib
+import io
+import multiprocessing
+
+import pandas as pd
+import pytest
+
+from modules.database_handler import DatabaseHandler
+from modules.lock_striping import StripedLocks, owner_key
+
+ROUNDS = 25
+OWNERS = [('u1', 0), ('u2', 7)]
+
+
+def make_handler(root):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DatabaseHandler(str(root / 'orders'), str(root / 'users'), str(root / 'products'),
+                               storage_engine='sqlite', lock_stripes=8)
+
+
+def owner_orders(root, owner):
+    """Заказы владельца: счетчик его строки увеличивается в transaction(owner=...)"""
+    db_handler = make_handler(root)
+    for _ in range(ROUNDS):
+        with db_handler.transaction(['mainpurch'], owner=owner):
+            df, _ = db_handler.read_indexed('mainpurch')
+            df = df.copy()
+            df['Count'] = df['Count'] + 1
+            db_handler.write_table('mainpurch', df)
+    db_handler.stop()
+
+
+def whole_table_writes(root):
+    """Перезапись таблицы целиком (как чистка): счетчик строки u3 увеличивается"""
+    db_handler = make_handler(root)
+
+    def bump():
+        df, _ = db_handler.read_indexed('mainpurch')
+        df = df.copy()
+        df.loc[df['UserID'] == 'u3', 'Count'] += 1
+        db_handler.write_table('mainpurch', df)
+
+    for _ in range(ROUNDS):
+        db_handler.mutate('mainpurch', bump)
+    db_handler.stop()
+
+
+def test_owners_use_different_stripes():
+    stripes = StripedLocks({}, [], stripes=8)
+    assert len({stripes.stripe_index(owner_key(*owner)) for owner in OWNERS}) == 2
+
+
+def test_concurrent_owner_and_table_writes_lose_nothing(tmp_path):
+    for name in ('orders', 'users', 'products'):
+        (tmp_path / name).mkdir()
+    db_handler = make_handler(tmp_path)
+    db_handler.write_table('mainpurch', pd.DataFrame({
+        'ProdID': [1, 1, 1],
+        'UserID': ['u1', 'u2', 'u3'],
+        'FamilyID': [0, 7, 0],
+        'Count': [0, 0, 0],
+    }))
+    db_handler.stop()
+
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=owner_orders, args=(tmp_path, owner)) for owner in OWNERS]
+    processes.append(context.Process(target=whole_table_writes, args=(tmp_path,)))
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    df = make_handler(tmp_path).read_table('mainpurch')
+    assert dict(zip(df['UserID'], df['Count'])) == {'u1': ROUNDS, 'u2': ROUNDS, 'u3': ROUNDS}
+
+
+@pytest.mark.parametrize('owner', OWNERS)
+def test_owner_transaction_reads_only_owner_rows(tmp_path, owner):
+    for name in ('orders', 'users', 'products'):
+        (tmp_path / name).mkdir()
+    db_handler = make_handler(tmp_path)
+    db_handler.write_table('mainpurch', pd.DataFrame({
+        'ProdID': [1, 2, 3], 'UserID': ['u1', 'u2', 'u3'], 'FamilyID': [0, 7, 0], 'Count': [1, 1, 1],
+    }))
+
+    with db_handler.transaction(['mainpurch'], owner=owner):
+        df, _ = db_handler.read_indexed('mainpurch')
+
+    assert df['UserID'].tolist() == [owner[0]]
+    db_handler.stop()
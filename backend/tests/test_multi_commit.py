@@ -0,0 +1,96 @@
+"""
+Восстановление общего коммита после сбоя: доведение по маркеру и откат без маркера
+"""
+
+import json
+import os
+
+from modules.multi_commit import CommitLog
+from modules.storage_engines import staging_path
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def stage(tmp_path, token, tables):
+    """Временные файлы таблиц: [(временный файл, файл таблицы)]"""
+    renames = []
+    for name, text in tables.items():
+        filepath = str(tmp_path / name)
+        write(filepath, 'old')
+        tmp_file = staging_path(filepath, token)
+        write(tmp_file, text)
+        renames.append((tmp_file, filepath))
+    return renames
+
+
+def test_commit_publishes_all_files(tmp_path):
+    log = CommitLog(str(tmp_path / 'commits'))
+    renames = stage(tmp_path, 'tok1', {'MainPurch.xlsx': 'main', 'AllPurch.xlsx': 'all'})
+
+    log.commit('tok1', renames)
+
+    assert read(str(tmp_path / 'MainPurch.xlsx')) == 'main'
+    assert read(str(tmp_path / 'AllPurch.xlsx')) == 'all'
+    assert os.listdir(str(tmp_path / 'commits')) == []
+    assert log.stats()['commits'] == 1
+
+
+def test_recover_rolls_forward_committed_marker(tmp_path):
+    commits = tmp_path / 'commits'
+    commits.mkdir()
+    log = CommitLog(str(commits))
+    renames = stage(tmp_path, 'tok2', {'MainPurch.xlsx': 'main', 'AllPurch.xlsx': 'all'})
+    # Сбой после записи маркера: первый файл уже опубликован, второй нет
+    write(str(commits / 'tok2.commit'), json.dumps({"renames": renames}))
+    os.replace(*renames[0])
+
+    log.recover([str(tmp_path)])
+
+    assert read(str(tmp_path / 'MainPurch.xlsx')) == 'main'
+    assert read(str(tmp_path / 'AllPurch.xlsx')) == 'all'
+    assert not any(os.path.exists(tmp_file) for tmp_file, _ in renames)
+    assert os.listdir(str(commits)) == []
+    assert log.stats()['recovered_forward'] == 1
+
+
+def test_recover_rolls_back_files_without_marker(tmp_path):
+    commits = tmp_path / 'commits'
+    commits.mkdir()
+    log = CommitLog(str(commits))
+    renames = stage(tmp_path, 'tok3', {'MainPurch.xlsx': 'main', 'AllPurch.xlsx': 'all'})
+    # Сбой во время записи маркера: недописанный маркер не считается коммитом
+    write(str(commits / 'tok3.commit.tmp'), '{"renames": [')
+
+    log.recover([str(tmp_path)])
+
+    assert read(str(tmp_path / 'MainPurch.xlsx')) == 'old'
+    assert read(str(tmp_path / 'AllPurch.xlsx')) == 'old'
+    assert not any(os.path.exists(tmp_file) for tmp_file, _ in renames)
+    assert os.listdir(str(commits)) == []
+    assert log.stats()['recovered_back'] == 2
+
+
+def test_stage_discards_written_files_on_error(tmp_path):
+    log = CommitLog(str(tmp_path / 'commits'))
+    prepared = stage(tmp_path, 'tok4', {'MainPurch.xlsx': 'main'})
+
+    def failing():
+        raise OSError('disk full')
+
+    try:
+        log.stage([lambda: prepared, failing])
+    except OSError:
+        pass
+    else:
+        raise AssertionError('ошибка подготовки должна пробрасываться')
+
+    assert not os.path.exists(prepared[0][0])
+    assert read(str(tmp_path / 'MainPurch.xlsx')) == 'old'
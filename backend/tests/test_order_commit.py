@@ -0,0 +1,115 @@
+"""
+Общий коммит заказа: MainPurch и строки AllPurch (в том числе через журнал) публикуются вместе
+"""
+
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from modules import multi_commit
+from modules.database_handler import DatabaseHandler
+from modules.multi_commit import CommitLog
+from modules.storage_engines import SQLiteStorageEngine
+
+
+def reopen(root, engine):
+    for name in ('orders', 'users', 'products'):
+        (root / name).mkdir(exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DatabaseHandler(str(root / 'orders'), str(root / 'users'), str(root / 'products'),
+                               storage_engine=engine, journal=True,
+                               journal_options={'max_bytes': 10 ** 9, 'max_age_seconds': 10 ** 9})
+
+
+def make_handler(root, engine):
+    db_handler = reopen(root, engine)
+    db_handler.write_table('mainpurch', pd.DataFrame({'ProdID': [1], 'UserID': ['u1'], 'FamilyID': [0], 'Count': [1]}))
+    db_handler.write_table('allpurch', pd.DataFrame({'ProdID': [1], 'UserID': ['u1'], 'Date': [1769720400]}))
+    return db_handler
+
+
+def stop(db_handler):
+    db_handler.compactor.stop(wait=True)
+    db_handler.writer.stop()
+
+
+def order(db_handler):
+    with db_handler.transaction(['mainpurch', 'allpurch']):
+        df, _ = db_handler.read_indexed('mainpurch')
+        df = df.copy()
+        df['Count'] = df['Count'] + 1
+        db_handler.write_table('mainpurch', df)
+        db_handler.append_table('allpurch', pd.DataFrame({'ProdID': [1], 'UserID': ['u1'], 'Date': [1769806800]}))
+
+
+def state(db_handler):
+    return int(db_handler.read_table('mainpurch')['Count'].iloc[0]), len(db_handler.read_table('allpurch'))
+
+
+@pytest.mark.parametrize('engine', ['parquet', 'sqlite'])
+def test_order_publishes_main_and_journal_rows(tmp_path, engine):
+    db_handler = make_handler(tmp_path, engine)
+    order(db_handler)
+    assert state(db_handler) == (2, 2)
+    stop(db_handler)
+
+    restarted = reopen(tmp_path, engine)
+    assert state(restarted) == (2, 2)
+    restarted.compact_journal('allpurch')
+    assert state(restarted) == (2, 2)
+    stop(restarted)
+
+
+def test_crash_before_marker_drops_journal_rows(tmp_path, monkeypatch):
+    db_handler = make_handler(tmp_path, 'parquet')
+
+    def crash(self, token, renames):
+        raise OSError('crash before commit marker')
+
+    monkeypatch.setattr(CommitLog, 'commit', crash)
+    with pytest.raises(OSError):
+        order(db_handler)
+    monkeypatch.undo()
+    stop(db_handler)
+
+    restarted = reopen(tmp_path, 'parquet')
+    assert state(restarted) == (1, 1)
+    stop(restarted)
+
+
+def test_crash_after_marker_publishes_journal_rows(tmp_path, monkeypatch):
+    db_handler = make_handler(tmp_path, 'parquet')
+
+    def crash(renames):
+        raise OSError('crash after commit marker')
+
+    monkeypatch.setattr(multi_commit, 'publish', crash)
+    with pytest.raises(OSError):
+        order(db_handler)
+    monkeypatch.undo()
+    stop(db_handler)
+
+    restarted = reopen(tmp_path, 'parquet')
+    assert state(restarted) == (2, 2)
+    stop(restarted)
+
+
+def test_sqlite_failure_rolls_back_journal_table_rows(tmp_path, monkeypatch):
+    db_handler = make_handler(tmp_path, 'sqlite')
+    insert = SQLiteStorageEngine._insert
+
+    def failing(self, conn, table, df):
+        if table == 'allpurch':
+            raise OSError('disk full')
+        return insert(self, conn, table, df)
+
+    monkeypatch.setattr(SQLiteStorageEngine, '_insert', failing)
+    with pytest.raises(OSError):
+        order(db_handler)
+    monkeypatch.undo()
+
+    assert state(db_handler) == (1, 1)
+    assert db_handler.journals['allpurch'].records() == []
+    stop(db_handler)
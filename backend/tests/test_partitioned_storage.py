@@ -0,0 +1,80 @@
+"""
+Раскладка существующей таблицы по месяцам: после сбоя партиций либо нет, либо есть все
+"""
+
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from modules import multi_commit
+from modules.multi_commit import CommitLog
+from modules.partitioned_storage import MonthPartitionedEngine
+from modules.storage_engines import create_storage_engine
+
+MONTHS = ['2026-01', '2026-02', '2026-03']
+
+
+def history():
+    dates = [datetime.strptime(f"{month}-15", '%Y-%m-%d').timestamp() for month in MONTHS]
+    return pd.DataFrame({'ProdID': [1, 2, 3], 'UserID': ['u1', 'u1', 'u2'], 'Date': dates})
+
+
+def make_inner(tmp_path, engine):
+    table_paths = {'allpurch': str(tmp_path / 'orders' / 'allpurch.xlsx')}
+    os.makedirs(str(tmp_path / 'orders'), exist_ok=True)
+    return create_storage_engine(engine, table_paths, sqlite_path=str(tmp_path / 'portion.sqlite3'))
+
+
+def partitioned(tmp_path, engine):
+    return MonthPartitionedEngine(make_inner(tmp_path, engine), partition_columns={'allpurch': 'Date'},
+                                  commit_log=CommitLog(str(tmp_path / 'commits')))
+
+
+@pytest.mark.parametrize('engine', ['parquet', 'sqlite'])
+def test_migration_splits_table_by_month(tmp_path, engine):
+    make_inner(tmp_path, engine).write('allpurch', history())
+
+    storage = partitioned(tmp_path, engine)
+
+    assert storage.partitions('allpurch') == [f"allpurch/{month}" for month in MONTHS]
+    pd.testing.assert_frame_equal(storage.read('allpurch'), history(), check_dtype=False)
+
+
+def test_crash_before_commit_reruns_migration(tmp_path, monkeypatch):
+    make_inner(tmp_path, 'parquet').write('allpurch', history())
+
+    def crash(self, token, renames):
+        raise OSError('crash before commit marker')
+
+    monkeypatch.setattr(CommitLog, 'commit', crash)
+    with pytest.raises(OSError):
+        partitioned(tmp_path, 'parquet')
+    monkeypatch.undo()
+    assert not make_inner(tmp_path, 'parquet').list_tables('allpurch', str(tmp_path / 'orders' / 'allpurch'))
+
+    CommitLog(str(tmp_path / 'commits')).recover([str(tmp_path / 'orders' / 'allpurch')])
+    storage = partitioned(tmp_path, 'parquet')
+
+    assert len(storage.partitions('allpurch')) == len(MONTHS)
+    assert len(storage.read('allpurch')) == len(history())
+
+
+def test_crash_during_publish_is_rolled_forward(tmp_path, monkeypatch):
+    make_inner(tmp_path, 'parquet').write('allpurch', history())
+
+    def publish_first(renames):
+        os.replace(*renames[0])
+        raise OSError('crash after first partition')
+
+    monkeypatch.setattr(multi_commit, 'publish', publish_first)
+    with pytest.raises(OSError):
+        partitioned(tmp_path, 'parquet')
+    monkeypatch.undo()
+
+    CommitLog(str(tmp_path / 'commits')).recover([str(tmp_path / 'orders' / 'allpurch')])
+    storage = partitioned(tmp_path, 'parquet')
+
+    assert len(storage.partitions('allpurch')) == len(MONTHS)
+    pd.testing.assert_frame_equal(storage.read('allpurch'), history(), check_dtype=False)
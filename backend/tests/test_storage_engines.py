@@ -0,0 +1,155 @@
+"""
+Движки хранения: запись, чтение, вставка, замена строк владельца и выборка диапазона
+"""
+
+import threading
+
+import pandas as pd
+import pytest
+
+from modules.storage_engines import ROWID_COLUMN, SQLiteStorageEngine, create_storage_engine
+
+ENGINES = ['excel', 'sqlite', 'parquet', 'arrow']
+
+U1 = {'UserID': 'u1', 'FamilyID': 0}
+
+
+def make_engine(tmp_path, name):
+    table_paths = {'mainpurch': str(tmp_path / 'mainpurch.xlsx'), 'allpurch': str(tmp_path / 'allpurch.xlsx')}
+    return create_storage_engine(name, table_paths, sqlite_path=str(tmp_path / 'portion.sqlite3'))
+
+
+def purchases():
+    return pd.DataFrame({
+        'ProdID': [1, 2, 1, 3, 2],
+        'UserID': ['u1', 'u2', 'u3', 'u1', 'u2'],
+        'FamilyID': [0, 0, 7, 0, 0],
+        'Count': [1, 2, 3, 4, 5],
+        'TotalVolumeGr': [100.0, 200.0, 300.0, 400.0, 500.0],
+    })
+
+
+@pytest.fixture(params=ENGINES)
+def engine(request, tmp_path):
+    return make_engine(tmp_path, request.param)
+
+
+def test_write_read_append_round_trip(engine):
+    assert not engine.exists('mainpurch')
+    assert engine.signature('mainpurch') is None
+
+    engine.write('mainpurch', purchases())
+    first = engine.signature('mainpurch')
+    pd.testing.assert_frame_equal(engine.read('mainpurch'), purchases(), check_dtype=False)
+    assert list(engine.read('mainpurch', ['ProdID', 'Count']).columns) == ['ProdID', 'Count']
+
+    engine.append('mainpurch', purchases().iloc[:2])
+    assert len(engine.read('mainpurch')) == 7
+    assert engine.signature('mainpurch') != first
+
+
+def test_sync_replaces_only_owner_rows(engine):
+    engine.write('mainpurch', purchases())
+
+    rows = engine.select_rows('mainpurch', U1)
+    assert rows['ProdID'].tolist() == [1, 3]
+    assert ROWID_COLUMN in rows.columns
+
+    # Первая строка владельца обновлена, вторая удалена, одна добавлена
+    rows = rows.iloc[[0]].copy()
+    rows['Count'] = 10
+    added = pd.DataFrame({'ProdID': [9], 'UserID': ['u1'], 'FamilyID': [0], 'Count': [1], 'TotalVolumeGr': [50.0]})
+    engine.apply_row_changes([('sync', 'mainpurch', U1, pd.concat([rows, added], ignore_index=True))])
+
+    result = engine.read('mainpurch')
+    assert ROWID_COLUMN not in result.columns
+    others = result[result['UserID'] != 'u1'].reset_index(drop=True)
+    expected_others = purchases()[purchases()['UserID'] != 'u1'].reset_index(drop=True)
+    pd.testing.assert_frame_equal(others, expected_others, check_dtype=False)
+    owner = result[result['UserID'] == 'u1']
+    assert owner[['ProdID', 'Count']].values.tolist() == [[1, 10], [9, 1]]
+    # Порядок строк таблицы сохраняется: обновленная строка на своем месте
+    assert result['ProdID'].tolist()[:3] == [1, 2, 1]
+
+
+def test_sync_into_missing_table_inserts_rows(engine):
+    engine.apply_row_changes([('sync', 'mainpurch', U1, purchases().iloc[[0]])])
+
+    assert engine.read('mainpurch')['ProdID'].tolist() == [1]
+
+
+def test_apply_row_changes_several_tables(engine):
+    engine.write('mainpurch', purchases())
+    history = pd.DataFrame({'ProdID': [1], 'UserID': ['u1'], 'Date': [1769720400]})
+
+    engine.apply_row_changes([('append', 'allpurch', history), ('write', 'mainpurch', purchases().iloc[:1])])
+
+    assert len(engine.read('mainpurch')) == 1
+    assert engine.read('allpurch')['ProdID'].tolist() == [1]
+
+    engine.apply_row_changes([('drop', 'allpurch')])
+    assert not engine.exists('allpurch')
+
+
+def test_scan_range_skips_empty_and_out_of_range_dates(engine):
+    engine.write('allpurch', pd.DataFrame({
+        'ProdID': [1, 2, 3, 4, 5],
+        'Date': [1769720400, '', 1769806800, 1769893200, None],
+    }))
+
+    rows = engine.scan_range('allpurch', 'Date', 1769720400, 1769806800, columns=['ProdID'])
+    assert sorted(rows['ProdID'].tolist()) == [1, 3]
+
+    rows = engine.scan_range('allpurch', 'Date', 1769720400, 1769806800, inclusive='left')
+    assert rows['ProdID'].tolist() == [1]
+
+
+def test_file_engines_reject_marks(tmp_path):
+    engine = make_engine(tmp_path, 'parquet')
+    assert not engine.supports_marks
+
+    with pytest.raises(ValueError):
+        engine.apply_row_changes([('write', 'mainpurch', purchases())], marks={'allpurch.journal': 1})
+
+
+def test_sqlite_changes_and_marks_commit_together(tmp_path, monkeypatch):
+    engine = make_engine(tmp_path, 'sqlite')
+    engine.write('mainpurch', purchases())
+    engine.apply_row_changes([('append', 'allpurch', purchases().iloc[:1])], marks={'allpurch.journal': 3})
+    assert engine.read_mark('allpurch.journal') == 3
+
+    insert = SQLiteStorageEngine._insert
+
+    def failing(self, conn, table, df):
+        if table == 'allpurch':
+            raise OSError('disk full')
+        return insert(self, conn, table, df)
+
+    monkeypatch.setattr(SQLiteStorageEngine, '_insert', failing)
+    with pytest.raises(OSError):
+        engine.apply_row_changes([('write', 'mainpurch', purchases().iloc[:1]),
+                                  ('append', 'allpurch', purchases().iloc[:1])],
+                                 marks={'allpurch.journal': 4})
+
+    assert len(engine.read('mainpurch')) == len(purchases())
+    assert len(engine.read('allpurch')) == 1
+    assert engine.read_mark('allpurch.journal') == 3
+
+
+def test_sqlite_connection_per_thread(tmp_path):
+    engine = make_engine(tmp_path, 'sqlite')
+    engine.write('mainpurch', purchases())
+    connections = []
+
+    def read():
+        connections.append(engine._connect())
+        assert len(engine.read('mainpurch')) == len(purchases())
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(conn) for conn in connections}) == 3
+    assert engine._connect() is engine._connect()
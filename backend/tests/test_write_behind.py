@@ -0,0 +1,109 @@
+"""
+Отложенная запись: журнал повтора виден другим процессам и повторяется после сбоя ровно один раз
+"""
+
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from modules.append_journal import AppendJournal
+from modules.database_handler import DatabaseHandler
+from modules.dataframe_cache import get_dataframe_cache
+
+
+def make_handler(root, engine, write_behind=True):
+    for name in ('orders', 'users', 'products'):
+        (root / name).mkdir(exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DatabaseHandler(str(root / 'orders'), str(root / 'users'), str(root / 'products'),
+                               storage_engine=engine, write_behind=write_behind,
+                               write_behind_options={'max_dirty': 10 ** 6, 'max_age_seconds': 10 ** 6})
+
+
+def criteria(prod_id, user_id='u1'):
+    return {'UserID': user_id, 'FamilyID': 0, 'ProdID': prod_id}
+
+
+def with_updates(root, engine):
+    """Обновления, оставшиеся только в журнале повтора (таблица не перезаписана)"""
+    db_handler = make_handler(root, engine)
+    db_handler.write_table('mainpurch', pd.DataFrame({
+        'ProdID': [1, 2, 3, 1],
+        'UserID': ['u1', 'u1', 'u1', 'u2'],
+        'FamilyID': [0, 0, 0, 0],
+        'TotalVolume': [1.0, 1.0, 1.0, 1.0],
+        'TotalVolumeGr': [500.0, 500.0, 500.0, 500.0],
+    }))
+    assert db_handler.update_purchase('mainpurch', criteria(1), 250, 0.5) == 'updated'
+    assert db_handler.update_purchase('mainpurch', criteria(2), 0, 0) == 'deleted'
+    assert db_handler.update_purchase('mainpurch', criteria(1), 100, 0.2) == 'updated'
+    assert db_handler.update_purchase('mainpurch', criteria(9), 100, 0.2) is None
+    expected = normalized(db_handler.read_table('mainpurch'))
+    db_handler.stop()
+    return db_handler, expected
+
+
+def normalized(df):
+    return df.sort_values(['UserID', 'ProdID']).reset_index(drop=True)[sorted(df.columns)]
+
+
+@pytest.fixture(params=['parquet', 'sqlite'])
+def engine(request):
+    return request.param
+
+
+def test_updates_visible_in_memory_before_flush(tmp_path, engine):
+    db_handler, expected = with_updates(tmp_path, engine)
+
+    assert expected['ProdID'].tolist() == [1, 3, 1]
+    assert expected['TotalVolumeGr'].tolist() == [100.0, 500.0, 500.0]
+    # Таблица в хранилище еще прежняя - обновления только в журнале повтора
+    assert len(db_handler.storage.read('mainpurch')) == 4
+
+
+def test_other_process_sees_redo_log(tmp_path, engine):
+    _, expected = with_updates(tmp_path, engine)
+    # Другой процесс не видит кэш этого: таблица и журнал читаются с диска
+    get_dataframe_cache().clear()
+
+    other = make_handler(tmp_path, engine)
+
+    pd.testing.assert_frame_equal(normalized(other.read_table('mainpurch')), expected, check_dtype=False)
+    other.stop()
+
+
+def test_restart_replays_redo_log_once(tmp_path, engine):
+    _, expected = with_updates(tmp_path, engine)
+    get_dataframe_cache().clear()
+
+    # Запуск без отложенной записи сразу вливает журнал повтора в таблицу
+    restarted = make_handler(tmp_path, engine, write_behind=False)
+    pd.testing.assert_frame_equal(normalized(restarted.storage.read('mainpurch')), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(normalized(restarted.read_table('mainpurch')), expected, check_dtype=False)
+    restarted.stop()
+
+    again = make_handler(tmp_path, engine)
+    assert again.redo_logs['mainpurch'].records() == []
+    pd.testing.assert_frame_equal(normalized(again.read_table('mainpurch')), expected, check_dtype=False)
+    again.stop()
+
+
+def test_crash_after_flush_commit_does_not_replay(tmp_path, engine, monkeypatch):
+    db_handler, expected = with_updates(tmp_path, engine)
+
+    def crash(self, generation):
+        raise OSError('crash before redo segments are removed')
+
+    monkeypatch.setattr(AppendJournal, 'forget', crash)
+    with pytest.raises(OSError):
+        db_handler.flush_write_behind('mainpurch')
+    monkeypatch.undo()
+    db_handler.stop()
+    get_dataframe_cache().clear()
+
+    restarted = make_handler(tmp_path, engine)
+    assert restarted.redo_logs['mainpurch'].records() == []
+    pd.testing.assert_frame_equal(normalized(restarted.storage.read('mainpurch')), expected, check_dtype=False)
+    restarted.stop()